@@ -2,7 +2,8 @@
 Custom Error Handling Library for MyPOS
 """
 
-from .error_handler import ErrorHandler, POSError
+from .error_handler import ErrorHandler, POSError, retry_aws
+from .log import configure_logging
 
-__all__ = ['ErrorHandler', 'POSError']
+__all__ = ['ErrorHandler', 'POSError', 'retry_aws', 'configure_logging']
 
@@ -3,15 +3,44 @@ Custom Error Handling Library for MyPOS
 Simple error handling for AWS services and POS operations
 """
 
+import functools
 import logging
+import random
+import time
 from datetime import datetime
 from typing import Optional, Dict, Any
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+    NoCredentialsError, PartialCredentialsError, ReadTimeoutError
+)
+
+# Output is set up by configure_logging() (error_handler/log.py), not on import
 logger = logging.getLogger(__name__)
 
 
+# botocore error codes by category
+THROTTLE_CODES = {
+    'ProvisionedThroughputExceededException', 'ThrottlingException', 'Throttling', 'ThrottledException',
+    'RequestLimitExceeded', 'RequestThrottled', 'RequestThrottledException', 'TooManyRequestsException',
+    'SlowDown', 'BandwidthLimitExceeded', 'TransactionInProgressException'
+}
+UNAVAILABLE_CODES = {
+    'InternalServerError', 'InternalFailure', 'InternalError', 'ServiceUnavailable', 'ServiceUnavailableException',
+    'RequestTimeout', 'RequestTimeoutException', 'PriorRequestNotComplete', '500', '502', '503', '504'
+}
+CREDENTIALS_CODES = {
+    'ExpiredToken', 'ExpiredTokenException', 'InvalidClientTokenId', 'UnrecognizedClientException',
+    'InvalidAccessKeyId', 'SignatureDoesNotMatch', 'MissingAuthenticationToken'
+}
+NOT_FOUND_CODES = {'ResourceNotFoundException', 'NoSuchBucket', 'NoSuchKey', 'NotFound', '404'}
+ACCESS_DENIED_CODES = {'AccessDenied', 'AccessDeniedException', 'AuthorizationError', 'Forbidden', '403'}
+CONNECTION_ERRORS = (EndpointConnectionError, ConnectTimeoutError, ReadTimeoutError, ConnectionClosedError)
+
+# Error types worth trying again after a pause
+RETRYABLE_ERROR_TYPES = {'AWS_THROTTLED', 'AWS_UNAVAILABLE'}
+
+
 class POSError(Exception):
     """Custom exception for POS operations"""
     
@@ -19,9 +48,19 @@ class POSError(Exception):
         self.message = message
         self.error_type = error_type
         self.details = details or {}
-        self.timestamp = datetime.now().isoformat()
+        self.created = time.time()
         super().__init__(self.message)
     
+    @property
+    def timestamp(self):
+        """When the error was raised, formatted only when someone asks"""
+        return datetime.fromtimestamp(self.created).isoformat()
+    
+    @property
+    def retryable(self):
+        """True for throttling and transient service errors"""
+        return self.error_type in RETRYABLE_ERROR_TYPES
+    
     def __str__(self):
         return f"[{self.error_type}] {self.message} at {self.timestamp}"
 
@@ -29,6 +68,49 @@ class POSError(Exception):
 class ErrorHandler:
     """Simple error handler for AWS services and POS operations"""
     
+    # Fraction of log_success records written (POS_LOG_SUCCESS_SAMPLE_RATE)
+    success_sample_rate = 1.0
+    
+    @staticmethod
+    def classify_aws_error(error: Exception):
+        """
+        (error_type, code) of an exception from boto3.
+        
+        ClientErrors are classified on response['Error']['Code'], other
+        exceptions on their type, and anything else on its message.
+        """
+        if isinstance(error, POSError):
+            return error.error_type, error.details.get("code", "")
+        
+        if isinstance(error, ClientError):
+            code = error.response.get('Error', {}).get('Code', '')
+            if code in THROTTLE_CODES:
+                return "AWS_THROTTLED", code
+            if code in UNAVAILABLE_CODES:
+                return "AWS_UNAVAILABLE", code
+            if code in CREDENTIALS_CODES:
+                return "AWS_CREDENTIALS_ERROR", code
+            if code in NOT_FOUND_CODES:
+                return "AWS_RESOURCE_NOT_FOUND", code
+            if code in ACCESS_DENIED_CODES:
+                return "AWS_ACCESS_DENIED", code
+            return "AWS_ERROR", code
+        
+        if isinstance(error, (NoCredentialsError, PartialCredentialsError)):
+            return "AWS_CREDENTIALS_ERROR", type(error).__name__
+        if isinstance(error, CONNECTION_ERRORS):
+            return "AWS_UNAVAILABLE", type(error).__name__
+        
+        # Plain exceptions raised by our own code
+        error_message = str(error)
+        if "NoCredentialsError" in error_message or "Credentials" in error_message:
+            return "AWS_CREDENTIALS_ERROR", ""
+        if "ResourceNotFoundException" in error_message or "does not exist" in error_message:
+            return "AWS_RESOURCE_NOT_FOUND", ""
+        if "AccessDenied" in error_message or "Forbidden" in error_message:
+            return "AWS_ACCESS_DENIED", ""
+        return "AWS_ERROR", ""
+    
     @staticmethod
     def handle_aws_error(error: Exception, operation: str, resource: str = "") -> POSError:
         """
@@ -40,32 +122,38 @@ class ErrorHandler:
             resource: Which resource was involved
             
         Returns:
-            POSError: Custom error with details
+            POSError: Custom error with details (a POSError is returned as is)
         """
+        if isinstance(error, POSError):
+            return error
+        
         error_message = str(error)
-        error_type = "AWS_ERROR"
+        error_type, code = ErrorHandler.classify_aws_error(error)
         
-        # Determine error type based on error message
-        if "NoCredentialsError" in error_message or "Credentials" in error_message:
-            error_type = "AWS_CREDENTIALS_ERROR"
+        if error_type == "AWS_CREDENTIALS_ERROR":
             message = f"AWS credentials not found. Please check your AWS Academy credentials."
-        elif "ResourceNotFoundException" in error_message or "does not exist" in error_message:
-            error_type = "AWS_RESOURCE_NOT_FOUND"
+        elif error_type == "AWS_RESOURCE_NOT_FOUND":
             message = f"AWS resource not found: {resource}"
-        elif "AccessDenied" in error_message or "Forbidden" in error_message:
-            error_type = "AWS_ACCESS_DENIED"
+        elif error_type == "AWS_ACCESS_DENIED":
             message = f"Access denied to AWS resource: {resource}"
+        elif error_type == "AWS_THROTTLED":
+            message = f"AWS is busy, please try again in a moment ({operation})"
         else:
             message = f"Error during {operation}: {error_message}"
         
         details = {
             "operation": operation,
             "resource": resource,
+            "code": code,
             "original_error": error_message
         }
         
         pos_error = POSError(message, error_type, details)
-        logger.error(f"POS Error: {pos_error}")
+        # Throttles and outages are expected under load and usually retried
+        level = logging.WARNING if pos_error.retryable else logging.ERROR
+        logger.log(level, "POS Error: %s", pos_error, extra={
+            'error_type': error_type, 'code': code, 'operation': operation, 'resource': resource
+        })
         
         return pos_error
     
@@ -83,7 +171,7 @@ class ErrorHandler:
         """
         details = {"field": field} if field else {}
         pos_error = POSError(message, "VALIDATION_ERROR", details)
-        logger.warning(f"Validation Error: {pos_error}")
+        logger.warning("Validation Error: %s", pos_error, extra={'error_type': "VALIDATION_ERROR", 'field': field})
         return pos_error
     
     @staticmethod
@@ -104,7 +192,7 @@ class ErrorHandler:
             "original_error": str(error)
         }
         pos_error = POSError(message, "DATABASE_ERROR", details)
-        logger.error(f"Database Error: {pos_error}")
+        logger.error("Database Error: %s", pos_error, extra={'error_type': "DATABASE_ERROR", 'operation': operation})
         return pos_error
     
     @staticmethod
@@ -116,8 +204,51 @@ class ErrorHandler:
             operation: Operation that succeeded
             resource: Resource involved
         """
-        message = f"Successfully completed: {operation}"
+        # Costs nothing unless INFO is enabled and the record is sampled
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        if ErrorHandler.success_sample_rate < 1.0 and random.random() >= ErrorHandler.success_sample_rate:
+            return
         if resource:
-            message += f" on {resource}"
-        logger.info(message)
+            logger.info("Successfully completed: %s on %s", operation, resource,
+                        extra={'operation': operation, 'resource': resource})
+        else:
+            logger.info("Successfully completed: %s", operation, extra={'operation': operation})
+
 
+
+def retry_aws(attempts: int = 3, base_delay: float = 0.05, max_delay: float = 1.0, throttle_only: bool = False):
+    """
+    Retry a function when it fails with a throttling or transient AWS error.
+    
+    Waits a random time up to base_delay * 2 ** attempt (capped at
+    max_delay) between tries, so retries from many workers spread out.
+    Other errors are raised at once. With throttle_only, only throttles
+    are retried (for calls that must not run twice, e.g. SNS publish).
+    botocore retries each HTTP call first; this retries the whole
+    operation after botocore gives up.
+    
+    Args:
+        attempts: Total tries, including the first
+        base_delay: Seconds before the first retry, doubled each time
+        max_delay: Longest wait between tries
+        throttle_only: Retry AWS_THROTTLED errors only
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(attempts):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    error_type, code = ErrorHandler.classify_aws_error(e)
+                    retry = error_type == "AWS_THROTTLED" or (not throttle_only and error_type in RETRYABLE_ERROR_TYPES)
+                    if not retry or attempt == attempts - 1:
+                        raise
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                    logger.warning("Retrying %s after %s in %.3fs (attempt %d of %d)", func.__qualname__,
+                                   code or error_type, delay, attempt + 2, attempts,
+                                   extra={'operation': func.__qualname__, 'code': code})
+                    time.sleep(delay)
+        return wrapper
+    return decorate
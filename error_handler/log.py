@@ -0,0 +1,80 @@
+"""
+Logging backend for MyPOS
+Records are queued by the calling thread and encoded and written by a
+background listener, as JSON lines or plain text.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, extra fields and any exception"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records with their message rendered; the listener does the rest.
+
+    The message is interpolated on the calling thread, so arguments changed
+    after the call (or not safe to read from another thread) are logged as
+    they were; the JSON encoding and any traceback are still formatted by
+    the listener.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(level='INFO', log_format='json', stream=None):
+    """
+    Send records from every logger to stream (stderr) through a background thread.
+
+    Called once at startup (from the pos app's ready()); later calls do
+    nothing, and neither does a call when the root logger already has
+    handlers (e.g. from settings.LOGGING).
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None or root.handlers:
+        return _listener
+
+    output = logging.StreamHandler(stream)
+    if log_format == 'json':
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(levelname)s:%(name)s:%(message)s'))
+
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root.addHandler(DeferredQueueHandler(records))
+    root.setLevel(level)
+    return _listener
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pos.middleware.AWSCallTimingMiddleware',  # First, so it times everything below it
+    'pos.middleware.RequestIdentityMapMiddleware',  # Each customer/transaction read from DynamoDB once per request
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -127,6 +129,42 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # AWS Configuration - Will use default credentials from AWS Academy
 AWS_REGION = 'us-east-1'  # Default region, can be changed
 
+# Set to True when 'python manage.py init_aws' runs at deploy time, so requests
+# never check or create tables and buckets. Otherwise each process checks once.
+AWS_RESOURCES_PREPARED = os.environ.get('AWS_RESOURCES_PREPARED', '') == '1'
+AWS_RESOURCE_RECHECK_INTERVAL = 60  # Seconds before re-checking a resource that wasn't ready (e.g. an index being built)
+
+# AWS clients
+# Shared by every thread; the pool should cover the busiest thread count (workers, scans, uploads)
+AWS_MAX_POOL_CONNECTIONS = 50
+AWS_TCP_KEEPALIVE = True
+AWS_CONNECT_TIMEOUT = 3  # Seconds
+AWS_READ_TIMEOUT = 10  # Seconds
+AWS_RETRY_MODE = 'adaptive'  # Client-side rate limiting when AWS throttles
+AWS_MAX_ATTEMPTS = 5
+# Whole DynamoDB/SNS operations are retried on throttling and 5xx after botocore gives up, with jittered backoff
+AWS_OPERATION_RETRY_ATTEMPTS = 3
+AWS_OPERATION_RETRY_BASE_DELAY = 0.05  # Seconds, doubled on each retry
+AWS_OPERATION_RETRY_MAX_DELAY = 1.0
+
+# Logging
+# Records are formatted and written by a background thread (error_handler/log.py).
+# Define LOGGING with root handlers instead to take over completely.
+POS_LOG_LEVEL = os.environ.get('POS_LOG_LEVEL', 'INFO')
+POS_LOG_FORMAT = os.environ.get('POS_LOG_FORMAT', 'json')  # 'json' or 'text'
+POS_LOG_SUCCESS_SAMPLE_RATE = float(os.environ.get('POS_LOG_SUCCESS_SAMPLE_RATE', 1.0))  # Fraction of success records kept
+
+# AWS call accounting
+# Every request logs its AWS calls to the 'pos.requests' logger; slow ones list each call
+AWS_SERVER_TIMING = DEBUG  # Server-Timing header with AWS time per service (visible in browser dev tools)
+AWS_SLOW_REQUEST_MS = 500
+AWS_TRACE_CONSUMED_CAPACITY = True  # Ask DynamoDB for consumed capacity while a request is traced
+
+# DynamoDB backend
+# 'aws', or 'local' for the in-process SQLite engine (offline development and load tests)
+DYNAMODB_BACKEND = os.environ.get('DYNAMODB_BACKEND', 'aws')
+DYNAMODB_LOCAL_PATH = os.environ.get('DYNAMODB_LOCAL_PATH', str(BASE_DIR / 'dynamodb-local.sqlite3'))  # ':memory:' for a throwaway store
+
 # DynamoDB Tables
 DYNAMODB_CUSTOMERS_TABLE = 'mypos-customers'
 DYNAMODB_TRANSACTIONS_TABLE = 'mypos-transactions'
@@ -136,6 +174,108 @@ DYNAMODB_TRANSACTIONS_TABLE = 'mypos-transactions'
 # Example: 'mypos-product-images-yourname-12345'
 S3_BUCKET_NAME = 'mypos-product-images'
 
-# SNS Topic
-SNS_TOPIC_ARN = None  # Will be created programmatically
+# S3 transfers
+# Files above the threshold are sent as multipart uploads, max_concurrency parts at a time.
+# The pool must hold every concurrent part across all upload threads.
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+S3_MAX_CONCURRENCY = 10
+S3_MAX_POOL_CONNECTIONS = 50
 
+# SNS Topic
+SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN')  # Found or created programmatically when unset
+
+
+# DynamoDB scans
+# Segments > 1 read tables as a parallel scan on a thread pool
+DYNAMODB_SCAN_SEGMENTS = int(os.environ.get('DYNAMODB_SCAN_SEGMENTS', 1))
+DYNAMODB_SCAN_PAGE_SIZE = None  # Items per scan request (None = DynamoDB's 1 MB page)
+
+# Async views
+# Serve the customer list and transaction pages from pos/async_views.py. Only useful under
+# an ASGI server (e.g. uvicorn mypos.asgi:application); under WSGI each request gets an event loop.
+POS_ASYNC_VIEWS = os.environ.get('POS_ASYNC_VIEWS', '') == '1'
+POS_ASYNC_AWS_WORKERS = AWS_MAX_POOL_CONNECTIONS  # Threads running blocking boto3 calls for async views
+
+# Fan-out
+# Threads the sync views use to run a request's independent AWS lookups side by side (pos/fanout.py)
+POS_FANOUT_WORKERS = AWS_MAX_POOL_CONNECTIONS
+
+# List pages
+POS_PAGE_SIZE = 50  # Rows per page on the customer and transaction lists
+POS_PAGE_TRAIL = 20  # Earlier pages a cursor remembers for Previous; further back only First page is offered
+
+# Transactions index
+# Transactions are listed newest first from a GSI on a fixed shard key (list_shard), sorted by
+# created_at. More shards spread the index's write load; each list page then queries every shard
+# in parallel. After changing the count, run init_aws to move existing transactions.
+DYNAMODB_TRANSACTIONS_RECENT_INDEX = 'list_shard-created_at-index'
+DYNAMODB_TRANSACTIONS_CUSTOMER_INDEX = 'customer_id-created_at-index'
+TRANSACTIONS_INDEX_SHARDS = 1
+
+# Customer changes index
+# Customer writes set updated_at and a constant change_feed key, so customers changed since a
+# time can be queried without scanning the table. Customer writes are far below what one index
+# partition takes.
+DYNAMODB_CUSTOMERS_CHANGES_INDEX = 'change_feed-updated_at-index'
+
+# Outbox for post-checkout side effects (SNS notifications, CloudWatch metrics)
+OUTBOX_SPILL_DIR = BASE_DIR / 'outbox'  # Journals of jobs not yet completed
+OUTBOX_WORKERS = 2
+OUTBOX_QUEUE_SIZE = 1000
+OUTBOX_MAX_RETRIES = 5
+OUTBOX_RETRY_DELAY = 0.5  # Seconds, doubled on each retry
+OUTBOX_SHUTDOWN_TIMEOUT = 5  # Seconds to let queued jobs finish at exit
+
+# CloudWatch
+# Transaction metrics are aggregated in memory and sent as StatisticSets
+CLOUDWATCH_FLUSH_INTERVAL = 60  # Seconds between put_metric_data batches
+
+# Product catalog cache
+# The checkout form lists products from an in-memory snapshot. Every check interval it is compared
+# with a version counter in this cache and a fingerprint of the products table, so other
+# processes' changes show up within the interval even with the per-process default cache.
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_VERSION_CHECK_INTERVAL = 1.0  # Seconds between version/fingerprint checks
+
+# Customer cache
+# get_customer reads through an in-process LRU, then this Django cache, then
+# DynamoDB. The Django cache is skipped unless its backend is shared between processes
+# (memcached/redis); the default local-memory cache isn't, so only the LRU is used. Customer
+# writes drop the entries; other processes' LRU copies expire after CUSTOMER_CACHE_LOCAL_TTL.
+# Counters are at /stats/customer-cache/. A TTL of 0 turns caching off.
+CUSTOMER_CACHE_ALIAS = 'default'
+CUSTOMER_CACHE_TTL = 300  # Seconds a customer stays in the Django cache
+CUSTOMER_CACHE_LOCAL_TTL = 5  # Seconds an entry stays in the in-process LRU
+CUSTOMER_CACHE_MISS_TTL = 5  # Seconds a customer that doesn't exist is remembered, at either level
+CUSTOMER_CACHE_LOCAL_SIZE = 10000  # Entries in the in-process LRU
+
+# Customer search
+# The checkout form picks customers through /customers/search/, served from an in-process prefix
+# and trigram index over name, email and phone (pos/customer_index.py). The index is filled by a
+# background scan on first use and kept current by this process's customer writes. Other
+# processes' adds and edits are read from the customer changes index; their deletes only drop out
+# on a full rescan, which is off unless CUSTOMER_INDEX_RESCAN_INTERVAL is set.
+CUSTOMER_INDEX_REFRESH_INTERVAL = 30  # Seconds between queries for customers changed by other processes
+CUSTOMER_INDEX_CHANGE_OVERLAP = 60  # Each query re-reads this many seconds of changes, for clock skew between servers
+CUSTOMER_INDEX_RESCAN_INTERVAL = None  # Seconds between full rescans of the customers table; None turns them off
+CUSTOMER_INDEX_BATCH_SIZE = 1000  # Scanned customers added to the index at a time
+CUSTOMER_SEARCH_MIN_CHARS = 1  # Shorter queries return nothing
+CUSTOMER_SEARCH_LIMIT = 10  # Results when the request doesn't ask for a number
+CUSTOMER_SEARCH_MAX_LIMIT = 50
+
+# Product images
+# Uploads are resized into these variants (longest side in pixels), each as JPEG and WebP
+PRODUCT_IMAGE_VARIANTS = {'thumb': 150, 'medium': 600, 'large': 1200}
+PRODUCT_IMAGE_MAX_UPLOAD_BYTES = 15 * 1024 * 1024
+PRODUCT_IMAGE_MAX_PIXELS = 50_000_000  # Larger images are rejected as decompression bombs
+PRODUCT_IMAGE_WORKERS = 2  # Images processed at once
+PRODUCT_IMAGE_UPLOAD_WORKERS = 6  # Variant uploads to S3 at once
+S3_IMAGE_PREFIX = 'images/'  # Variants are stored at images/<sha256[:2]>/<sha256>/<variant>-<size>.<ext>
+S3_IMAGE_CACHE_CONTROL = 'public, max-age=31536000, immutable'  # Safe because keys never change content
+
+# Direct browser uploads
+# The browser POSTs images straight to S3 under this prefix using a presigned policy
+S3_UPLOAD_PREFIX = 'uploads/'
+S3_PRESIGNED_POST_EXPIRES = 600  # Seconds a presigned upload stays valid
+S3_UPLOAD_CORS_ORIGINS = ['*']  # Origins allowed to POST to the bucket
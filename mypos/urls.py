@@ -6,21 +6,30 @@ from django.urls import path
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from pos import views
+from pos import async_views, views
+
+# Async versions of the AWS-bound pages, for ASGI deployments
+aws_views = async_views if settings.POS_ASYNC_VIEWS else views
 
 urlpatterns = [
     path('', views.home, name='home'),
+    path('stats/aws-pools/', views.aws_pool_stats, name='aws_pool_stats'),
+    path('stats/customer-cache/', views.customer_cache_stats, name='customer_cache_stats'),
     path('products/', views.product_list, name='product_list'),
     path('products/add/', views.product_add, name='product_add'),
     path('products/edit/<int:product_id>/', views.product_edit, name='product_edit'),
+    path('products/image/presign/', views.product_image_presign, name='product_image_presign'),
+    path('products/image/complete/<int:product_id>/', views.product_image_complete, name='product_image_complete'),
     path('products/delete/<int:product_id>/', views.product_delete, name='product_delete'),
-    path('customers/', views.customer_list, name='customer_list'),
+    path('customers/', aws_views.customer_list, name='customer_list'),
     path('customers/add/', views.customer_add, name='customer_add'),
+    path('customers/search/', views.customer_search, name='customer_search'),
+    path('customers/view/<str:customer_id>/', views.customer_view, name='customer_view'),
     path('customers/edit/<str:customer_id>/', views.customer_edit, name='customer_edit'),
     path('customers/delete/<str:customer_id>/', views.customer_delete, name='customer_delete'),
-    path('transactions/', views.transaction_list, name='transaction_list'),
-    path('transactions/add/', views.transaction_add, name='transaction_add'),
-    path('transactions/view/<str:transaction_id>/', views.transaction_view, name='transaction_view'),
+    path('transactions/', aws_views.transaction_list, name='transaction_list'),
+    path('transactions/add/', aws_views.transaction_add, name='transaction_add'),
+    path('transactions/view/<str:transaction_id>/', aws_views.transaction_view, name='transaction_view'),
 ]
 
 if settings.DEBUG:
@@ -5,3 +5,17 @@ class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
 
+    def ready(self):
+        from django.conf import settings
+        from django.db.models.signals import post_save, post_delete
+        from error_handler import ErrorHandler, configure_logging
+        from .catalog import invalidate_catalog
+        from .models import Product
+
+        # Keep the in-memory product catalog in step with the database
+        post_save.connect(invalidate_catalog, sender=Product, dispatch_uid='pos.catalog.post_save')
+        post_delete.connect(invalidate_catalog, sender=Product, dispatch_uid='pos.catalog.post_delete')
+
+        # Log records are written by a background thread
+        configure_logging(settings.POS_LOG_LEVEL, settings.POS_LOG_FORMAT)
+        ErrorHandler.success_sample_rate = settings.POS_LOG_SUCCESS_SAMPLE_RATE
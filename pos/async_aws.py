@@ -0,0 +1,55 @@
+"""
+Async access to DynamoDBService for the ASGI views
+boto3 blocks, so every call runs on a dedicated thread pool sized for AWS
+I/O. The event loop can wait on many DynamoDB calls at once while a
+handful of threads does the blocking.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .aws_services import DynamoDBService
+
+_executor = None
+_lock = threading.Lock()
+
+
+def aws_executor():
+    """Threads that run blocking AWS calls for async code"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.POS_ASYNC_AWS_WORKERS,
+                                               thread_name_prefix='async-aws')
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking I/O (boto3 calls, outbox journal writes) on the AWS thread pool, in the caller's context"""
+    return await sync_to_async(func, thread_sensitive=False, executor=aws_executor())(*args, **kwargs)
+
+
+def _async(name):
+    # Looked up on each call, so the async method always runs the current DynamoDBService code
+    async def call(*args, **kwargs):
+        return await run_blocking(getattr(DynamoDBService, name), *args, **kwargs)
+    call.__name__ = call.__qualname__ = name
+    call.__doc__ = f"Async DynamoDBService.{name}()"
+    return staticmethod(call)
+
+
+class AsyncDynamoDBService:
+    """Awaitable versions of the DynamoDBService methods the async views use"""
+
+    ensure_tables = _async('ensure_tables')
+    get_customer = _async('get_customer')
+    batch_get_customers = _async('batch_get_customers')
+    list_customers_page = _async('list_customers_page')
+    add_transaction = _async('add_transaction')
+    get_transaction = _async('get_transaction')
+    list_recent_transactions = _async('list_recent_transactions')
+    list_transactions_for_customer = _async('list_transactions_for_customer')
@@ -0,0 +1,163 @@
+"""
+Async views for the AWS-bound customer and transaction pages
+Routed instead of their pos.views counterparts when POS_ASYNC_VIEWS is on
+(deploy with an ASGI server). DynamoDB calls run on the AWS thread pool and
+independent ones run concurrently; the ORM and template rendering go
+through sync_to_async.
+"""
+
+import asyncio
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.shortcuts import redirect, render
+
+from error_handler.error_handler import POSError
+from .async_aws import AsyncDynamoDBService, run_blocking
+from .catalog import catalog
+from .models import Product
+from .pagination import CursorPage, apaginate
+from .streaming import arender_streaming
+from .views import after_checkout, label_customers, line_items, parse_basket, reserve_basket
+
+logger = logging.getLogger(__name__)
+
+# Rendering may load the session or user from the database, which async code can't do directly
+arender = sync_to_async(render)
+
+
+async def customer_list(request):
+    """List one page of customers from DynamoDB"""
+    try:
+        await AsyncDynamoDBService.ensure_tables()
+        customers = await apaginate(request, AsyncDynamoDBService.list_customers_page, settings.POS_PAGE_SIZE)
+    except POSError as e:
+        messages.error(request, str(e))
+        customers = CursorPage([])
+    except Exception as e:
+        messages.error(request, f"Error loading customers: {str(e)}")
+        customers = CursorPage([])
+
+    return await arender_streaming(request, 'customers/list.html', {'customers': customers, 'page': customers},
+                                   customers, 'customers/_row.html', 'customer')
+
+
+async def transaction_list(request):
+    """List one page of transactions from DynamoDB"""
+    try:
+        await AsyncDynamoDBService.ensure_tables()
+        transactions = await apaginate(request, AsyncDynamoDBService.list_recent_transactions, settings.POS_PAGE_SIZE)
+
+        missing_ids = [t['customer_id'] for t in transactions if not t.get('customer_name') and t.get('customer_id')]
+        customers = {}
+        if missing_ids:
+            try:
+                customers = await AsyncDynamoDBService.batch_get_customers(missing_ids)
+            except Exception as e:
+                logger.warning("Could not retrieve customers for transaction list: %s", e)
+        label_customers(transactions, customers)
+
+    except POSError as e:
+        messages.error(request, str(e))
+        transactions = CursorPage([])
+    except Exception as e:
+        messages.error(request, f"Error loading transactions: {str(e)}")
+        transactions = CursorPage([])
+
+    return await arender_streaming(request, 'transactions/list.html', {'transactions': transactions, 'page': transactions},
+                                   transactions, 'transactions/_row.html', 'transaction')
+
+
+async def _customer_or_none(customer_id):
+    try:
+        return await AsyncDynamoDBService.get_customer(customer_id)
+    except Exception as e:
+        logger.warning("Could not retrieve customer %s: %s", customer_id, e)
+        return None
+
+
+async def transaction_add(request):
+    """Add new transaction to DynamoDB"""
+    try:
+        await AsyncDynamoDBService.ensure_tables()
+
+        if request.method == 'POST':
+            try:
+                customer_id, basket = parse_basket(request.POST)
+
+                # Stock is reserved in the database while the customer is read from DynamoDB
+                (reserved, products_by_id), customer = await asyncio.gather(
+                    sync_to_async(reserve_basket)(basket),
+                    _customer_or_none(customer_id)
+                )
+                transaction_products, total_amount = line_items(reserved, products_by_id)
+
+                transaction_id = str(uuid.uuid4())
+                transaction_data = {
+                    'transaction_id': transaction_id,
+                    'customer_id': customer_id,
+                    'products': transaction_products,
+                    'total_amount': total_amount,
+                    'status': 'completed'
+                }
+                if customer:
+                    transaction_data['customer_name'] = customer['name']
+
+                try:
+                    await AsyncDynamoDBService.add_transaction(transaction_data)
+                except Exception:
+                    # The sale wasn't recorded, so put the stock back
+                    await sync_to_async(Product.objects.release_stock)(reserved)
+                    raise
+
+                # Journal write for the outbox
+                await run_blocking(after_checkout, request, transaction_data)
+
+                messages.success(request, f'Transaction created successfully! Transaction ID: {transaction_id}')
+                return redirect('transaction_list')
+
+            except POSError as e:
+                messages.error(request, str(e))
+            except Exception as e:
+                messages.error(request, f"Error creating transaction: {str(e)}")
+
+        # Customers are picked through customer_search, so the form only needs the products
+        products = await sync_to_async(catalog.all)()
+        return await arender(request, 'transactions/add.html', {'products': products})
+
+    except POSError as e:
+        messages.error(request, str(e))
+        return await arender(request, 'transactions/add.html', {'products': []})
+    except Exception as e:
+        messages.error(request, f"Error: {str(e)}")
+        return await arender(request, 'transactions/add.html', {'products': []})
+
+
+async def transaction_view(request, transaction_id):
+    """View transaction details"""
+    try:
+        await AsyncDynamoDBService.ensure_tables()
+        # The customer id is only known from the transaction, and its record is read
+        # once below, so get_transaction skips its own name lookup
+        transaction = await AsyncDynamoDBService.get_transaction(transaction_id, resolve_customer_name=False)
+
+        if not transaction:
+            messages.error(request, 'Transaction not found!')
+            return redirect('transaction_list')
+
+        customer = await _customer_or_none(transaction['customer_id'])
+        transaction['customer'] = customer
+        if 'customer_name' not in transaction:
+            transaction['customer_name'] = customer['name'] if customer else None
+
+        return await arender(request, 'transactions/view.html', {'transaction': transaction})
+
+    except POSError as e:
+        messages.error(request, str(e))
+        return redirect('transaction_list')
+    except Exception as e:
+        messages.error(request, f"Error loading transaction: {str(e)}")
+        return redirect('transaction_list')
@@ -0,0 +1,139 @@
+"""
+Shared boto3 clients for MyPOS
+Clients are created on first use with pooled connections, TCP keepalive,
+adaptive retries and timeouts from settings. DynamoDB can be served by the
+in-process engine in pos/local_dynamodb.py instead (DYNAMODB_BACKEND).
+"""
+
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+from . import aws_tracing
+
+_clients = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def client_config(service):
+    """botocore Config for a service, from the AWS_* settings"""
+    pool_size = settings.AWS_MAX_POOL_CONNECTIONS
+    if service == 's3':
+        pool_size = settings.S3_MAX_POOL_CONNECTIONS
+
+    return Config(
+        region_name=settings.AWS_REGION,
+        max_pool_connections=pool_size,
+        tcp_keepalive=settings.AWS_TCP_KEEPALIVE,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+        retries={'mode': settings.AWS_RETRY_MODE, 'max_attempts': settings.AWS_MAX_ATTEMPTS}
+    )
+
+
+def _session():
+    # boto3 sessions are not thread-safe, so each thread creates clients from its own
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = _local.session = boto3.session.Session()
+    return session
+
+
+def create_client(service):
+    """
+    A new client for a service from the configured backend.
+
+    A backend is anything that answers the boto3 client calls DynamoDBService
+    makes and raises botocore ClientErrors; 'aws' is boto3 itself.
+    """
+    if service == 'dynamodb' and settings.DYNAMODB_BACKEND == 'local':
+        from .local_dynamodb import LocalDynamoDB
+        return aws_tracing.TracedClient(service, LocalDynamoDB(settings.DYNAMODB_LOCAL_PATH))
+    if service == 'dynamodb' and settings.DYNAMODB_BACKEND != 'aws':
+        raise ValueError(f"Unknown DYNAMODB_BACKEND: {settings.DYNAMODB_BACKEND}")
+    return aws_tracing.instrument(_session().client(service, config=client_config(service)))
+
+
+def get_client(service):
+    """
+    The process-wide client for a service, created on first use.
+
+    Clients are thread-safe once built, so every thread shares one client
+    and its connection pool.
+    """
+    client = _clients.get(service)
+    if client is None:
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                client = create_client(service)
+                _clients[service] = client
+    return client
+
+
+def set_client(service, client):
+    """Use client for a service from now on, e.g. a local stand-in in benchmarks"""
+    with _lock:
+        _clients[service] = client
+
+
+def reset_clients():
+    """Drop every client, e.g. after fork or when settings change"""
+    with _lock:
+        _clients.clear()
+
+
+class LazyClient:
+    """Stands in for a client at import time and creates it on first attribute access"""
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getattr__(self, name):
+        return getattr(get_client(self._service), name)
+
+    def __repr__(self):
+        return f"<LazyClient {self._service}>"
+
+
+def pool_stats():
+    """
+    Connection pool usage of every client created so far.
+
+    Returns {service: {'max_pool_connections': n, 'pools': [...]}} with one
+    entry per host pool: connections opened, requests sent, connections in
+    use and idle.
+    """
+    stats = {}
+    for service, client in list(_clients.items()):
+        if not hasattr(client, '_endpoint'):
+            continue  # Local backend, no HTTP pool
+        http_session = client._endpoint.http_session
+        pools = []
+        managers = [getattr(http_session, '_manager', None)] + list(getattr(http_session, '_proxy_managers', {}).values())
+        for manager in managers:
+            if manager is None:
+                continue
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                # Free slots hold either an idle connection or None (not opened yet)
+                slots = list(pool.pool.queue) if pool.pool is not None else []
+                maxsize = pool.pool.maxsize if pool.pool is not None else 0
+                pools.append({
+                    'host': f"{pool.scheme}://{pool.host}:{pool.port}",
+                    'connections_opened': pool.num_connections,
+                    'requests': pool.num_requests,
+                    'in_use': maxsize - len(slots),
+                    'idle': sum(1 for conn in slots if conn is not None),
+                    'maxsize': maxsize
+                })
+        stats[service] = {
+            'max_pool_connections': client.meta.config.max_pool_connections,
+            'pools': pools
+        }
+    return stats
@@ -3,27 +3,226 @@ AWS Services Integration for MyPOS
 Uses default AWS credentials from AWS Academy Learners Lab
 """
 
-import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+import contextvars
+import heapq
 import json
+import logging
+import queue
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
 from datetime import datetime
 from django.conf import settings
-from error_handler.error_handler import ErrorHandler, POSError
+from error_handler.error_handler import ErrorHandler, POSError, retry_aws
+from . import identity_map
+from .aws_clients import LazyClient
+from .customer_cache import customer_cache
+from .customer_index import customer_index
+from .fanout import FanOut
+from .metrics import MetricsAggregator
 
-# Initialize AWS clients - uses default credentials from environment
-dynamodb = boto3.client('dynamodb', region_name=settings.AWS_REGION)
-s3 = boto3.client('s3', region_name=settings.AWS_REGION)
-sns = boto3.client('sns', region_name=settings.AWS_REGION)
-cloudwatch = boto3.client('cloudwatch', region_name=settings.AWS_REGION)
+logger = logging.getLogger(__name__)
+
+# AWS clients - created on first use with default credentials from environment
+dynamodb = LazyClient('dynamodb')
+s3 = LazyClient('s3')
+sns = LazyClient('sns')
+cloudwatch = LazyClient('cloudwatch')
+
+# Operation-level retry for throttles and transient errors, on top of botocore's per-call retries
+aws_retry = retry_aws(settings.AWS_OPERATION_RETRY_ATTEMPTS, settings.AWS_OPERATION_RETRY_BASE_DELAY,
+                      settings.AWS_OPERATION_RETRY_MAX_DELAY)
+aws_retry_throttles = retry_aws(settings.AWS_OPERATION_RETRY_ATTEMPTS, settings.AWS_OPERATION_RETRY_BASE_DELAY,
+                                settings.AWS_OPERATION_RETRY_MAX_DELAY, throttle_only=True)
+
+# Partition key of the customer changes index: every customer is in the one feed
+CUSTOMER_CHANGE_FEED = 'customers'
+
+
+class ResourceRegistry:
+    """
+    Process-wide record of AWS resources known to exist.
+    
+    Control-plane calls (create_table, head_bucket, ...) are slow and heavily
+    throttled, so each resource is set up at most once per process. A setup
+    that returns False isn't finished (e.g. an index is still being built)
+    and is run again after AWS_RESOURCE_RECHECK_INTERVAL seconds. With
+    AWS_RESOURCES_PREPARED = True (init_aws was run at deploy time) nothing
+    is checked at all.
+    """
+    
+    _ready = set()
+    _retry_at = {}
+    _lock = threading.RLock()
+    
+    @classmethod
+    def ensure(cls, name, setup):
+        """Run setup() the first time name is needed in this process"""
+        if name in cls._ready or settings.AWS_RESOURCES_PREPARED:
+            return
+        with cls._lock:
+            if name in cls._ready or time.monotonic() < cls._retry_at.get(name, 0):
+                return
+            if setup() is False:
+                cls._retry_at[name] = time.monotonic() + settings.AWS_RESOURCE_RECHECK_INTERVAL
+                return
+            cls._retry_at.pop(name, None)
+            cls._ready.add(name)
+    
+    @classmethod
+    def mark_ready(cls, name):
+        """Record that a resource exists without checking it"""
+        with cls._lock:
+            cls._ready.add(name)
+    
+    @classmethod
+    def is_ready(cls, name):
+        return name in cls._ready or settings.AWS_RESOURCES_PREPARED
+    
+    @classmethod
+    def reset(cls):
+        """Forget every resource, e.g. after tables were deleted"""
+        with cls._lock:
+            cls._ready.clear()
+            cls._retry_at.clear()
 
 
 class DynamoDBService:
     """Service for DynamoDB operations"""
     
+    @staticmethod
+    def _customer_from_item(item):
+        """Convert a DynamoDB customer item to a dict"""
+        return {
+            'customer_id': item['customer_id']['S'],
+            'name': item['name']['S'],
+            'email': item.get('email', {}).get('S', ''),
+            'phone': item.get('phone', {}).get('S', ''),
+            'address': item.get('address', {}).get('S', ''),
+            'created_at': item.get('created_at', {}).get('S', ''),
+            'updated_at': item.get('updated_at', {}).get('S', '')
+        }
+    
+    @staticmethod
+    def _transaction_from_item(item):
+        """Convert a DynamoDB transaction item to a dict"""
+        transaction = {
+            'transaction_id': item['transaction_id']['S'],
+            'customer_id': item['customer_id']['S'],
+            'products': json.loads(item['products']['S']),
+            'total_amount': float(item['total_amount']['N']),
+            'status': item.get('status', {}).get('S', 'completed'),
+            'created_at': item.get('created_at', {}).get('S', '')
+        }
+        
+        # Get customer_name if stored in transaction
+        if 'customer_name' in item:
+            transaction['customer_name'] = item['customer_name']['S']
+        
+        return transaction
+    
+    @staticmethod
+    def _scan_pages(table_name, segment=None, total_segments=None, page_size=None):
+        """Yield pages of raw items, following LastEvaluatedKey until the scan is done"""
+        scan_kwargs = {'TableName': table_name}
+        if total_segments:
+            scan_kwargs['Segment'] = segment
+            scan_kwargs['TotalSegments'] = total_segments
+        if page_size:
+            scan_kwargs['Limit'] = page_size
+        
+        while True:
+            response = dynamodb.scan(**scan_kwargs)
+            yield response.get('Items', [])
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            scan_kwargs['ExclusiveStartKey'] = last_key
+    
+    @staticmethod
+    def scan_page(table_name, limit, start_key=None):
+        """Read one page of raw items. Returns (items, last_evaluated_key)"""
+        scan_kwargs = {'TableName': table_name, 'Limit': limit}
+        if start_key:
+            scan_kwargs['ExclusiveStartKey'] = start_key
+        response = dynamodb.scan(**scan_kwargs)
+        return response.get('Items', []), response.get('LastEvaluatedKey')
+    
+    @staticmethod
+    def scan_items(table_name, segments=None, page_size=None):
+        """
+        Yield every raw item in a table.
+        
+        With segments > 1 the table is read as a DynamoDB parallel scan on a
+        thread pool. Pages are handed over through a bounded queue, so only a
+        few pages are held in memory no matter how large the table is.
+        """
+        segments = segments or settings.DYNAMODB_SCAN_SEGMENTS
+        page_size = page_size or settings.DYNAMODB_SCAN_PAGE_SIZE
+        
+        if segments <= 1:
+            for page in DynamoDBService._scan_pages(table_name, page_size=page_size):
+                yield from page
+            return
+        
+        pages = queue.Queue(maxsize=segments * 2)
+        stop = threading.Event()
+        done = object()
+        
+        def put(value):
+            # Give up if the consumer stopped reading
+            while not stop.is_set():
+                try:
+                    pages.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def scan_segment(segment):
+            try:
+                for page in DynamoDBService._scan_pages(table_name, segment, segments, page_size):
+                    if not put(page):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+        
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='dynamodb-scan') as executor:
+            for segment in range(segments):
+                # Run in a copy of the caller's context so the request's AWS call accounting sees the scan
+                executor.submit(contextvars.copy_context().run, scan_segment, segment)
+            
+            try:
+                remaining = segments
+                while remaining:
+                    page = pages.get()
+                    if page is done:
+                        remaining -= 1
+                    elif isinstance(page, Exception):
+                        raise page
+                    else:
+                        yield from page
+            finally:
+                stop.set()
+    
+    @staticmethod
+    def ensure_tables():
+        """Create the tables on first use in this process, then never again"""
+        ResourceRegistry.ensure('dynamodb:tables', DynamoDBService.create_tables)
+    
     @staticmethod
     def create_tables():
         """Create DynamoDB tables if they don't exist"""
         try:
+            existing = False
+            
             # Create Customers table
             try:
                 dynamodb.create_table(
@@ -33,12 +232,16 @@ class DynamoDBService:
                     ],
                     AttributeDefinitions=[
                         {'AttributeName': 'customer_id', 'AttributeType': 'S'}
-                    ],
+                    ] + DynamoDBService._index_attribute_definitions(DynamoDBService._customer_indexes()),
+                    GlobalSecondaryIndexes=DynamoDBService._customer_indexes(),
                     BillingMode='PAY_PER_REQUEST'
                 )
                 ErrorHandler.log_success("Created customers table")
-            except dynamodb.exceptions.ResourceInUseException:
-                pass  # Table already exists
+            except ClientError as e:
+                # ResourceInUseException: table already exists
+                if e.response['Error']['Code'] != 'ResourceInUseException':
+                    raise
+                existing = True
             
             # Create Transactions table
             try:
@@ -49,40 +252,203 @@ class DynamoDBService:
                     ],
                     AttributeDefinitions=[
                         {'AttributeName': 'transaction_id', 'AttributeType': 'S'}
-                    ],
+                    ] + DynamoDBService._index_attribute_definitions(DynamoDBService._transaction_indexes()),
+                    GlobalSecondaryIndexes=DynamoDBService._transaction_indexes(),
                     BillingMode='PAY_PER_REQUEST'
                 )
                 ErrorHandler.log_success("Created transactions table")
-            except dynamodb.exceptions.ResourceInUseException:
-                pass  # Table already exists
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ResourceInUseException':
+                    raise
+                existing = True
+            
+            if existing:
+                # Tables created by an older release - add any indexes they are missing
+                pending = DynamoDBService._ensure_indexes()
+                if pending:
+                    # Not ready: ensure_tables checks again later, and init_aws waits for them
+                    logger.warning("DynamoDB indexes not ready yet: %s. Run 'python manage.py init_aws' "
+                                   "to build them all.", ', '.join(pending))
+                    return False
+            
+            ResourceRegistry.mark_ready('dynamodb:tables')
+            return True
                 
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "create_tables", "DynamoDB")
     
     @staticmethod
+    def _customer_indexes():
+        """Global secondary indexes on the customers table"""
+        return [
+            {
+                # Customers changed since a time, for the search index's incremental refresh
+                'IndexName': settings.DYNAMODB_CUSTOMERS_CHANGES_INDEX,
+                'KeySchema': [
+                    {'AttributeName': 'change_feed', 'KeyType': 'HASH'},
+                    {'AttributeName': 'updated_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+        ]
+    
+    @staticmethod
+    def _transaction_indexes():
+        """Global secondary indexes on the transactions table"""
+        return [
+            {
+                # Newest-first listing: a fixed set of shards, each sorted by created_at
+                'IndexName': settings.DYNAMODB_TRANSACTIONS_RECENT_INDEX,
+                'KeySchema': [
+                    {'AttributeName': 'list_shard', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                # Per-customer history, newest first
+                'IndexName': settings.DYNAMODB_TRANSACTIONS_CUSTOMER_INDEX,
+                'KeySchema': [
+                    {'AttributeName': 'customer_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+        ]
+    
+    @staticmethod
+    def _index_attribute_definitions(indexes):
+        """Attribute definitions for every key used by the given indexes"""
+        names = []
+        for index in indexes:
+            for key in index['KeySchema']:
+                if key['AttributeName'] not in names:
+                    names.append(key['AttributeName'])
+        return [{'AttributeName': name, 'AttributeType': 'S'} for name in names]
+    
+    @staticmethod
+    def _ensure_indexes():
+        """
+        Add a missing GSI to each existing table.
+        
+        DynamoDB builds one index at a time per table, so nothing is added to a
+        table while another of its indexes is still being built. Returns the
+        names of the indexes that are missing or not yet ACTIVE; empty once
+        all of them can be queried.
+        """
+        pending = []
+        for table_name, wanted in ((settings.DYNAMODB_CUSTOMERS_TABLE, DynamoDBService._customer_indexes()),
+                                   (settings.DYNAMODB_TRANSACTIONS_TABLE, DynamoDBService._transaction_indexes())):
+            table = dynamodb.describe_table(TableName=table_name)['Table']
+            status = {index['IndexName']: index.get('IndexStatus') for index in table.get('GlobalSecondaryIndexes', [])}
+            
+            missing = [index for index in wanted if index['IndexName'] not in status]
+            building = [index['IndexName'] for index in wanted
+                        if index['IndexName'] in status and status[index['IndexName']] != 'ACTIVE']
+            
+            if missing and not building:
+                try:
+                    dynamodb.update_table(
+                        TableName=table_name,
+                        AttributeDefinitions=DynamoDBService._index_attribute_definitions(wanted),
+                        GlobalSecondaryIndexUpdates=[{'Create': missing[0]}]
+                    )
+                    ErrorHandler.log_success("Creating index", f"{table_name}.{missing[0]['IndexName']}")
+                except ClientError as e:
+                    # Another update is still in progress; a later call adds this index
+                    if e.response['Error']['Code'] not in ('ResourceInUseException', 'LimitExceededException'):
+                        raise
+            pending += building + [index['IndexName'] for index in missing]
+        return pending
+    
+    @staticmethod
+    def wait_for_indexes(timeout, poll_interval=15, progress=None):
+        """
+        Add the missing indexes one after another, waiting for each to become
+        ACTIVE. Returns the indexes still pending after timeout seconds (empty
+        when all are ready). progress(pending) is called on each poll.
+        """
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                pending = DynamoDBService._ensure_indexes()
+                if not pending or time.monotonic() >= deadline:
+                    return pending
+                if progress:
+                    progress(pending)
+                time.sleep(poll_interval)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "wait_for_indexes", "DynamoDB")
+    
+    @staticmethod
+    def _list_shard(transaction_id):
+        """The recent-transactions index partition a transaction is listed in"""
+        return str(zlib.crc32(transaction_id.encode()) % settings.TRANSACTIONS_INDEX_SHARDS)
+    
+    @staticmethod
+    def backfill_transaction_shards():
+        """
+        Set list_shard on transactions written before the recent-transactions
+        index existed, or before TRANSACTIONS_INDEX_SHARDS changed
+        """
+        try:
+            updated = 0
+            for item in DynamoDBService.scan_items(settings.DYNAMODB_TRANSACTIONS_TABLE):
+                shard = DynamoDBService._list_shard(item['transaction_id']['S'])
+                if not item.get('created_at') or item.get('list_shard', {}).get('S') == shard:
+                    continue
+                dynamodb.update_item(
+                    TableName=settings.DYNAMODB_TRANSACTIONS_TABLE,
+                    Key={'transaction_id': item['transaction_id']},
+                    UpdateExpression="SET list_shard = :shard",
+                    ExpressionAttributeValues={':shard': {'S': shard}}
+                )
+                updated += 1
+            ErrorHandler.log_success("backfill_transaction_shards", f"{updated} transactions")
+            return updated
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "backfill_transaction_shards", "DynamoDB")
+    
+    @staticmethod
+    @aws_retry
     def add_customer(customer_data):
         """Add customer to DynamoDB"""
         try:
+            now = datetime.now().isoformat()
             item = {
                 'customer_id': {'S': customer_data['customer_id']},
                 'name': {'S': customer_data['name']},
                 'email': {'S': customer_data.get('email', '')},
                 'phone': {'S': customer_data.get('phone', '')},
                 'address': {'S': customer_data.get('address', '')},
-                'created_at': {'S': datetime.now().isoformat()}
+                'created_at': {'S': now},
+                'updated_at': {'S': now},
+                'change_feed': {'S': CUSTOMER_CHANGE_FEED}
             }
             
             dynamodb.put_item(
                 TableName=settings.DYNAMODB_CUSTOMERS_TABLE,
                 Item=item
             )
+            identity_map.forget('customer', customer_data['customer_id'])
+            customer_cache.invalidate(customer_data['customer_id'])
+            customer_index.add(customer_data)
             ErrorHandler.log_success("add_customer", customer_data['customer_id'])
             return True
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "add_customer", "DynamoDB")
     
     @staticmethod
-    def get_customer(customer_id):
+    @identity_map.mapped('customer')
+    def get_customer(customer_id, cached=True):
+        """Get customer, through the customer cache unless cached is False (for a form that writes it back)"""
+        if not cached:
+            return DynamoDBService._read_customer(customer_id)
+        return customer_cache.get_customer(customer_id, DynamoDBService._read_customer)
+    
+    @staticmethod
+    @aws_retry
+    def _read_customer(customer_id):
         """Get customer from DynamoDB"""
         try:
             response = dynamodb.get_item(
@@ -91,51 +457,117 @@ class DynamoDBService:
             )
             
             if 'Item' in response:
-                item = response['Item']
-                return {
-                    'customer_id': item['customer_id']['S'],
-                    'name': item['name']['S'],
-                    'email': item.get('email', {}).get('S', ''),
-                    'phone': item.get('phone', {}).get('S', ''),
-                    'address': item.get('address', {}).get('S', ''),
-                    'created_at': item.get('created_at', {}).get('S', '')
-                }
+                return DynamoDBService._customer_from_item(response['Item'])
             return None
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "get_customer", customer_id)
     
     @staticmethod
-    def list_customers():
-        """List all customers from DynamoDB"""
+    @aws_retry
+    def batch_get_customers(customer_ids, max_retries=5):
+        """
+        Get many customers with BatchGetItem. Returns {customer_id: customer}.
+        
+        IDs are deduplicated and sent 100 per request (the BatchGetItem limit).
+        UnprocessedKeys are retried with exponential backoff; customers that
+        don't exist are simply absent from the result. Customers already read
+        in this request aren't requested again.
+        """
         try:
-            response = dynamodb.scan(TableName=settings.DYNAMODB_CUSTOMERS_TABLE)
-            customers = []
-            
-            for item in response.get('Items', []):
-                customers.append({
-                    'customer_id': item['customer_id']['S'],
-                    'name': item['name']['S'],
-                    'email': item.get('email', {}).get('S', ''),
-                    'phone': item.get('phone', {}).get('S', ''),
-                    'address': item.get('address', {}).get('S', ''),
-                    'created_at': item.get('created_at', {}).get('S', '')
-                })
+            customers = {}
+            unique_ids = []
+            for customer_id in dict.fromkeys(customer_id for customer_id in customer_ids if customer_id):
+                customer = identity_map.recall('customer', customer_id)
+                if customer is identity_map.MISSING:
+                    unique_ids.append(customer_id)
+                elif customer is not None:
+                    customers[customer_id] = customer
             
+            for start in range(0, len(unique_ids), 100):
+                request_items = {
+                    settings.DYNAMODB_CUSTOMERS_TABLE: {
+                        'Keys': [{'customer_id': {'S': customer_id}} for customer_id in unique_ids[start:start + 100]]
+                    }
+                }
+                attempt = 0
+                while request_items:
+                    if attempt:
+                        if attempt > max_retries:
+                            raise Exception(f"BatchGetItem left unprocessed keys after {max_retries} retries")
+                        time.sleep(min(0.05 * (2 ** attempt), 2.0))
+                    
+                    response = dynamodb.batch_get_item(RequestItems=request_items)
+                    for item in response.get('Responses', {}).get(settings.DYNAMODB_CUSTOMERS_TABLE, []):
+                        customer = DynamoDBService._customer_from_item(item)
+                        customers[customer['customer_id']] = customer
+                    
+                    request_items = response.get('UnprocessedKeys') or {}
+                    attempt += 1
+            
+            for customer_id in unique_ids:
+                identity_map.remember('customer', customer_id, customers.get(customer_id))
             return customers
         except Exception as e:
-            raise ErrorHandler.handle_aws_error(e, "list_customers", "DynamoDB")
+            raise ErrorHandler.handle_aws_error(e, "batch_get_customers", "DynamoDB")
+    
+    @staticmethod
+    def iter_customers(segments=None):
+        """Yield every customer from DynamoDB without loading the whole table"""
+        try:
+            for item in DynamoDBService.scan_items(settings.DYNAMODB_CUSTOMERS_TABLE, segments):
+                yield DynamoDBService._customer_from_item(item)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "iter_customers", "DynamoDB")
+    
+    @staticmethod
+    def iter_customers_changed_since(since):
+        """
+        Yield the customers added or edited after the ISO timestamp since,
+        oldest change first, from the changes index. Deleted customers aren't
+        listed.
+        """
+        try:
+            params = {
+                'TableName': settings.DYNAMODB_CUSTOMERS_TABLE,
+                'IndexName': settings.DYNAMODB_CUSTOMERS_CHANGES_INDEX,
+                'KeyConditionExpression': 'change_feed = :feed AND updated_at > :since',
+                'ExpressionAttributeValues': {':feed': {'S': CUSTOMER_CHANGE_FEED}, ':since': {'S': since}}
+            }
+            while True:
+                response = dynamodb.query(**params)
+                for item in response.get('Items', []):
+                    yield DynamoDBService._customer_from_item(item)
+                if not response.get('LastEvaluatedKey'):
+                    return
+                params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "iter_customers_changed_since", since)
     
     @staticmethod
+    @aws_retry
+    def list_customers_page(limit, start_key=None):
+        """List one page of customers. Returns (customers, last_evaluated_key)"""
+        try:
+            items, last_key = DynamoDBService.scan_page(settings.DYNAMODB_CUSTOMERS_TABLE, limit, start_key)
+            return [DynamoDBService._customer_from_item(item) for item in items], last_key
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "list_customers_page", "DynamoDB")
+    
+    @staticmethod
+    @aws_retry
     def update_customer(customer_id, customer_data):
         """Update customer in DynamoDB"""
         try:
-            update_expression = "SET #name = :name, email = :email, phone = :phone, address = :address"
+            update_expression = ("SET #name = :name, email = :email, phone = :phone, address = :address, "
+                                 "updated_at = :updated_at, change_feed = :change_feed")
             expression_attribute_names = {'#name': 'name'}
             expression_attribute_values = {
                 ':name': {'S': customer_data['name']},
                 ':email': {'S': customer_data.get('email', '')},
                 ':phone': {'S': customer_data.get('phone', '')},
-                ':address': {'S': customer_data.get('address', '')}
+                ':address': {'S': customer_data.get('address', '')},
+                ':updated_at': {'S': datetime.now().isoformat()},
+                ':change_feed': {'S': CUSTOMER_CHANGE_FEED}
             }
             
             dynamodb.update_item(
@@ -145,12 +577,16 @@ class DynamoDBService:
                 ExpressionAttributeNames=expression_attribute_names,
                 ExpressionAttributeValues=expression_attribute_values
             )
+            identity_map.forget('customer', customer_id)
+            customer_cache.invalidate(customer_id)
+            customer_index.add(dict(customer_data, customer_id=customer_id))
             ErrorHandler.log_success("update_customer", customer_id)
             return True
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "update_customer", customer_id)
     
     @staticmethod
+    @aws_retry
     def delete_customer(customer_id):
         """Delete customer from DynamoDB"""
         try:
@@ -158,12 +594,16 @@ class DynamoDBService:
                 TableName=settings.DYNAMODB_CUSTOMERS_TABLE,
                 Key={'customer_id': {'S': customer_id}}
             )
+            identity_map.forget('customer', customer_id)
+            customer_cache.invalidate(customer_id)
+            customer_index.remove(customer_id)
             ErrorHandler.log_success("delete_customer", customer_id)
             return True
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "delete_customer", customer_id)
     
     @staticmethod
+    @aws_retry
     def add_transaction(transaction_data):
         """Add transaction to DynamoDB"""
         try:
@@ -176,13 +616,15 @@ class DynamoDBService:
                 except:
                     customer_name = None
             
+            created_at = datetime.now()
             item = {
                 'transaction_id': {'S': transaction_data['transaction_id']},
                 'customer_id': {'S': transaction_data['customer_id']},
                 'products': {'S': json.dumps(transaction_data['products'])},
                 'total_amount': {'N': str(transaction_data['total_amount'])},
                 'status': {'S': transaction_data.get('status', 'completed')},
-                'created_at': {'S': datetime.now().isoformat()}
+                'created_at': {'S': created_at.isoformat()},
+                'list_shard': {'S': DynamoDBService._list_shard(transaction_data['transaction_id'])}
             }
             
             # Add customer_name if available
@@ -193,14 +635,17 @@ class DynamoDBService:
                 TableName=settings.DYNAMODB_TRANSACTIONS_TABLE,
                 Item=item
             )
+            identity_map.forget('transaction', transaction_data['transaction_id'])
             ErrorHandler.log_success("add_transaction", transaction_data['transaction_id'])
             return True
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "add_transaction", "DynamoDB")
     
     @staticmethod
-    def get_transaction(transaction_id):
-        """Get transaction from DynamoDB"""
+    @identity_map.mapped('transaction')
+    @aws_retry
+    def _read_transaction(transaction_id):
+        """Get a transaction as stored, or None"""
         try:
             response = dynamodb.get_item(
                 TableName=settings.DYNAMODB_TRANSACTIONS_TABLE,
@@ -208,65 +653,143 @@ class DynamoDBService:
             )
             
             if 'Item' in response:
-                item = response['Item']
-                transaction = {
-                    'transaction_id': item['transaction_id']['S'],
-                    'customer_id': item['customer_id']['S'],
-                    'products': json.loads(item['products']['S']),
-                    'total_amount': float(item['total_amount']['N']),
-                    'status': item.get('status', {}).get('S', 'completed'),
-                    'created_at': item.get('created_at', {}).get('S', '')
-                }
-                
-                # Get customer_name if stored in transaction
-                if 'customer_name' in item:
-                    transaction['customer_name'] = item['customer_name']['S']
-                else:
-                    # Look up customer name if not stored
-                    try:
-                        customer = DynamoDBService.get_customer(transaction['customer_id'])
-                        transaction['customer_name'] = customer['name'] if customer else None
-                    except:
-                        transaction['customer_name'] = None
-                
-                return transaction
+                return DynamoDBService._transaction_from_item(response['Item'])
             return None
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "get_transaction", transaction_id)
     
+    @staticmethod
+    def get_transaction(transaction_id, resolve_customer_name=True):
+        """
+        Get transaction from DynamoDB.
+        
+        Transactions that don't store a customer_name get one from the customer
+        record, unless resolve_customer_name is False (the caller reads the
+        customer anyway).
+        """
+        transaction = DynamoDBService._read_transaction(transaction_id)
+        
+        if transaction and 'customer_name' not in transaction and resolve_customer_name:
+            # Look up customer name if not stored
+            try:
+                customer = DynamoDBService.get_customer(transaction['customer_id'])
+                transaction['customer_name'] = customer['name'] if customer else None
+            except:
+                transaction['customer_name'] = None
+        
+        return transaction
+    
+    @staticmethod
+    def iter_transactions(segments=None):
+        """Yield every transaction from DynamoDB (unsorted) without loading the whole table"""
+        try:
+            for item in DynamoDBService.scan_items(settings.DYNAMODB_TRANSACTIONS_TABLE, segments):
+                yield DynamoDBService._transaction_from_item(item)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "list_transactions", "DynamoDB")
+    
     @staticmethod
     def list_transactions():
         """List all transactions from DynamoDB"""
+        transactions = list(DynamoDBService.iter_transactions())
+        
+        # Sort by created_at descending
+        transactions.sort(key=lambda x: x['created_at'], reverse=True)
+        return transactions
+
+    @staticmethod
+    @aws_retry
+    def list_recent_transactions(limit, start_key=None):
+        """
+        List the newest transactions through the recent-transactions index.
+        
+        Each shard is read newest first, in parallel when there are several, and
+        the pages are merged. Returns (transactions, next_key); next_key holds
+        each shard's position and is None once every shard is exhausted, so
+        every transaction is reachable however old.
+        """
         try:
-            response = dynamodb.scan(TableName=settings.DYNAMODB_TRANSACTIONS_TABLE)
-            transactions = []
-            
-            for item in response.get('Items', []):
-                transaction = {
-                    'transaction_id': item['transaction_id']['S'],
-                    'customer_id': item['customer_id']['S'],
-                    'products': json.loads(item['products']['S']),
-                    'total_amount': float(item['total_amount']['N']),
-                    'status': item.get('status', {}).get('S', 'completed'),
-                    'created_at': item.get('created_at', {}).get('S', '')
+            if start_key:
+                positions = start_key['shards']
+            else:
+                positions = {str(shard): None for shard in range(settings.TRANSACTIONS_INDEX_SHARDS)}
+            
+            def read_shard(shard, position):
+                query_kwargs = {
+                    'TableName': settings.DYNAMODB_TRANSACTIONS_TABLE,
+                    'IndexName': settings.DYNAMODB_TRANSACTIONS_RECENT_INDEX,
+                    'KeyConditionExpression': 'list_shard = :shard',
+                    'ExpressionAttributeValues': {':shard': {'S': shard}},
+                    'ScanIndexForward': False,
+                    'Limit': limit
                 }
-                
-                # Get customer_name if stored in transaction
-                if 'customer_name' in item:
-                    transaction['customer_name'] = item['customer_name']['S']
-                
-                transactions.append(transaction)
+                if position:
+                    query_kwargs['ExclusiveStartKey'] = position
+                response = dynamodb.query(**query_kwargs)
+                return response.get('Items', []), response.get('LastEvaluatedKey')
             
-            # Sort by created_at descending
-            transactions.sort(key=lambda x: x['created_at'], reverse=True)
-            return transactions
+            if len(positions) == 1:
+                pages = {shard: read_shard(shard, position) for shard, position in positions.items()}
+            else:
+                with FanOut() as fan_out:
+                    pages = {shard: fan_out.submit(read_shard, shard, position) for shard, position in positions.items()}
+                pages = {shard: page.result() for shard, page in pages.items()}
+            
+            # Newest first across shards; each shard's page is already in that order
+            newest = heapq.merge(*([(item['created_at']['S'], shard, item) for item in items]
+                                   for shard, (items, _) in pages.items()), key=lambda entry: entry[0], reverse=True)
+            taken = [entry for _, entry in zip(range(limit), newest)]
+            
+            next_positions = {}
+            for shard, (items, last_key) in pages.items():
+                used = [item for _, item_shard, item in taken if item_shard == shard]
+                if len(used) < len(items):
+                    # Resume after the last row shown from this shard
+                    next_positions[shard] = DynamoDBService._recent_index_key(used[-1]) if used else positions[shard]
+                elif last_key:
+                    next_positions[shard] = last_key
+            
+            transactions = [DynamoDBService._transaction_from_item(item) for _, _, item in taken]
+            return transactions, {'shards': next_positions} if next_positions else None
         except Exception as e:
-            raise ErrorHandler.handle_aws_error(e, "list_transactions", "DynamoDB")
+            raise ErrorHandler.handle_aws_error(e, "list_recent_transactions", "DynamoDB")
+    
+    @staticmethod
+    def _recent_index_key(item):
+        """ExclusiveStartKey for the recent-transactions index that resumes after item"""
+        return {name: item[name] for name in ('transaction_id', 'list_shard', 'created_at')}
+    
+    @staticmethod
+    @aws_retry
+    def list_transactions_for_customer(customer_id, limit, start_key=None):
+        """List one customer's transactions, newest first. Returns (transactions, last_evaluated_key)"""
+        try:
+            query_kwargs = {
+                'TableName': settings.DYNAMODB_TRANSACTIONS_TABLE,
+                'IndexName': settings.DYNAMODB_TRANSACTIONS_CUSTOMER_INDEX,
+                'KeyConditionExpression': 'customer_id = :customer_id',
+                'ExpressionAttributeValues': {':customer_id': {'S': customer_id}},
+                'ScanIndexForward': False,
+                'Limit': limit
+            }
+            if start_key:
+                query_kwargs['ExclusiveStartKey'] = start_key
+            
+            response = dynamodb.query(**query_kwargs)
+            transactions = [DynamoDBService._transaction_from_item(item) for item in response.get('Items', [])]
+            return transactions, response.get('LastEvaluatedKey')
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "list_transactions_for_customer", customer_id)
 
 
 class S3Service:
     """Service for S3 operations"""
     
+    @staticmethod
+    def ensure_bucket():
+        """Create the bucket on first use in this process, then never again"""
+        ResourceRegistry.ensure('s3:bucket', S3Service.create_bucket)
+    
     @staticmethod
     def create_bucket():
         """Create S3 bucket if it doesn't exist"""
@@ -275,7 +798,6 @@ class S3Service:
             try:
                 s3.head_bucket(Bucket=settings.S3_BUCKET_NAME)
                 ErrorHandler.log_success("S3 bucket already exists", settings.S3_BUCKET_NAME)
-                return
             except s3.exceptions.ClientError as e:
                 error_code = e.response['Error']['Code']
                 if error_code == '404':
@@ -292,19 +814,187 @@ class S3Service:
                     ErrorHandler.log_success("S3 bucket exists (access verified)", settings.S3_BUCKET_NAME)
                 else:
                     raise
+            
+            ResourceRegistry.mark_ready('s3:bucket')
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "create_bucket", settings.S3_BUCKET_NAME)
     
     @staticmethod
-    def upload_image(file, filename):
+    def image_url(key):
+        """Public URL of an object in the bucket"""
+        return f"https://{settings.S3_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
+    
+    @staticmethod
+    def key_from_url(url):
+        """Object key of a URL from image_url(), or None for other URLs"""
+        prefix = S3Service.image_url('')
+        if url and url.startswith(prefix):
+            return url[len(prefix):]
+        return None
+    
+    _transfer_config = None
+    
+    @classmethod
+    def transfer_config(cls):
+        """Multipart settings for upload_fileobj, from the S3_* settings"""
+        if cls._transfer_config is None:
+            cls._transfer_config = TransferConfig(
+                multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+                multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+                max_concurrency=settings.S3_MAX_CONCURRENCY,
+                use_threads=settings.S3_MAX_CONCURRENCY > 1
+            )
+        return cls._transfer_config
+    
+    @staticmethod
+    def upload_image(file, filename, content_type=None, cache_control=None):
         """Upload product image to S3"""
         try:
-            s3.upload_fileobj(file, settings.S3_BUCKET_NAME, filename)
-            url = f"https://{settings.S3_BUCKET_NAME}.s3.{settings.AWS_REGION}.amazonaws.com/{filename}"
-            ErrorHandler.log_success("upload_image", filename)
+            extra_args = {}
+            if content_type:
+                extra_args['ContentType'] = content_type
+            if cache_control:
+                extra_args['CacheControl'] = cache_control
+            
+            start_position = file.tell()
+            started = time.perf_counter()
+            s3.upload_fileobj(file, settings.S3_BUCKET_NAME, filename, ExtraArgs=extra_args,
+                              Config=S3Service.transfer_config())
+            elapsed = time.perf_counter() - started
+            size = file.tell() - start_position
+            
+            url = S3Service.image_url(filename)
+            throughput = size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+            ErrorHandler.log_success("upload_image", f"{filename} ({size} bytes in {elapsed:.3f}s, {throughput:.2f} MB/s)")
             return url
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "upload_image", filename)
+    
+    @staticmethod
+    def object_exists(key):
+        """Check whether a key is already in the bucket with head_object"""
+        try:
+            s3.head_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
+            return True
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise ErrorHandler.handle_aws_error(e, "object_exists", key)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "object_exists", key)
+    
+    @staticmethod
+    def refresh_object(key, content_type=None, cache_control=None):
+        """
+        Copy a key onto itself so its LastModified is now, keeping the image
+        out of gc_images' grace period while it is re-used. Returns False if
+        the key doesn't exist.
+        """
+        try:
+            extra_args = {}
+            if content_type:
+                extra_args['ContentType'] = content_type
+            if cache_control:
+                extra_args['CacheControl'] = cache_control
+            s3.copy_object(Bucket=settings.S3_BUCKET_NAME, Key=key,
+                           CopySource={'Bucket': settings.S3_BUCKET_NAME, 'Key': key},
+                           MetadataDirective='REPLACE', **extra_args)
+            return True
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise ErrorHandler.handle_aws_error(e, "refresh_object", key)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "refresh_object", key)
+    
+    @staticmethod
+    def head_object(key):
+        """Object metadata from head_object, or None if the key doesn't exist"""
+        try:
+            return s3.head_object(Bucket=settings.S3_BUCKET_NAME, Key=key)
+        except s3.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise ErrorHandler.handle_aws_error(e, "head_object", key)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "head_object", key)
+    
+    @staticmethod
+    def download_bytes(key):
+        """Read a whole object into memory"""
+        try:
+            return s3.get_object(Bucket=settings.S3_BUCKET_NAME, Key=key)['Body'].read()
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "download_bytes", key)
+    
+    @staticmethod
+    def generate_presigned_post(key, max_bytes):
+        """
+        Presigned POST letting a browser upload one image straight to the bucket.
+        
+        The policy pins the key, caps the size and only accepts image content
+        types. Returns {'url': ..., 'fields': {...}}.
+        """
+        try:
+            return s3.generate_presigned_post(
+                Bucket=settings.S3_BUCKET_NAME,
+                Key=key,
+                Conditions=[
+                    ['content-length-range', 1, max_bytes],
+                    ['starts-with', '$Content-Type', 'image/']
+                ],
+                ExpiresIn=settings.S3_PRESIGNED_POST_EXPIRES
+            )
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "generate_presigned_post", key)
+    
+    @staticmethod
+    def configure_upload_cors():
+        """Allow browsers on S3_UPLOAD_CORS_ORIGINS to POST uploads to the bucket"""
+        try:
+            s3.put_bucket_cors(
+                Bucket=settings.S3_BUCKET_NAME,
+                CORSConfiguration={
+                    'CORSRules': [{
+                        'AllowedOrigins': settings.S3_UPLOAD_CORS_ORIGINS,
+                        'AllowedMethods': ['POST'],
+                        'AllowedHeaders': ['*'],
+                        'MaxAgeSeconds': 3000
+                    }]
+                }
+            )
+            ErrorHandler.log_success("configure_upload_cors", settings.S3_BUCKET_NAME)
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "configure_upload_cors", settings.S3_BUCKET_NAME)
+    
+    @staticmethod
+    def iter_objects(prefix):
+        """Yield {'Key', 'LastModified', 'Size', ...} for every object under a prefix"""
+        try:
+            paginator = s3.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=settings.S3_BUCKET_NAME, Prefix=prefix):
+                yield from page.get('Contents', [])
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "iter_objects", prefix)
+    
+    @staticmethod
+    def delete_objects(keys):
+        """Delete keys in batches of 1000 (the DeleteObjects limit). Returns the number deleted"""
+        try:
+            deleted = 0
+            keys = list(keys)
+            for start in range(0, len(keys), 1000):
+                response = s3.delete_objects(
+                    Bucket=settings.S3_BUCKET_NAME,
+                    Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+                )
+                for error in response.get('Errors', []):
+                    ErrorHandler.handle_aws_error(Exception(error.get('Message', '')), "delete_objects", error.get('Key', ''))
+                deleted += len(keys[start:start + 1000]) - len(response.get('Errors', []))
+            ErrorHandler.log_success("delete_objects", f"{deleted} objects")
+            return deleted
+        except Exception as e:
+            raise ErrorHandler.handle_aws_error(e, "delete_objects", settings.S3_BUCKET_NAME)
 
 
 class SNSService:
@@ -313,12 +1003,18 @@ class SNSService:
     _topic_arn = None
     
     @classmethod
+    @aws_retry
     def get_or_create_topic(cls):
         """Get or create SNS topic for transaction notifications"""
         try:
             if cls._topic_arn:
                 return cls._topic_arn
             
+            # A configured ARN needs no control-plane lookup
+            if settings.SNS_TOPIC_ARN:
+                cls._topic_arn = settings.SNS_TOPIC_ARN
+                return cls._topic_arn
+            
             topic_name = 'mypos-transaction-notifications'
             try:
                 # Try to find existing topic
@@ -339,6 +1035,7 @@ class SNSService:
             raise ErrorHandler.handle_aws_error(e, "get_or_create_topic", "SNS")
     
     @classmethod
+    @aws_retry_throttles
     def send_notification(cls, message, subject="Transaction Notification"):
         """Send transaction notification via SNS"""
         try:
@@ -384,34 +1081,35 @@ class SNSService:
 class CloudWatchService:
     """Service for CloudWatch metrics"""
     
-    @staticmethod
-    def put_transaction_metric(amount, transaction_id):
-        """Put transaction metric to CloudWatch"""
+    NAMESPACE = 'MyPOS/Transactions'
+    _aggregator = None
+    _aggregator_lock = threading.Lock()
+    
+    @classmethod
+    def get_aggregator(cls):
+        """Process-wide metric buffer, flushed every CLOUDWATCH_FLUSH_INTERVAL seconds"""
+        if cls._aggregator is None:
+            with cls._aggregator_lock:
+                if cls._aggregator is None:
+                    cls._aggregator = MetricsAggregator(cls._send_metric_data, settings.CLOUDWATCH_FLUSH_INTERVAL)
+        return cls._aggregator
+    
+    @classmethod
+    def _send_metric_data(cls, metric_data):
+        cloudwatch.put_metric_data(Namespace=cls.NAMESPACE, MetricData=metric_data)
+        ErrorHandler.log_success("put_metric_data", f"{len(metric_data)} datums")
+    
+    @classmethod
+    def put_transaction_metric(cls, amount):
+        """Record transaction metrics; they reach CloudWatch on the next flush"""
         try:
-            cloudwatch.put_metric_data(
-                Namespace='MyPOS/Transactions',
-                MetricData=[
-                    {
-                        'MetricName': 'TransactionAmount',
-                        'Value': amount,
-                        'Unit': 'None',
-                        'Timestamp': datetime.now(),
-                        'Dimensions': [
-                            {
-                                'Name': 'TransactionID',
-                                'Value': transaction_id
-                            }
-                        ]
-                    },
-                    {
-                        'MetricName': 'TransactionCount',
-                        'Value': 1,
-                        'Unit': 'Count',
-                        'Timestamp': datetime.now()
-                    }
-                ]
-            )
-            ErrorHandler.log_success("put_transaction_metric", transaction_id)
+            aggregator = cls.get_aggregator()
+            aggregator.record('TransactionAmount', float(amount))
+            aggregator.record('TransactionCount', 1, unit='Count')
         except Exception as e:
             raise ErrorHandler.handle_aws_error(e, "put_transaction_metric", "CloudWatch")
-
+    
+    @classmethod
+    def flush_metrics(cls):
+        """Send buffered metrics now"""
+        return cls.get_aggregator().flush()
@@ -0,0 +1,183 @@
+"""
+Per-request accounting of AWS calls
+Every call made while a request is traced is recorded with its operation,
+latency, retries and (for DynamoDB) consumed capacity. boto3 clients report
+through botocore event hooks, other backends through TracedClient.
+"""
+
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+
+# DynamoDB operations that accept ReturnConsumedCapacity
+CAPACITY_OPERATIONS = {
+    'GetItem', 'PutItem', 'UpdateItem', 'DeleteItem', 'Query', 'Scan',
+    'BatchGetItem', 'BatchWriteItem', 'TransactGetItems', 'TransactWriteItems'
+}
+
+_current = contextvars.ContextVar('pos_aws_calls', default=None)
+
+
+class AWSCall:
+    __slots__ = ('service', 'operation', 'elapsed', 'retries', 'capacity', 'error')
+
+    def __init__(self, service, operation, elapsed, retries=0, capacity=None, error=None):
+        self.service = service
+        self.operation = operation
+        self.elapsed = elapsed
+        self.retries = retries
+        self.capacity = capacity
+        self.error = error
+
+    def as_dict(self):
+        call = {'service': self.service, 'operation': self.operation,
+                'ms': round(self.elapsed * 1000, 2), 'retries': self.retries}
+        if self.capacity is not None:
+            call['capacity'] = self.capacity
+        if self.error:
+            call['error'] = self.error
+        return call
+
+
+class CallLog:
+    """The AWS calls of one request. Threads running in a copy of the request's context add to it too"""
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def add(self, call):
+        with self._lock:
+            self.calls.append(call)
+
+    @property
+    def elapsed(self):
+        return sum(call.elapsed for call in self.calls)
+
+    def by_service(self):
+        """{service: (calls, seconds)}"""
+        services = {}
+        for call in self.calls:
+            count, elapsed = services.get(call.service, (0, 0.0))
+            services[call.service] = (count + 1, elapsed + call.elapsed)
+        return services
+
+    def summary(self):
+        """Totals per service.operation, for logs"""
+        operations = {}
+        for call in self.calls:
+            entry = operations.setdefault(f'{call.service}.{call.operation}', {'calls': 0, 'ms': 0.0})
+            entry['calls'] += 1
+            entry['ms'] = round(entry['ms'] + call.elapsed * 1000, 2)
+            if call.retries:
+                entry['retries'] = entry.get('retries', 0) + call.retries
+            if call.capacity is not None:
+                entry['capacity'] = round(entry.get('capacity', 0) + call.capacity, 2)
+            if call.error:
+                entry['errors'] = entry.get('errors', 0) + 1
+        return operations
+
+
+def start():
+    """Trace the AWS calls of the current context. Returns (log, token for stop())"""
+    log = CallLog()
+    return log, _current.set(log)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    """The CallLog being recorded in this context, or None"""
+    return _current.get()
+
+
+def record(service, operation, elapsed, retries=0, capacity=None, error=None):
+    log = _current.get()
+    if log is not None:
+        log.add(AWSCall(service, operation, elapsed, retries, capacity, error))
+
+
+def _capacity_units(consumed):
+    """Total CapacityUnits of a ConsumedCapacity value (a dict, or a list for batch calls)"""
+    if not consumed:
+        return None
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    return sum(entry.get('CapacityUnits', 0) for entry in consumed)
+
+
+# botocore event hooks
+
+def _request_capacity(params, model, **kwargs):
+    if _current.get() is not None and model.name in CAPACITY_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+
+def _before_call(context, **kwargs):
+    if _current.get() is not None:
+        context['pos_started'] = time.perf_counter()
+
+
+def _after_call(parsed, model, context, **kwargs):
+    started = context.get('pos_started')
+    if started is None:
+        return
+    error = parsed.get('Error', {}).get('Code')
+    record(model.service_model.service_name, model.name, time.perf_counter() - started,
+           parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0),
+           _capacity_units(parsed.get('ConsumedCapacity')), error)
+
+
+def _after_call_error(exception, context, event_name, **kwargs):
+    # Connection errors and timeouts never reach after-call
+    started = context.get('pos_started')
+    if started is None:
+        return
+    _, service, operation = event_name.split('.', 2)
+    record(service, operation, time.perf_counter() - started, error=type(exception).__name__)
+
+
+def instrument(client):
+    """Register the accounting hooks on a boto3 client"""
+    events = client.meta.events
+    events.register('before-call', _before_call)
+    events.register('after-call', _after_call)
+    events.register('after-call-error', _after_call_error)
+    if client.meta.service_model.service_name == 'dynamodb' and settings.AWS_TRACE_CONSUMED_CAPACITY:
+        events.register('provide-client-params.dynamodb', _request_capacity)
+    return client
+
+
+class TracedClient:
+    """Records the calls made through a client that has no botocore events (the local DynamoDB engine)"""
+
+    def __init__(self, service, client):
+        self._service = service
+        self._client = client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr) or isinstance(attr, type):
+            return attr
+        operation = ''.join(part.title() for part in name.split('_'))
+
+        def call(*args, **kwargs):
+            if _current.get() is None:
+                return attr(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                response = attr(*args, **kwargs)
+            except Exception as e:
+                error = getattr(e, 'response', {}).get('Error', {}).get('Code') or type(e).__name__
+                record(self._service, operation, time.perf_counter() - started, error=error)
+                raise
+            record(self._service, operation, time.perf_counter() - started)
+            return response
+        return call
+
+    def __repr__(self):
+        return f"<TracedClient {self._client!r}>"
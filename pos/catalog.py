@@ -0,0 +1,102 @@
+"""
+In-memory product catalog for the checkout form
+A versioned snapshot of every Product, dropped whenever a product changes.
+Checkout itself prices and takes stock from locked rows (ProductManager.reserve_stock).
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from .models import Product
+
+VERSION_KEY = 'pos:catalog:version'
+
+
+class CatalogSnapshot:
+    """Products at one catalog version. Treat the instances as read-only"""
+
+    def __init__(self, version, fingerprint, products):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.products = products
+
+
+class ProductCatalog:
+    """
+    The product list served from memory.
+
+    The snapshot is dropped by post_save/post_delete signals in this process.
+    Every CATALOG_VERSION_CHECK_INTERVAL seconds it is also checked against
+    a version counter in the Django cache and a fingerprint of the products
+    table (latest updated_at, row count, total stock). The fingerprint
+    catches changes made by other processes even when the cache is
+    per-process, and stock updates, which skip post_save.
+    """
+
+    def __init__(self, cache_alias=None, check_interval=None):
+        self.cache_alias = cache_alias or settings.CATALOG_CACHE_ALIAS
+        self.check_interval = settings.CATALOG_VERSION_CHECK_INTERVAL if check_interval is None else check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def snapshot(self):
+        """The current snapshot, reloaded if a product changed"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at >= self.check_interval:
+            self._checked_at = time.monotonic()
+            if self._shared_version() != snapshot.version or self._fingerprint() != snapshot.fingerprint:
+                self._snapshot = snapshot = None
+
+        if snapshot is None:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != self._shared_version():
+                    snapshot = self._load()
+        return snapshot
+
+    def all(self):
+        """All products, newest first"""
+        return self.snapshot().products
+
+    def invalidate(self):
+        """Drop the snapshot here and tell other processes to drop theirs"""
+        self._snapshot = None
+        try:
+            self.cache.incr(VERSION_KEY)
+        except ValueError:
+            self.cache.add(VERSION_KEY, 1, timeout=None)
+
+    def _shared_version(self):
+        return self.cache.get(VERSION_KEY, 0)
+
+    @staticmethod
+    def _fingerprint():
+        """Changes whenever a product is added, edited, deleted or sold, whichever process did it"""
+        return tuple(Product.objects.aggregate(Max('updated_at'), Count('id'), Sum('quantity')).values())
+
+    def _load(self):
+        # Read the version and fingerprint first so a change during the query triggers another reload
+        version = self._shared_version()
+        fingerprint = self._fingerprint()
+        snapshot = CatalogSnapshot(version, fingerprint, list(Product.objects.all().order_by('-created_at')))
+        self._snapshot = snapshot
+        self._checked_at = time.monotonic()
+        return snapshot
+
+
+catalog = ProductCatalog()
+
+
+def invalidate_catalog(sender, **kwargs):
+    """post_save/post_delete receiver: drop the catalog once the change is committed"""
+    transaction.on_commit(catalog.invalidate)
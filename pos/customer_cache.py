@@ -0,0 +1,168 @@
+"""
+Read-through cache for customer records
+Lookups go to a small in-process LRU first, then the Django cache when it is
+shared between processes, then DynamoDB. Customer writes drop the entries
+they touch.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+KEY_PREFIX = 'pos:customer:'
+
+_MISSING = object()
+
+# Backends whose entries other processes can't see (or drop), so their invalidations don't reach them either
+_PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+class LRUCache:
+    """A bounded, thread-safe map whose entries expire after their TTL"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CustomerCache:
+    """
+    Customers, cached in two levels.
+
+    Entries live CUSTOMER_CACHE_TTL seconds in the Django cache and at most CUSTOMER_CACHE_LOCAL_TTL seconds
+    in the local LRU, which bounds how stale another process's copy can be
+    after a write. The Django cache is only used when its backend is shared
+    (not local-memory or dummy): otherwise another process's write would go
+    unseen for the full TTL. Customers that don't exist are cached for at
+    most CUSTOMER_CACHE_MISS_TTL seconds. A TTL of 0 turns that level off.
+
+    A load that overlaps an invalidation in this process isn't stored, so a
+    record read before a write can't be cached after it.
+    """
+
+    def __init__(self, cache_alias=None):
+        self.cache_alias = cache_alias or settings.CUSTOMER_CACHE_ALIAS
+        self.local = LRUCache(settings.CUSTOMER_CACHE_LOCAL_SIZE)
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    @property
+    def shared(self):
+        """Whether the Django cache is seen by every process"""
+        return not isinstance(self.cache, _PROCESS_LOCAL_BACKENDS)
+
+    def get_customer(self, customer_id, load):
+        """The customer (or None), from the cache or from load(customer_id)"""
+        customer = self._read(KEY_PREFIX + customer_id, 'customer', lambda: load(customer_id),
+                              settings.CUSTOMER_CACHE_TTL)
+        return dict(customer) if customer is not None else None
+
+    def invalidate(self, customer_id):
+        """Drop a customer that was just written"""
+        key = KEY_PREFIX + customer_id
+        with self._lock:
+            self._generation += 1
+            self._count('invalidations')
+        self.local.delete(key)
+        if self.shared:
+            self.cache.delete(key)
+
+    def clear(self):
+        """Forget everything this process has cached locally"""
+        with self._lock:
+            self._generation += 1
+        self.local.clear()
+
+    def stats(self):
+        """Hit and miss counters per level and kind, for tuning the TTLs"""
+        with self._lock:
+            counts = dict(self._counts)
+        return {'shared': self.shared, 'local_entries': len(self.local), 'local_max_size': self.local.max_size,
+                'counts': counts}
+
+    def _count(self, name):
+        self._counts[name] = self._counts.get(name, 0) + 1
+
+    def _read(self, key, kind, load, ttl):
+        if ttl <= 0:
+            return load()
+        local_ttl = min(ttl, settings.CUSTOMER_CACHE_LOCAL_TTL)
+        shared = self.shared
+
+        # Cached values are wrapped in a tuple so a cached None (no such customer) is told apart from a miss
+        if local_ttl > 0:
+            entry = self.local.get(key, _MISSING)
+            if entry is not _MISSING:
+                with self._lock:
+                    self._count(f'{kind}_local_hits')
+                return entry[0]
+
+        entry = self.cache.get(key, _MISSING) if shared else _MISSING
+        if entry is not _MISSING:
+            with self._lock:
+                self._count(f'{kind}_shared_hits')
+            if local_ttl > 0:
+                self.local.set(key, entry, local_ttl)
+            return entry[0]
+
+        with self._lock:
+            self._count(f'{kind}_misses')
+            generation = self._generation
+        value = load()
+        entry = (value,)
+        with self._lock:
+            if generation != self._generation:
+                return value
+        if value is None:
+            # A customer added by another process shouldn't stay "not found" for long
+            ttl = min(ttl, settings.CUSTOMER_CACHE_MISS_TTL)
+            local_ttl = min(local_ttl, settings.CUSTOMER_CACHE_MISS_TTL)
+        if shared and ttl > 0:
+            self.cache.set(key, entry, ttl)
+        if local_ttl > 0:
+            self.local.set(key, entry, local_ttl)
+        return value
+
+
+customer_cache = CustomerCache()
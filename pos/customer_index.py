@@ -0,0 +1,375 @@
+"""
+In-process search index over customers for the checkout typeahead
+Customers are found by a prefix of any word of their name, their email or
+its local part, or their phone digits, and failing that by a substring of
+at least three characters (through trigrams). The index is filled from a
+DynamoDB scan, page by page, kept current by this process's customer writes,
+and caught up with other processes' through the customer changes index.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'[^\W_]+')
+_PHONE = re.compile(r'^[\d\s()+.-]+$')
+
+# Seconds before retrying a scan that failed before the index was ever built
+_RETRY_DELAY = 10
+
+
+def _terms(customer):
+    """(prefix terms, substring haystack) of a customer"""
+    name = customer.get('name', '').casefold()
+    email = customer.get('email', '').casefold()
+    phone = re.sub(r'\D', '', customer.get('phone', ''))
+
+    terms = set(_WORD.findall(name))
+    if email:
+        terms.add(email)
+        terms.add(email.split('@', 1)[0])
+    if phone:
+        terms.add(phone)
+    # One string, so a substring check is a single `in`; no query contains the separator
+    haystack = '\0'.join(part for part in (name, email, phone) if part)
+    return frozenset(terms), haystack
+
+
+def _grams(haystack):
+    return {part[i:i + 3] for part in haystack.split('\0') for i in range(len(part) - 2)}
+
+
+def _discard(pairs, pair):
+    """Remove pair from a sorted list if it's there"""
+    i = bisect.bisect_left(pairs, pair)
+    if i < len(pairs) and pairs[i] == pair:
+        del pairs[i]
+
+
+def _overlapped(moment):
+    """ISO timestamp CUSTOMER_INDEX_CHANGE_OVERLAP seconds before moment, as customer writes store them"""
+    return (moment - timedelta(seconds=settings.CUSTOMER_INDEX_CHANGE_OVERLAP)).isoformat()
+
+
+def _query_words(query):
+    query = query.strip().casefold()
+    if _PHONE.match(query) and any(ch.isdigit() for ch in query):
+        return [re.sub(r'\D', '', query)]
+    words = _WORD.findall(query)
+    if '@' in query:
+        # An email is matched whole rather than word by word
+        words = [query]
+    return words
+
+
+class CustomerIndex:
+    """
+    Customer summaries (id, name, email, phone) searchable by prefix.
+
+    The first search starts a background scan; results are served from
+    whatever has been indexed so far (prefix terms are merged in a few times
+    per scan, so they lag a little behind), and `complete` says whether a
+    scan has finished. Every CUSTOMER_INDEX_REFRESH_INTERVAL seconds the
+    customers other processes added or edited since the last check are read
+    from the changes index; a full rescan, which also drops customers they
+    deleted, only runs every CUSTOMER_INDEX_RESCAN_INTERVAL seconds if that
+    is set. A customer written in this process during a scan keeps the
+    written version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._customers = {}   # customer_id: summary
+        self._entries = {}     # customer_id: (terms, haystack)
+        self._terms = []       # sorted (term, customer_id)
+        self._term_log = None  # (inserted, pair) changes to _terms while a merge is built outside the lock
+        self._grams = {}       # trigram: {customer_id}
+        self._names = {}       # customer_id: casefolded name, for ordering results
+        self._built_at = None
+        self._scan_started_at = None
+        self._refreshed_at = None
+        self._changes_since = None  # ISO timestamp the next changes query starts from
+        self._written = None   # ids written during the running scan
+
+    @property
+    def complete(self):
+        return self._built_at is not None
+
+    def __len__(self):
+        return len(self._customers)
+
+    def add(self, customer):
+        """Index a customer that was just written (added or updated)"""
+        with self._lock:
+            if self._written is not None:
+                self._written.add(customer['customer_id'])
+            self._upsert(customer)
+
+    def remove(self, customer_id):
+        """Drop a customer that was just deleted"""
+        with self._lock:
+            if self._written is not None:
+                self._written.add(customer_id)
+            self._remove(customer_id)
+
+    def search(self, query, limit=10):
+        """Up to limit customer summaries matching query, best matches first"""
+        self.refresh_in_background()
+        words = _query_words(query)
+        if not words or limit < 1:
+            return []
+        with self._lock:
+            found = self._prefix_matches(words, limit)
+            if len(found) < limit:
+                seen = set(found)
+                found += [customer_id for customer_id in self._substring_matches(words, limit)
+                          if customer_id not in seen][:limit - len(found)]
+            return [dict(self._customers[customer_id]) for customer_id in found]
+
+    def refresh_in_background(self):
+        """Start a scan if the index was never built, or a catch-up or rescan if one is due"""
+        now = time.monotonic()
+        if self._built_at is None:
+            if self._scan_started_at is not None and now - self._scan_started_at < _RETRY_DELAY:
+                return
+            work = self._scan
+        elif settings.CUSTOMER_INDEX_RESCAN_INTERVAL and now - self._built_at >= settings.CUSTOMER_INDEX_RESCAN_INTERVAL:
+            work = self._scan
+        elif now - self._refreshed_at >= settings.CUSTOMER_INDEX_REFRESH_INTERVAL:
+            work = self._catch_up
+        else:
+            return
+        if not self._scan_lock.acquire(blocking=False):
+            return
+        threading.Thread(target=self._in_background, args=(work,), name='customer-index', daemon=True).start()
+
+    def rebuild(self, customers=None):
+        """
+        Scan every customer (from DynamoDB unless given) into the index, then
+        drop the ones the scan didn't see. Blocks until done.
+        """
+        with self._scan_lock:
+            self._scan(customers)
+
+    def _in_background(self, work):
+        # Runs with _scan_lock held by refresh_in_background
+        try:
+            work()
+        except Exception as e:
+            logger.warning("Customer index refresh failed: %s", e)
+        finally:
+            self._scan_lock.release()
+
+    def _scan(self, customers=None):
+        if customers is None:
+            from .aws_services import DynamoDBService
+            customers = DynamoDBService.iter_customers()
+
+        self._scan_started_at = time.monotonic()
+        # Taken before reading, so changes made during the scan are caught up afterwards
+        changes_since = _overlapped(datetime.now())
+        self._ingest(customers, drop_unseen=True)
+        self._changes_since = max(self._changes_since or '', changes_since)
+        self._built_at = self._refreshed_at = time.monotonic()
+
+    def _catch_up(self):
+        """Index the customers changed since the last scan or catch-up"""
+        from .aws_services import DynamoDBService
+
+        self._refreshed_at = time.monotonic()
+        since = newest = self._changes_since
+
+        def changed():
+            nonlocal newest
+            # Oldest change first, so the last one seen is the newest
+            for customer in DynamoDBService.iter_customers_changed_since(since):
+                newest = customer['updated_at']
+                yield customer
+
+        self._ingest(changed(), drop_unseen=False)
+        if newest != since:
+            # Re-read a little before the newest change next time: a slower clock may still write behind it
+            self._changes_since = max(since, _overlapped(datetime.fromisoformat(newest)))
+
+    def _ingest(self, customers, drop_unseen):
+        """Index customers batch by batch; with drop_unseen, then drop every customer they didn't include"""
+        with self._lock:
+            self._written = set()
+        pending = []
+        try:
+            seen = set()
+            batch = []
+            for customer in customers:
+                batch.append(customer)
+                if len(batch) >= settings.CUSTOMER_INDEX_BATCH_SIZE:
+                    pending += self._apply(batch, seen)
+                    batch = []
+                    # Merging once pending is a quarter of the list keeps the whole build O(n log n)
+                    if len(pending) * 4 >= len(self._terms):
+                        self._merge(pending)
+                        pending = []
+            pending += self._apply(batch, seen)
+            self._merge(pending)
+            pending = []
+
+            if drop_unseen:
+                with self._lock:
+                    for customer_id in set(self._customers) - seen - self._written:
+                        self._remove(customer_id)
+        finally:
+            # Customers already indexed need their terms even if the scan failed; a rescan sees them unchanged
+            self._merge(pending)
+            with self._lock:
+                self._written = None
+
+    def _apply(self, customers, seen):
+        """Index a batch of scanned customers; returns their (term, id) pairs for _merge"""
+        added = []
+        with self._lock:
+            for customer in customers:
+                customer_id = customer['customer_id']
+                seen.add(customer_id)
+                if customer_id in self._written:
+                    continue
+                added.extend(self._upsert(customer, insert_terms=False))
+        return added
+
+    def _merge(self, pairs):
+        """
+        Add (term, id) pairs to the term list. The new list is sorted outside
+        the lock, so searches and writes carry on; the writes made meanwhile
+        are logged and replayed onto it before it is swapped in.
+        """
+        if not pairs:
+            return
+        pairs.sort()
+        with self._lock:
+            merged = self._terms + [pair for pair in pairs if self._pending(pair)]
+            self._term_log = []
+        # Both halves are sorted runs, which sort() merges in a single pass
+        merged.sort()
+        with self._lock:
+            for inserted, pair in self._term_log:
+                if inserted:
+                    bisect.insort(merged, pair)
+                else:
+                    _discard(merged, pair)
+            self._terms = merged
+            self._term_log = None
+
+    def _pending(self, pair):
+        """Whether a pair from _apply still belongs in the term list and isn't in it yet"""
+        term, customer_id = pair
+        entry = self._entries.get(customer_id)
+        if entry is None or term not in entry[0]:
+            return False
+        if self._written and customer_id in self._written:
+            i = bisect.bisect_left(self._terms, pair)
+            return i == len(self._terms) or self._terms[i] != pair
+        return True
+
+    def _upsert(self, customer, insert_terms=True):
+        """Index a customer; returns the (term, id) pairs to insert when insert_terms is False"""
+        customer_id = customer['customer_id']
+        self._customers[customer_id] = {
+            'customer_id': customer_id,
+            'name': customer.get('name', ''),
+            'email': customer.get('email', ''),
+            'phone': customer.get('phone', '')
+        }
+        self._names[customer_id] = customer.get('name', '').casefold()
+        entry = _terms(customer)
+        old = self._entries.get(customer_id)
+        if old == entry:
+            return []
+        if old is not None:
+            self._unindex(customer_id, old)
+        self._entries[customer_id] = entry
+
+        terms, haystack = entry
+        for gram in _grams(haystack):
+            self._grams.setdefault(gram, set()).add(customer_id)
+        pairs = [(term, customer_id) for term in terms]
+        if not insert_terms:
+            return pairs
+        for pair in pairs:
+            bisect.insort(self._terms, pair)
+            if self._term_log is not None:
+                self._term_log.append((True, pair))
+        return []
+
+    def _remove(self, customer_id):
+        self._customers.pop(customer_id, None)
+        self._names.pop(customer_id, None)
+        entry = self._entries.pop(customer_id, None)
+        if entry is not None:
+            self._unindex(customer_id, entry)
+
+    def _unindex(self, customer_id, entry):
+        terms, haystack = entry
+        for term in terms:
+            _discard(self._terms, (term, customer_id))
+            if self._term_log is not None:
+                self._term_log.append((False, (term, customer_id)))
+        for gram in _grams(haystack):
+            ids = self._grams.get(gram)
+            if ids is not None:
+                ids.discard(customer_id)
+                if not ids:
+                    del self._grams[gram]
+
+    def _prefixed(self, word):
+        """(ids with a term starting with word in term order, number of such terms)"""
+        start = bisect.bisect_left(self._terms, (word, ''))
+        end = bisect.bisect_left(self._terms, (word + '\U0010ffff', ''), start)
+        return (self._terms[i][1] for i in range(start, end)), end - start
+
+    def _prefix_matches(self, words, limit):
+        if len(words) == 1:
+            found = []
+            for customer_id in self._prefixed(words[0])[0]:
+                if customer_id not in found:
+                    found.append(customer_id)
+                    if len(found) >= limit:
+                        break
+            return found
+        # Candidates come from the word with the fewest terms; every other word must start one of their terms too
+        ranges = [(self._prefixed(word), word) for word in words]
+        (candidates, _), narrowest = min(ranges, key=lambda entry: entry[0][1])
+        others = [word for word in words if word != narrowest]
+        found = set()
+        for customer_id in candidates:
+            if customer_id not in found:
+                terms = self._entries[customer_id][0]
+                if all(any(term.startswith(word) for term in terms) for word in others):
+                    found.add(customer_id)
+        return heapq.nsmallest(limit, found, key=self._names.__getitem__)
+
+    def _substring_matches(self, words, limit):
+        grams = _grams('\0'.join(words))
+        if not grams:
+            return []
+        # Rarest trigrams first, so the candidate set is small from the start
+        postings = sorted((self._grams.get(gram, set()) for gram in grams), key=len)
+        ids = set(postings[0])
+        for posting in postings[1:]:
+            if not ids:
+                return []
+            ids &= posting
+        if any(len(word) != 3 for word in words):
+            # Trigrams only narrow it down; the whole words must still appear
+            ids = [customer_id for customer_id in ids
+                   if all(word in self._entries[customer_id][1] for word in words)]
+        return heapq.nsmallest(limit, ids, key=self._names.__getitem__)
+
+
+customer_index = CustomerIndex()
@@ -0,0 +1,80 @@
+"""
+Running a request's independent lookups side by side
+A view submits the calls that don't depend on each other and keeps working
+on the request thread, so the page waits for the slowest round trip instead
+of the sum of them.
+"""
+
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def fanout_executor():
+    """Threads shared by every request's FanOut"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.POS_FANOUT_WORKERS,
+                                               thread_name_prefix='fanout')
+    return _executor
+
+
+def _run(func, args, kwargs):
+    _local.worker = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _local.worker = False
+        # A lookup that touched the ORM opened a connection on this pool thread, which no request_finished will close
+        close_old_connections()
+
+
+class FanOut:
+    """
+    Calls made on behalf of one request, run on the shared pool.
+
+        with FanOut() as fan_out:
+            customer = fan_out.submit(DynamoDBService.get_customer, customer_id)
+            reserved, products_by_id = reserve_basket(basket)
+        customer = customer.result()
+
+    Each call runs in a copy of the request's context, so its AWS calls are
+    accounted to the request. Leaving the block waits for every call; if the
+    block raised, calls that haven't started are cancelled. Calls submitted
+    from a pool thread run inline, so nested fan-outs can't exhaust the pool.
+    """
+
+    def __init__(self):
+        self._futures = []
+
+    def submit(self, func, *args, **kwargs):
+        if getattr(_local, 'worker', False):
+            future = Future()
+            try:
+                future.set_result(func(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        context = contextvars.copy_context()
+        future = fanout_executor().submit(context.run, _run, func, args, kwargs)
+        self._futures.append(future)
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for future in self._futures:
+                future.cancel()
+        wait(self._futures)
+        return False
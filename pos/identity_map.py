@@ -0,0 +1,103 @@
+"""
+Request-scoped identity map for DynamoDB reads
+While a request is mapped (RequestIdentityMapMiddleware), each customer and
+transaction is read from DynamoDB at most once; later reads of the same key
+in that request, from any thread running in a copy of its context, reuse
+the first result. Writes drop the key so the next read sees the change.
+"""
+
+import contextvars
+import functools
+import threading
+
+_current = contextvars.ContextVar('pos_identity_map', default=None)
+
+MISSING = object()
+
+
+class IdentityMap:
+    """Records read during one request, by (kind, key). Absent records are kept as None"""
+
+    def __init__(self):
+        self._records = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind, key):
+        """The record, None if it doesn't exist, or MISSING if it hasn't been read"""
+        with self._lock:
+            record = self._records.get((kind, key), MISSING)
+            if record is MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return record
+
+    def put(self, kind, key, record):
+        with self._lock:
+            self._records[(kind, key)] = record
+
+    def discard(self, kind, key):
+        with self._lock:
+            self._records.pop((kind, key), None)
+
+
+def start():
+    """Map the reads of the current context. Returns (map, token for stop())"""
+    identity = IdentityMap()
+    return identity, _current.set(identity)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def current():
+    """The IdentityMap of this context, or None"""
+    return _current.get()
+
+
+def _copy(record):
+    # Views decorate the dicts they get back, which mustn't leak into later reads
+    return dict(record) if isinstance(record, dict) else record
+
+
+def mapped(kind):
+    """Serve a single-key read (key as the first argument) from the request's identity map"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(key, *args, **kwargs):
+            identity = _current.get()
+            if identity is None:
+                return func(key, *args, **kwargs)
+            record = identity.get(kind, key)
+            if record is MISSING:
+                record = func(key, *args, **kwargs)
+                identity.put(kind, key, _copy(record))
+                return record
+            return _copy(record)
+        return wrapper
+    return decorator
+
+
+def remember(kind, key, record):
+    """Add a record read some other way (e.g. in a batch) to the request's map"""
+    identity = _current.get()
+    if identity is not None:
+        identity.put(kind, key, _copy(record))
+
+
+def recall(kind, key):
+    """A record already read in this request, None if it doesn't exist, or MISSING"""
+    identity = _current.get()
+    if identity is None:
+        return MISSING
+    return _copy(identity.get(kind, key))
+
+
+def forget(kind, key):
+    """Drop a record the request has just written"""
+    identity = _current.get()
+    if identity is not None:
+        identity.discard(kind, key)
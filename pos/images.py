@@ -0,0 +1,202 @@
+"""
+Product image pipeline
+Uploads are decoded once, stripped of EXIF, resized into JPEG and WebP
+variants and uploaded to S3 in parallel, all off the request thread.
+Keys are derived from the upload's SHA-256, so identical images are
+stored once and never uploaded twice.
+"""
+
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from error_handler.error_handler import ErrorHandler
+from .aws_services import S3Service
+from .catalog import catalog
+from .models import Product
+
+# (format, extension, content type, save options)
+IMAGE_FORMATS = [
+    ('JPEG', 'jpg', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+    ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+]
+
+# Refuse decompression bombs before they are decoded
+Image.MAX_IMAGE_PIXELS = settings.PRODUCT_IMAGE_MAX_PIXELS
+
+
+def read_upload(file):
+    """
+    Read an uploaded image into memory after cheap checks on the request thread.
+
+    Only the size and the image header are checked here; decoding happens
+    in the pipeline.
+    """
+    if file.size > settings.PRODUCT_IMAGE_MAX_UPLOAD_BYTES:
+        limit_mb = settings.PRODUCT_IMAGE_MAX_UPLOAD_BYTES // (1024 * 1024)
+        raise ErrorHandler.handle_validation_error(f"Image is too large (max {limit_mb} MB)", "image")
+
+    data = file.read()
+    check_image(data)
+    return data
+
+
+def check_image(data):
+    """Reject data whose header isn't a supported image format"""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, Image.DecompressionBombError):
+        raise ErrorHandler.handle_validation_error("Uploaded file is not a supported image", "image")
+    if image_format not in ('JPEG', 'PNG', 'WEBP', 'GIF'):
+        raise ErrorHandler.handle_validation_error(f"Unsupported image format: {image_format}", "image")
+
+
+def attach_uploaded_image(product, key):
+    """
+    Record an image the browser uploaded straight to S3 and queue its variants.
+
+    The key must be one handed out by the presign endpoint and the object
+    must exist and be within the upload size limit.
+    """
+    if not key or not key.startswith(settings.S3_UPLOAD_PREFIX) or '/' in key[len(settings.S3_UPLOAD_PREFIX):]:
+        raise ErrorHandler.handle_validation_error("Invalid upload key", "image")
+
+    head = S3Service.head_object(key)
+    if head is None:
+        raise ErrorHandler.handle_validation_error("Uploaded image not found", "image")
+    if head['ContentLength'] > settings.PRODUCT_IMAGE_MAX_UPLOAD_BYTES:
+        raise ErrorHandler.handle_validation_error("Image is too large", "image")
+
+    # Show the original until the variants are ready
+    product.s3_image_url = S3Service.image_url(key)
+    product.save(update_fields=['s3_image_url', 'updated_at'])
+    ImagePipeline.submit_uploaded(product.id, key)
+
+
+def image_key(digest, variant, extension):
+    """Content-addressed key of one variant of the image with this SHA-256"""
+    max_side = settings.PRODUCT_IMAGE_VARIANTS[variant]
+    return f"{settings.S3_IMAGE_PREFIX}{digest[:2]}/{digest}/{variant}-{max_side}.{extension}"
+
+
+def build_variants(data):
+    """
+    Decode the image once and encode every size in PRODUCT_IMAGE_VARIANTS.
+
+    Yields (variant, extension, content_type, bytes) as each one is encoded.
+    Orientation from EXIF is applied to the pixels and the metadata itself
+    is not written out.
+    """
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    # Largest first, so each smaller size is resampled from the previous one
+    for name, max_side in sorted(settings.PRODUCT_IMAGE_VARIANTS.items(), key=lambda item: -item[1]):
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+        for image_format, extension, content_type, options in IMAGE_FORMATS:
+            encoded = image.convert('RGB') if image_format == 'JPEG' and image.mode != 'RGB' else image
+            buffer = BytesIO()
+            encoded.save(buffer, image_format, **options)
+            yield name, extension, content_type, buffer.getvalue()
+
+
+class ImagePipeline:
+    """Background processing of product image uploads"""
+
+    _executor = None
+    _upload_executor = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def _executors(cls):
+        if cls._executor is None:
+            with cls._lock:
+                if cls._executor is None:
+                    cls._upload_executor = ThreadPoolExecutor(
+                        max_workers=settings.PRODUCT_IMAGE_UPLOAD_WORKERS, thread_name_prefix='image-upload')
+                    cls._executor = ThreadPoolExecutor(
+                        max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='image-pipeline')
+        return cls._executor, cls._upload_executor
+
+    @classmethod
+    def submit(cls, product_id, data):
+        """Process an upload in the background; the product is updated when done"""
+        executor, _ = cls._executors()
+        return executor.submit(cls.process, product_id, data)
+
+    @classmethod
+    def submit_uploaded(cls, product_id, key):
+        """Process an image already uploaded to S3 under key, then delete the staged original"""
+        executor, _ = cls._executors()
+        return executor.submit(cls._process_uploaded, product_id, key)
+
+    @classmethod
+    def _process_uploaded(cls, product_id, key):
+        try:
+            data = S3Service.download_bytes(key)
+            check_image(data)
+        except Exception as e:
+            ErrorHandler.handle_aws_error(e, "process_uploaded_image", key)
+            raise
+        image_variants = cls.process(product_id, data)
+        S3Service.delete_objects([key])
+        return image_variants
+
+    @classmethod
+    def process(cls, product_id, data):
+        """Build the variants, upload the ones S3 doesn't have yet and record their URLs on the product"""
+        try:
+            S3Service.ensure_bucket()
+            _, upload_executor = cls._executors()
+            digest = hashlib.sha256(data).hexdigest()
+
+            keys = {}
+            content_types = {}
+            for name in settings.PRODUCT_IMAGE_VARIANTS:
+                for _, extension, content_type, _ in IMAGE_FORMATS:
+                    keys[(name, extension)] = image_key(digest, name, extension)
+                    content_types[(name, extension)] = content_type
+
+            # Same key means same bytes, so anything already stored is skipped. It may be an
+            # orphan gc_images is about to collect, so it is refreshed rather than just checked
+            exists = {variant: upload_executor.submit(S3Service.refresh_object, key, content_types[variant],
+                                                      settings.S3_IMAGE_CACHE_CONTROL)
+                      for variant, key in keys.items()}
+            missing = {variant for variant, future in exists.items() if not future.result()}
+
+            if missing:
+                uploads = []
+                for name, extension, content_type, body in build_variants(data):
+                    if (name, extension) in missing:
+                        uploads.append(upload_executor.submit(
+                            S3Service.upload_image, BytesIO(body), keys[(name, extension)],
+                            content_type, settings.S3_IMAGE_CACHE_CONTROL))
+                for future in uploads:
+                    future.result()
+
+            image_variants = {}
+            for (name, extension), key in keys.items():
+                image_variants.setdefault(name, {})[extension] = S3Service.image_url(key)
+
+            largest = max(settings.PRODUCT_IMAGE_VARIANTS, key=settings.PRODUCT_IMAGE_VARIANTS.get)
+            Product.objects.filter(id=product_id).update(
+                s3_image_url=image_variants[largest]['jpg'],
+                image_variants=image_variants
+            )
+            # update() skips post_save, so drop the catalog snapshot ourselves
+            catalog.invalidate()
+            ErrorHandler.log_success("process_product_image", f"product {product_id} ({len(missing)} of {len(keys)} variants uploaded)")
+            return image_variants
+        except Exception as e:
+            ErrorHandler.handle_aws_error(e, "process_product_image", f"product {product_id}")
+            raise
+        finally:
+            close_old_connections()
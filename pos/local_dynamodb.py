@@ -0,0 +1,573 @@
+"""
+In-process DynamoDB engine for MyPOS
+Implements the part of the boto3 DynamoDB client API that DynamoDBService
+uses on top of SQLite, so the app can run and be load-tested without AWS.
+Select it with DYNAMODB_BACKEND = 'local'.
+"""
+
+import json
+import re
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+# DynamoDB returns at most 1 MB of items per Scan/Query page
+MAX_PAGE_BYTES = 1024 * 1024
+MAX_BATCH_GET_KEYS = 100
+MAX_BATCH_WRITE_ITEMS = 25
+
+_NAME = r'\#?[A-Za-z_]\w*'
+_VALUE = r':\w+'
+_KEY_CONDITION = re.compile(rf'''\s*(?:
+    begins_with\s*\(\s*(?P<prefix_name>{_NAME})\s*,\s*(?P<prefix_value>{_VALUE})\s*\)
+  | (?P<between_name>{_NAME})\s+BETWEEN\s+(?P<low>{_VALUE})\s+AND\s+(?P<high>{_VALUE})
+  | (?P<name>{_NAME})\s*(?P<op><=|>=|=|<|>)\s*(?P<value>{_VALUE})
+)\s*''', re.IGNORECASE | re.VERBOSE)
+_AND = re.compile(r'AND\b', re.IGNORECASE)
+_UPDATE_CLAUSE = re.compile(r'\s*(SET|REMOVE)\s+', re.IGNORECASE)
+_ASSIGNMENT = re.compile(rf'^\s*({_NAME})\s*=\s*({_VALUE})\s*$')
+
+
+class _Exceptions:
+    """client.exceptions look-alike: one ClientError subclass per error code"""
+
+    ClientError = ClientError
+
+    def __getattr__(self, code):
+        if not code[:1].isupper():
+            raise AttributeError(code)
+        exception_class = type(code, (ClientError,), {})
+        setattr(self, code, exception_class)
+        return exception_class
+
+
+class _Table:
+    """Schema of one table and the SQLite tables holding it"""
+
+    def __init__(self, description):
+        self.description = description
+        self.name = description['TableName']
+        self.hash_key, self.range_key = _key_names(description['KeySchema'])
+        self.indexes = {
+            index['IndexName']: _key_names(index['KeySchema'])
+            for index in description.get('GlobalSecondaryIndexes', [])
+        }
+        self.sql_name = _quote(f't:{self.name}')
+
+    def index_sql_name(self, index_name):
+        return _quote(f'i:{self.name}:{index_name}')
+
+
+def _key_names(key_schema):
+    hash_key = next(key['AttributeName'] for key in key_schema if key['KeyType'] == 'HASH')
+    range_key = next((key['AttributeName'] for key in key_schema if key['KeyType'] == 'RANGE'), None)
+    return hash_key, range_key
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _scalar(value):
+    """SQLite value of a key attribute: S as text (byte order), N as a number"""
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        return float(value['N'])
+    raise ValueError('key attributes must be strings or numbers')
+
+
+class LocalDynamoDB:
+    """
+    SQLite-backed stand-in for a boto3 DynamoDB client.
+
+    Supports create/describe/update/delete/list tables, put/get/update/delete
+    item, scan (with Limit, ExclusiveStartKey and parallel segments), query on
+    the table or a global secondary index, batch_get_item and batch_write_item.
+    Errors are raised as botocore ClientErrors with DynamoDB's error codes, so
+    callers handle both backends the same way. Indexes are kept in step with
+    every write, sparse like DynamoDB's, and always project ALL attributes.
+
+    One connection is shared by all threads behind a lock; path may be
+    ':memory:' for a throwaway database.
+    """
+
+    def __init__(self, path=':memory:'):
+        self.path = str(path)
+        self.exceptions = _Exceptions()
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        if self.path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS _tables (name TEXT PRIMARY KEY, description TEXT NOT NULL)')
+        self._tables = {}
+
+    def __repr__(self):
+        return f"<LocalDynamoDB {self.path}>"
+
+    @contextmanager
+    def _transaction(self):
+        # Autocommit connection, so writes are grouped explicitly
+        self._conn.execute('BEGIN')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    # Errors and schema
+
+    def _error(self, operation, code, message):
+        return getattr(self.exceptions, code)({'Error': {'Code': code, 'Message': message}}, operation)
+
+    def _table(self, operation, name):
+        table = self._tables.get(name)
+        if table is None:
+            # Another process may have created it
+            row = self._conn.execute('SELECT description FROM _tables WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                raise self._error(operation, 'ResourceNotFoundException', f'Requested resource not found: Table: {name} not found')
+            table = self._tables[name] = _Table(json.loads(row[0]))
+        return table
+
+    def _save_description(self, table):
+        self._conn.execute('INSERT OR REPLACE INTO _tables (name, description) VALUES (?, ?)',
+                           (table.name, json.dumps(table.description)))
+        self._tables[table.name] = _Table(table.description)
+        return self._tables[table.name]
+
+    def _key(self, operation, table, key):
+        """(hash, range) of a Key argument, validated against the schema"""
+        expected = {table.hash_key, table.range_key} - {None}
+        if set(key) != expected:
+            raise self._error(operation, 'ValidationException', 'The provided key element does not match the schema')
+        try:
+            return _scalar(key[table.hash_key]), _scalar(key[table.range_key]) if table.range_key else ''
+        except ValueError as e:
+            raise self._error(operation, 'ValidationException', str(e))
+
+    def _key_of_item(self, operation, table, item):
+        missing = [name for name in (table.hash_key, table.range_key) if name and name not in item]
+        if missing:
+            raise self._error(operation, 'ValidationException',
+                              f'One or more parameter values were invalid: Missing the key {missing[0]} in the item')
+        return self._key(operation, table, {name: item[name] for name in (table.hash_key, table.range_key) if name})
+
+    @staticmethod
+    def _names(kwargs):
+        names = kwargs.get('ExpressionAttributeNames') or {}
+        return lambda name: names[name] if name.startswith('#') else name
+
+    def _values(self, operation, kwargs):
+        values = kwargs.get('ExpressionAttributeValues') or {}
+
+        def value(placeholder):
+            if placeholder not in values:
+                raise self._error(operation, 'ValidationException',
+                                  f'An expression attribute value used in expression is not defined: {placeholder}')
+            return values[placeholder]
+        return value
+
+    # Tables
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, GlobalSecondaryIndexes=None, **kwargs):
+        with self._lock:
+            try:
+                self._table('CreateTable', TableName)
+            except ClientError:
+                pass
+            else:
+                raise self._error('CreateTable', 'ResourceInUseException', f'Table already exists: {TableName}')
+
+            now = datetime.now(timezone.utc).isoformat()
+            description = {
+                'TableName': TableName,
+                'KeySchema': KeySchema,
+                'AttributeDefinitions': AttributeDefinitions,
+                'TableStatus': 'ACTIVE',
+                'CreationDateTime': now,
+                'BillingModeSummary': {'BillingMode': kwargs.get('BillingMode', 'PROVISIONED')},
+                'GlobalSecondaryIndexes': [],
+            }
+            table = _Table(description)
+            with self._transaction():
+                self._conn.execute(
+                    f'CREATE TABLE {table.sql_name} (hk NOT NULL, rk NOT NULL, seg INTEGER NOT NULL, '
+                    f'item TEXT NOT NULL, PRIMARY KEY (hk, rk))'
+                )
+                table = self._save_description(table)
+                for index in GlobalSecondaryIndexes or []:
+                    table = self._create_index(table, index)
+            return {'TableDescription': self._describe(table)}
+
+    def describe_table(self, TableName):
+        with self._lock:
+            return {'Table': self._describe(self._table('DescribeTable', TableName))}
+
+    def _describe(self, table):
+        description = dict(table.description)
+        description['ItemCount'] = self._conn.execute(f'SELECT COUNT(*) FROM {table.sql_name}').fetchone()[0]
+        description['GlobalSecondaryIndexes'] = [
+            dict(index, IndexStatus='ACTIVE') for index in table.description['GlobalSecondaryIndexes']
+        ]
+        if not description['GlobalSecondaryIndexes']:
+            del description['GlobalSecondaryIndexes']
+        return description
+
+    def list_tables(self, **kwargs):
+        with self._lock:
+            names = [row[0] for row in self._conn.execute('SELECT name FROM _tables ORDER BY name')]
+            return {'TableNames': names}
+
+    def update_table(self, TableName, AttributeDefinitions=None, GlobalSecondaryIndexUpdates=None, **kwargs):
+        with self._lock:
+            table = self._table('UpdateTable', TableName)
+            if len(GlobalSecondaryIndexUpdates or []) > 1:
+                raise self._error('UpdateTable', 'ValidationException',
+                                  'Subscriber limit exceeded: Only 1 online index can be created or deleted simultaneously per table')
+            with self._transaction():
+                known = {definition['AttributeName'] for definition in table.description['AttributeDefinitions']}
+                for definition in AttributeDefinitions or []:
+                    if definition['AttributeName'] not in known:
+                        table.description['AttributeDefinitions'].append(definition)
+                table = self._save_description(table)
+
+                for update in GlobalSecondaryIndexUpdates or []:
+                    if 'Create' in update:
+                        if update['Create']['IndexName'] in table.indexes:
+                            raise self._error('UpdateTable', 'ValidationException',
+                                              f"Attempting to create an index which already exists: {update['Create']['IndexName']}")
+                        table = self._create_index(table, update['Create'])
+                    elif 'Delete' in update:
+                        table = self._delete_index(table, update['Delete']['IndexName'])
+            return {'TableDescription': self._describe(table)}
+
+    def delete_table(self, TableName):
+        with self._lock:
+            table = self._table('DeleteTable', TableName)
+            description = self._describe(table)
+            with self._transaction():
+                for index_name in table.indexes:
+                    self._conn.execute(f'DROP TABLE {table.index_sql_name(index_name)}')
+                self._conn.execute(f'DROP TABLE {table.sql_name}')
+                self._conn.execute('DELETE FROM _tables WHERE name = ?', (TableName,))
+            del self._tables[TableName]
+            return {'TableDescription': dict(description, TableStatus='DELETING')}
+
+    def _create_index(self, table, index):
+        index_sql_name = table.index_sql_name(index['IndexName'])
+        self._conn.execute(
+            f'CREATE TABLE {index_sql_name} (ghk NOT NULL, grk NOT NULL, hk NOT NULL, rk NOT NULL, '
+            f'PRIMARY KEY (ghk, grk, hk, rk))'
+        )
+        self._conn.execute(f'CREATE INDEX {_quote(index_sql_name[1:-1] + ":item")} ON {index_sql_name} (hk, rk)')
+        table.description['GlobalSecondaryIndexes'].append({
+            'IndexName': index['IndexName'],
+            'KeySchema': index['KeySchema'],
+            'Projection': index.get('Projection', {'ProjectionType': 'ALL'}),
+        })
+        table = self._save_description(table)
+
+        # Backfill from the items already stored
+        for hk, rk, item_json in self._conn.execute(f'SELECT hk, rk, item FROM {table.sql_name}').fetchall():
+            self._index_item(table, index['IndexName'], hk, rk, json.loads(item_json))
+        return table
+
+    def _delete_index(self, table, index_name):
+        if index_name not in table.indexes:
+            raise self._error('UpdateTable', 'ResourceNotFoundException', f'Requested resource not found: Index: {index_name}')
+        self._conn.execute(f'DROP TABLE {table.index_sql_name(index_name)}')
+        table.description['GlobalSecondaryIndexes'] = [
+            index for index in table.description['GlobalSecondaryIndexes'] if index['IndexName'] != index_name
+        ]
+        return self._save_description(table)
+
+    def _index_item(self, table, index_name, hk, rk, item):
+        index_hash, index_range = table.indexes[index_name]
+        # Sparse: items without the index key attributes are not indexed
+        if index_hash not in item or (index_range and index_range not in item):
+            return
+        try:
+            ghk = _scalar(item[index_hash])
+            grk = _scalar(item[index_range]) if index_range else ''
+        except ValueError:
+            return
+        self._conn.execute(f'INSERT OR REPLACE INTO {table.index_sql_name(index_name)} VALUES (?, ?, ?, ?)',
+                           (ghk, grk, hk, rk))
+
+    # Items
+
+    def _read(self, table, hk, rk):
+        row = self._conn.execute(f'SELECT item FROM {table.sql_name} WHERE hk = ? AND rk = ?', (hk, rk)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write(self, table, hk, rk, item):
+        """Store or replace an item and its index entries (caller holds the lock and a transaction)"""
+        self._remove(table, hk, rk)
+        self._conn.execute(f'INSERT INTO {table.sql_name} (hk, rk, seg, item) VALUES (?, ?, ?, ?)',
+                           (hk, rk, zlib.crc32(str(hk).encode()), json.dumps(item)))
+        for index_name in table.indexes:
+            self._index_item(table, index_name, hk, rk, item)
+
+    def _remove(self, table, hk, rk):
+        self._conn.execute(f'DELETE FROM {table.sql_name} WHERE hk = ? AND rk = ?', (hk, rk))
+        for index_name in table.indexes:
+            self._conn.execute(f'DELETE FROM {table.index_sql_name(index_name)} WHERE hk = ? AND rk = ?', (hk, rk))
+
+    def put_item(self, TableName, Item, ReturnValues='NONE', **kwargs):
+        self._reject_conditions('PutItem', kwargs)
+        with self._lock:
+            table = self._table('PutItem', TableName)
+            hk, rk = self._key_of_item('PutItem', table, Item)
+            with self._transaction():
+                old = self._read(table, hk, rk)
+                self._write(table, hk, rk, Item)
+            response = {}
+            if ReturnValues == 'ALL_OLD' and old:
+                response['Attributes'] = old
+            return response
+
+    def get_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            table = self._table('GetItem', TableName)
+            item = self._read(table, *self._key('GetItem', table, Key))
+            return {'Item': item} if item else {}
+
+    def delete_item(self, TableName, Key, ReturnValues='NONE', **kwargs):
+        self._reject_conditions('DeleteItem', kwargs)
+        with self._lock:
+            table = self._table('DeleteItem', TableName)
+            hk, rk = self._key('DeleteItem', table, Key)
+            with self._transaction():
+                old = self._read(table, hk, rk)
+                self._remove(table, hk, rk)
+            response = {}
+            if ReturnValues == 'ALL_OLD' and old:
+                response['Attributes'] = old
+            return response
+
+    def update_item(self, TableName, Key, UpdateExpression, ReturnValues='NONE', **kwargs):
+        """SET attribute = :value and REMOVE attribute clauses; creates the item if it doesn't exist"""
+        self._reject_conditions('UpdateItem', kwargs)
+        with self._lock:
+            table = self._table('UpdateItem', TableName)
+            hk, rk = self._key('UpdateItem', table, Key)
+            name_of = self._names(kwargs)
+            value_of = self._values('UpdateItem', kwargs)
+
+            with self._transaction():
+                old = self._read(table, hk, rk)
+                item = dict(old or Key)
+                for action, attribute, value in self._parse_update(UpdateExpression):
+                    name = name_of(attribute)
+                    if name in (table.hash_key, table.range_key):
+                        raise self._error('UpdateItem', 'ValidationException',
+                                          f'One or more parameter values were invalid: Cannot update attribute {name}. '
+                                          f'This attribute is part of the key')
+                    if action == 'SET':
+                        item[name] = value_of(value)
+                    else:
+                        item.pop(name, None)
+                self._write(table, hk, rk, item)
+
+            response = {}
+            if ReturnValues == 'ALL_NEW':
+                response['Attributes'] = item
+            elif ReturnValues == 'ALL_OLD' and old:
+                response['Attributes'] = old
+            return response
+
+    def _reject_conditions(self, operation, kwargs):
+        # Writing unconditionally would hide the check the caller relies on
+        for unsupported in ('ConditionExpression', 'Expected', 'ConditionalOperator'):
+            if unsupported in kwargs:
+                raise self._error(operation, 'ValidationException', f'{unsupported} is not supported by the local engine')
+
+    def _parse_update(self, expression):
+        """[(action, attribute, value placeholder)] for an UpdateExpression"""
+        parts = _UPDATE_CLAUSE.split(expression)
+        if parts[0].strip() or len(parts) < 3:
+            raise self._error('UpdateItem', 'ValidationException', f'Invalid UpdateExpression: {expression}')
+        actions = []
+        for keyword, body in zip(parts[1::2], parts[2::2]):
+            for clause in body.split(','):
+                if keyword.upper() == 'SET':
+                    match = _ASSIGNMENT.match(clause)
+                    if not match:
+                        raise self._error('UpdateItem', 'ValidationException',
+                                          f'Unsupported SET clause in UpdateExpression: {clause.strip()}')
+                    actions.append(('SET', match.group(1), match.group(2)))
+                else:
+                    actions.append(('REMOVE', clause.strip(), None))
+        return actions
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        with self._lock:
+            if sum(len(request['Keys']) for request in RequestItems.values()) > MAX_BATCH_GET_KEYS:
+                raise self._error('BatchGetItem', 'ValidationException',
+                                  f'Too many items requested for the BatchGetItem call (max {MAX_BATCH_GET_KEYS})')
+            responses = {}
+            for table_name, request in RequestItems.items():
+                table = self._table('BatchGetItem', table_name)
+                items = responses.setdefault(table_name, [])
+                for key in request['Keys']:
+                    item = self._read(table, *self._key('BatchGetItem', table, key))
+                    if item:
+                        items.append(item)
+            return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        with self._lock:
+            if sum(len(requests) for requests in RequestItems.values()) > MAX_BATCH_WRITE_ITEMS:
+                raise self._error('BatchWriteItem', 'ValidationException',
+                                  f'Too many items requested for the BatchWriteItem call (max {MAX_BATCH_WRITE_ITEMS})')
+            with self._transaction():
+                for table_name, requests in RequestItems.items():
+                    table = self._table('BatchWriteItem', table_name)
+                    for request in requests:
+                        if 'PutRequest' in request:
+                            item = request['PutRequest']['Item']
+                            self._write(table, *self._key_of_item('BatchWriteItem', table, item), item)
+                        else:
+                            self._remove(table, *self._key('BatchWriteItem', table, request['DeleteRequest']['Key']))
+            return {'UnprocessedItems': {}}
+
+    # Reads of many items
+
+    def scan(self, TableName, Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None, **kwargs):
+        self._reject_filters('Scan', kwargs)
+        with self._lock:
+            table = self._table('Scan', TableName)
+            where, params = [], []
+            if TotalSegments:
+                if Segment is None or not 0 <= Segment < TotalSegments:
+                    raise self._error('Scan', 'ValidationException', 'Segment must be less than TotalSegments')
+                where.append('seg % ? = ?')
+                params += [TotalSegments, Segment]
+            if ExclusiveStartKey:
+                where.append('(hk, rk) > (?, ?)')
+                params += list(self._key('Scan', table, ExclusiveStartKey))
+
+            sql = f'SELECT item FROM {table.sql_name}'
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY hk, rk'
+            return self._page_response(table, self._page(self._conn.execute(sql, params), Limit), None)
+
+    def query(self, TableName, KeyConditionExpression, IndexName=None, Limit=None, ExclusiveStartKey=None,
+              ScanIndexForward=True, **kwargs):
+        self._reject_filters('Query', kwargs)
+        with self._lock:
+            table = self._table('Query', TableName)
+            if IndexName:
+                if IndexName not in table.indexes:
+                    raise self._error('Query', 'ValidationException',
+                                      f'The table does not have the specified index: {IndexName}')
+                hash_key, range_key = table.indexes[IndexName]
+            else:
+                hash_key, range_key = table.hash_key, table.range_key
+
+            conditions = self._parse_key_condition(KeyConditionExpression, kwargs)
+            hash_condition = conditions.pop(hash_key, None)
+            if not hash_condition or hash_condition[0] != '=' or set(conditions) - {range_key}:
+                raise self._error('Query', 'ValidationException', 'Query condition missed key schema element')
+
+            if IndexName:
+                hash_column, range_column = 'i.ghk', 'i.grk'
+                order = ['i.grk', 'i.hk', 'i.rk']
+                sql = (f'SELECT t.item FROM {table.index_sql_name(IndexName)} i '
+                       f'JOIN {table.sql_name} t ON t.hk = i.hk AND t.rk = i.rk')
+            else:
+                hash_column, range_column = 'hk', 'rk'
+                order = ['rk']
+                sql = f'SELECT item FROM {table.sql_name}'
+
+            where, params = [f'{hash_column} = ?'], [hash_condition[1][0]]
+            if range_key in conditions:
+                op, values = conditions[range_key]
+                if op == 'BETWEEN':
+                    where.append(f'{range_column} BETWEEN ? AND ?')
+                elif op == 'begins_with':
+                    where.append(f'substr({range_column}, 1, length(?)) = ?')
+                    values = values * 2
+                else:
+                    where.append(f'{range_column} {op} ?')
+                params += values
+
+            if ExclusiveStartKey:
+                position = [_scalar(ExclusiveStartKey[range_key])] if range_key else []
+                if IndexName:
+                    if not range_key:
+                        position.append('')
+                    position += list(self._key('Query', table, {
+                        name: ExclusiveStartKey[name] for name in (table.hash_key, table.range_key) if name
+                    }))
+                if position:
+                    direction = '>' if ScanIndexForward else '<'
+                    where.append(f"({', '.join(order[:len(position)])}) {direction} ({', '.join('?' * len(position))})")
+                    params += position
+
+            direction = '' if ScanIndexForward else ' DESC'
+            sql += ' WHERE ' + ' AND '.join(where) + ' ORDER BY ' + ', '.join(column + direction for column in order)
+            return self._page_response(table, self._page(self._conn.execute(sql, params), Limit), IndexName)
+
+    def _reject_filters(self, operation, kwargs):
+        # Silently returning unfiltered items would be worse than failing
+        for unsupported in ('FilterExpression', 'ProjectionExpression', 'ScanFilter', 'QueryFilter', 'Select'):
+            if unsupported in kwargs:
+                raise self._error(operation, 'ValidationException', f'{unsupported} is not supported by the local engine')
+
+    def _parse_key_condition(self, expression, kwargs):
+        """{attribute: (operator, [values])} for a KeyConditionExpression"""
+        name_of = self._names(kwargs)
+        value_of = self._values('Query', kwargs)
+        conditions = {}
+        position = 0
+        while True:
+            match = _KEY_CONDITION.match(expression, position)
+            if not match:
+                raise self._error('Query', 'ValidationException', f'Invalid KeyConditionExpression: {expression}')
+            if match.group('prefix_name'):
+                name, op, values = match.group('prefix_name'), 'begins_with', [match.group('prefix_value')]
+            elif match.group('between_name'):
+                name, op, values = match.group('between_name'), 'BETWEEN', [match.group('low'), match.group('high')]
+            else:
+                name, op, values = match.group('name'), match.group('op'), [match.group('value')]
+            conditions[name_of(name)] = (op, [_scalar(value_of(value)) for value in values])
+
+            position = match.end()
+            if position == len(expression):
+                return conditions
+            separator = _AND.match(expression, position)
+            if not separator:
+                raise self._error('Query', 'ValidationException', f'Invalid KeyConditionExpression: {expression}')
+            position = separator.end()
+
+    @staticmethod
+    def _page(rows, limit):
+        """(items, more): items up to Limit or 1 MB, and whether rows are left over"""
+        items, size = [], 0
+        for (item_json,) in rows:
+            if len(items) == limit or size >= MAX_PAGE_BYTES:
+                return items, True
+            items.append(json.loads(item_json))
+            size += len(item_json)
+        return items, False
+
+    @staticmethod
+    def _page_response(table, page, index_name):
+        items, more = page
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}
+        if more:
+            last = items[-1]
+            key_names = [table.hash_key, table.range_key]
+            if index_name:
+                key_names += list(table.indexes[index_name])
+            response['LastEvaluatedKey'] = {name: last[name] for name in key_names if name}
+        return response
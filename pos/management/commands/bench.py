@@ -0,0 +1,308 @@
+"""
+Django management command to benchmark the POS request paths
+Run: python manage.py bench [--customers 10000] [--transactions 10000] [--requests 200]
+
+DynamoDB is served by the local engine (pos/local_dynamodb.py), S3, SNS and
+CloudWatch by stand-ins that answer instantly, and products live in a
+throwaway test database, so nothing real is touched.
+"""
+
+import json
+import logging
+import math
+import random
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from pos import aws_clients, aws_tracing
+from pos.aws_services import CloudWatchService, DynamoDBService, ResourceRegistry, SNSService
+from pos.customer_index import customer_index
+from pos.models import Product
+from pos.outbox import get_outbox
+
+SCENARIOS = ['product_list', 'customer_list', 'customer_search', 'transaction_list', 'transaction_add_form',
+             'transaction_add', 'transaction_view']
+
+
+class CallCounter:
+    """
+    AWS calls per 'service.operation', split into calls made for a request and
+    background work. A call belongs to a request when it runs in the request's
+    traced context (pos.aws_tracing), which FanOut tasks and scan segments
+    copy, whatever thread it runs on.
+    """
+
+    def __init__(self):
+        self.request = Counter()
+        self.background = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, service, operation):
+        with self._lock:
+            if aws_tracing.current() is not None:
+                self.request[f'{service}.{operation}'] += 1
+            else:
+                self.background[f'{service}.{operation}'] += 1
+
+
+class CountingClient:
+    """Wraps a client and counts every API call made through it"""
+
+    def __init__(self, service, client, counter):
+        self._service = service
+        self._client = client
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr) or isinstance(attr, type):
+            return attr
+
+        def call(*args, **kwargs):
+            self._counter.record(self._service, name)
+            return attr(*args, **kwargs)
+        return call
+
+
+class StandInClient:
+    """Answers any S3/SNS/CloudWatch call at once with a minimal response"""
+
+    RESPONSES = {
+        'publish': lambda **kwargs: {'MessageId': str(uuid.uuid4())},
+        'create_topic': lambda **kwargs: {'TopicArn': f"arn:aws:sns:{settings.AWS_REGION}:000000000000:{kwargs['Name']}"},
+        'list_topics': lambda **kwargs: {'Topics': []},
+    }
+
+    def __init__(self, service):
+        self._service = service
+
+    def __getattr__(self, name):
+        return self.RESPONSES.get(name, lambda *args, **kwargs: {})
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot POS views against local stand-ins for DynamoDB, S3, SNS and CloudWatch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=10000, help='Customers to seed')
+        parser.add_argument('--transactions', type=int, default=10000, help='Transactions to seed')
+        parser.add_argument('--products', type=int, default=200, help='Products to seed')
+        parser.add_argument('--days', type=int, default=30, help='Spread seeded transactions over this many days')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Scenario to run (repeatable, default: all)')
+        parser.add_argument('--dynamodb-path', help='Local DynamoDB file to use (default: a temporary file)')
+        parser.add_argument('--no-seed', action='store_true', help='Reuse the data already in --dynamodb-path')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Report peak Python allocations per scenario (slows every request down)')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        workdir = tempfile.TemporaryDirectory(prefix='mypos-bench-')
+        dynamodb_path = options['dynamodb_path'] or str(Path(workdir.name) / 'dynamodb.sqlite3')
+        counter = self.install_clients(dynamodb_path, workdir.name)
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Request logs would dominate the timings; errors still show
+        logging.disable(logging.INFO)
+        try:
+            DynamoDBService.create_tables()
+            products = self.seed_products(options['products'])
+            if options['no_seed']:
+                customer_ids = [customer['customer_id'] for customer in DynamoDBService.iter_customers()]
+                transaction_ids = [transaction['transaction_id'] for transaction in DynamoDBService.iter_transactions()]
+            else:
+                customer_ids = self.seed_customers(options['customers'])
+                transaction_ids = self.seed_transactions(options['transactions'], customer_ids, products, options['days'])
+
+            self.stdout.write(f"DynamoDB backend: local ({dynamodb_path}), {len(customer_ids)} customers, "
+                              f"{len(transaction_ids)} transactions, {len(products)} products")
+            self.stdout.write(f"{'scenario':<22}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+                              f"{'AWS/req':>9}{'peak KB':>10}  AWS calls per request")
+
+            scenarios = options['scenario'] or SCENARIOS
+            if 'customer_search' in scenarios:
+                # Built up front, so the searches are timed rather than the first scan
+                customer_index.rebuild()
+
+            client = Client()
+            for scenario in scenarios:
+                request = self.scenario(scenario, customer_ids, transaction_ids, products)
+                self.run_scenario(client, scenario, request, counter, options)
+
+            rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(f"Max RSS {rss_mb:.0f} MB. Background AWS calls: {dict(counter.background) or 'none'}")
+        finally:
+            # Drain background work while the stand-ins are still installed
+            get_outbox().shutdown()
+            CloudWatchService.flush_metrics()
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            aws_clients.reset_clients()
+            workdir.cleanup()
+
+    def install_clients(self, dynamodb_path, workdir):
+        """Point every AWS client at a counted local stand-in"""
+        settings.DYNAMODB_BACKEND = 'local'
+        settings.DYNAMODB_LOCAL_PATH = dynamodb_path
+        settings.OUTBOX_SPILL_DIR = Path(workdir) / 'outbox'
+        settings.SNS_TOPIC_ARN = None
+        aws_clients.reset_clients()
+        ResourceRegistry.reset()
+        SNSService._topic_arn = None
+
+        counter = CallCounter()
+        aws_clients.set_client('dynamodb', CountingClient('dynamodb', aws_clients.create_client('dynamodb'), counter))
+        for service in ('s3', 'sns', 'cloudwatch'):
+            aws_clients.set_client(service, CountingClient(service, StandInClient(service), counter))
+        return counter
+
+    def seed_products(self, count):
+        Product.objects.bulk_create(
+            Product(name=f'Bench product {i}', price=random.randint(100, 5000) / 100, quantity=10 ** 9)
+            for i in range(count)
+        )
+        return list(Product.objects.values_list('id', flat=True))
+
+    def seed_customers(self, count):
+        ids = [f'bench-c{i:08d}' for i in range(count)]
+        now = datetime.now().isoformat()
+        self.batch_write(settings.DYNAMODB_CUSTOMERS_TABLE, ({
+            'customer_id': {'S': customer_id},
+            'name': {'S': f'Customer {i}'},
+            'email': {'S': f'customer{i}@example.com'},
+            'phone': {'S': f'+1555{i:07d}'},
+            'address': {'S': f'{i} Bench Street'},
+            'created_at': {'S': now}
+        } for i, customer_id in enumerate(ids)), 'customers')
+        return ids
+
+    def seed_transactions(self, count, customer_ids, product_ids, days):
+        ids = [f'bench-t{i:08d}' for i in range(count)]
+        now = datetime.now()
+        step = timedelta(days=days) / max(count, 1)
+
+        def items():
+            for i, transaction_id in enumerate(ids):
+                created_at = now - step * i
+                customer = random.randrange(len(customer_ids)) if customer_ids else None
+                lines = [{'product_id': str(product_id), 'product_name': f'Bench product {product_id}',
+                          'quantity': 1, 'price': 9.99, 'subtotal': 9.99}
+                         for product_id in random.sample(product_ids, min(3, len(product_ids)))]
+                yield {
+                    'transaction_id': {'S': transaction_id},
+                    'customer_id': {'S': customer_ids[customer] if customer is not None else 'unknown'},
+                    'customer_name': {'S': f'Customer {customer}'},
+                    'products': {'S': json.dumps(lines)},
+                    'total_amount': {'N': str(round(9.99 * len(lines), 2))},
+                    'status': {'S': 'completed'},
+                    'created_at': {'S': created_at.isoformat()},
+                    'list_shard': {'S': DynamoDBService._list_shard(transaction_id)}
+                }
+        self.batch_write(settings.DYNAMODB_TRANSACTIONS_TABLE, items(), 'transactions')
+        return ids
+
+    def batch_write(self, table_name, items, label):
+        """Write straight to the engine in BatchWriteItem-sized groups, bypassing the call counter"""
+        engine = aws_clients.get_client('dynamodb')._client
+        started = time.perf_counter()
+        batch = []
+        written = 0
+        for item in items:
+            batch.append({'PutRequest': {'Item': item}})
+            if len(batch) == 25:
+                engine.batch_write_item(RequestItems={table_name: batch})
+                written += len(batch)
+                batch = []
+        if batch:
+            engine.batch_write_item(RequestItems={table_name: batch})
+            written += len(batch)
+        self.stdout.write(f'Seeded {written} {label} in {time.perf_counter() - started:.1f}s')
+
+    def scenario(self, name, customer_ids, transaction_ids, product_ids):
+        """A function making one request of the scenario with the test client"""
+        def basket():
+            chosen = random.sample(product_ids, min(random.randint(1, 5), len(product_ids)))
+            return {
+                'customer_id': random.choice(customer_ids),
+                'product_ids': [str(product_id) for product_id in chosen],
+                'quantities': ['1'] * len(chosen)
+            }
+
+        def search_query():
+            i = random.randrange(len(customer_ids)) if customer_ids else 0
+            # A name, the start of an email and the last digits of a phone number
+            return random.choice([f'Customer {i}', f'customer{i}@', f'{i:07d}'[-4:]])
+
+        requests = {
+            'product_list': lambda client: client.get('/products/'),
+            'customer_list': lambda client: client.get('/customers/'),
+            'customer_search': lambda client: client.get('/customers/search/', {'q': search_query()}),
+            'transaction_list': lambda client: client.get('/transactions/'),
+            'transaction_add_form': lambda client: client.get('/transactions/add/'),
+            'transaction_add': lambda client: client.post('/transactions/add/', basket()),
+            'transaction_view': lambda client: client.get(f'/transactions/view/{random.choice(transaction_ids)}/'),
+        }
+        return requests[name]
+
+    def run_scenario(self, client, name, request, counter, options):
+        def make_request():
+            # Traced until the body is read, so calls made while streaming count towards the request
+            _, token = aws_tracing.start()
+            try:
+                response = request(client)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            finally:
+                aws_tracing.stop(token)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name} returned HTTP {response.status_code}')
+            return response
+
+        for _ in range(options['warmup']):
+            make_request()
+
+        if options['trace_memory']:
+            tracemalloc.start()
+        counter.request.clear()
+        latencies = []
+        for _ in range(options['requests']):
+            started = time.perf_counter()
+            make_request()
+            latencies.append((time.perf_counter() - started) * 1000)
+        peak_kb = ''
+        if options['trace_memory']:
+            peak_kb = f'{tracemalloc.get_traced_memory()[1] / 1024:.0f}'
+            tracemalloc.stop()
+
+        latencies.sort()
+        calls = sum(counter.request.values()) / max(len(latencies), 1)
+        breakdown = ', '.join(f'{operation} {count / len(latencies):g}'
+                              for operation, count in counter.request.most_common())
+        self.stdout.write(f'{name:<22}{len(latencies):>6}{percentile(latencies, 0.50):>10.2f}'
+                          f'{percentile(latencies, 0.95):>10.2f}{percentile(latencies, 0.99):>10.2f}'
+                          f'{latencies[-1] if latencies else 0:>10.2f}{calls:>9.1f}{peak_kb:>10}  {breakdown or "-"}')
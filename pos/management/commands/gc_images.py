@@ -0,0 +1,80 @@
+"""
+Django management command to delete product images no product refers to
+Run: python manage.py gc_images [--dry-run] [--grace-hours 24]
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pos.aws_services import S3Service
+from pos.models import Product
+
+# Legacy per-product keys (products/<id>/<file>) and abandoned direct uploads are collected too
+IMAGE_PREFIXES = [settings.S3_IMAGE_PREFIX, settings.S3_UPLOAD_PREFIX, 'products/']
+
+# Orphans are re-checked and deleted this many at a time (the DeleteObjects limit)
+DELETE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Delete S3 product images that are no longer referenced by any product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List unreferenced objects without deleting them')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Keep objects younger than this, so uploads still being processed are safe')
+
+    def handle(self, *args, **options):
+        referenced = self.referenced_keys()
+        self.stdout.write(f'{len(referenced)} image objects referenced by products')
+
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=options['grace_hours'])
+        orphans = []
+        orphan_bytes = 0
+        for prefix in IMAGE_PREFIXES:
+            for obj in S3Service.iter_objects(prefix):
+                if obj['Key'] in referenced or obj['LastModified'] > cutoff:
+                    continue
+                orphans.append(obj['Key'])
+                orphan_bytes += obj.get('Size', 0)
+
+        self.stdout.write(f'{len(orphans)} unreferenced objects ({orphan_bytes / (1024 * 1024):.1f} MB)')
+        if options['dry_run']:
+            for key in orphans:
+                self.stdout.write(f'  {key}')
+            return
+
+        deleted = 0
+        for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+            deleted += S3Service.delete_objects(self.still_orphaned(orphans[start:start + DELETE_BATCH_SIZE], cutoff))
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} objects'))
+
+    def still_orphaned(self, keys, cutoff):
+        """
+        The keys that are still unreferenced and old, checked again just before
+        deleting: a product may have started using one since the listing (the
+        image pipeline refreshes an object it re-uses, which makes it young)
+        """
+        referenced = self.referenced_keys()
+        orphans = []
+        for key in keys:
+            if key in referenced:
+                continue
+            head = S3Service.head_object(key)
+            if head is not None and head['LastModified'] <= cutoff:
+                orphans.append(key)
+        if len(orphans) < len(keys):
+            self.stdout.write(f'{len(keys) - len(orphans)} objects were re-used or removed since listing; kept')
+        return orphans
+
+    @staticmethod
+    def referenced_keys():
+        """Keys of every image URL stored on a product"""
+        keys = set()
+        for image_url, image_variants in Product.objects.values_list('s3_image_url', 'image_variants').iterator():
+            urls = [image_url]
+            for formats in (image_variants or {}).values():
+                urls.extend(formats.values())
+            keys.update(key for key in map(S3Service.key_from_url, urls) if key)
+        return keys
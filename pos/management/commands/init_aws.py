@@ -11,6 +11,10 @@ from error_handler.error_handler import ErrorHandler
 class Command(BaseCommand):
     help = 'Initialize AWS resources (DynamoDB tables, S3 bucket, SNS topic)'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--index-timeout', type=int, default=1800,
+                            help='Seconds to wait for new DynamoDB indexes to be built')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Initializing AWS resources...'))
         
@@ -22,11 +26,37 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'✗ Error creating DynamoDB tables: {str(e)}'))
         
+        # DynamoDB adds indexes to an existing table one at a time
+        try:
+            self.stdout.write('Waiting for DynamoDB indexes...')
+            pending = DynamoDBService.wait_for_indexes(
+                options['index_timeout'],
+                progress=lambda pending: self.stdout.write(f"  still building: {', '.join(pending)}")
+            )
+            if pending:
+                self.stdout.write(self.style.WARNING(
+                    f"! DynamoDB indexes not ready after {options['index_timeout']}s: {', '.join(pending)}. "
+                    "Run init_aws again once they are built."))
+            else:
+                self.stdout.write(self.style.SUCCESS('✓ DynamoDB indexes active'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Error building DynamoDB indexes: {str(e)}'))
+        
+        # Backfill the listing index key on older transactions
+        try:
+            self.stdout.write('Backfilling transaction list shards...')
+            updated = DynamoDBService.backfill_transaction_shards()
+            self.stdout.write(self.style.SUCCESS(f'✓ Transaction list shards backfilled ({updated} updated)'))
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'✗ Error backfilling transaction list shards: {str(e)}'))
+        
         # Create S3 bucket
         try:
             self.stdout.write('Creating S3 bucket...')
             S3Service.create_bucket()
             self.stdout.write(self.style.SUCCESS('✓ S3 bucket created/verified'))
+            S3Service.configure_upload_cors()
+            self.stdout.write(self.style.SUCCESS('✓ S3 CORS configured for direct browser uploads'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'✗ Error creating S3 bucket: {str(e)}'))
             self.stdout.write(self.style.WARNING('Note: S3 bucket names must be globally unique. You may need to change S3_BUCKET_NAME in settings.py'))
@@ -0,0 +1,121 @@
+"""
+In-process CloudWatch metric aggregation
+Values are summed into StatisticSets per metric and minute, then sent in
+batched put_metric_data calls by a background flusher.
+"""
+
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+
+from error_handler.error_handler import ErrorHandler
+
+# put_metric_data accepts at most 1000 datums per call
+MAX_DATUMS_PER_CALL = 1000
+
+
+class MetricsAggregator:
+    """
+    Collects metric values and flushes them as StatisticValues.
+
+    send(metric_data) is called with at most MAX_DATUMS_PER_CALL datums.
+    Values are grouped by metric name, unit, dimensions and the minute they
+    were recorded in, so each group becomes one datum however many values
+    it holds. Datums that fail to send are merged back for the next flush.
+    """
+
+    def __init__(self, send, interval=60):
+        self.send = send
+        self.interval = interval
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def record(self, name, value, unit='None', dimensions=None):
+        """Add one value to its StatisticSet"""
+        minute = int(time.time()) // 60 * 60
+        dims = tuple(sorted((dimensions or {}).items()))
+        key = (name, unit, dims, minute)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                self._stats[key] = [1, value, value, value]
+            else:
+                stats[0] += 1
+                stats[1] += value
+                stats[2] = min(stats[2], value)
+                stats[3] = max(stats[3], value)
+
+        if self._thread is None:
+            self.start()
+
+    def flush(self):
+        """Send everything collected so far"""
+        with self._lock:
+            stats, self._stats = self._stats, {}
+        if not stats:
+            return 0
+
+        items = list(stats.items())
+        sent = 0
+        for start in range(0, len(items), MAX_DATUMS_PER_CALL):
+            chunk = items[start:start + MAX_DATUMS_PER_CALL]
+            try:
+                self.send([self._datum(key, values) for key, values in chunk])
+                sent += len(chunk)
+            except Exception as e:
+                ErrorHandler.handle_aws_error(e, "flush_metrics", "CloudWatch")
+                self._merge(chunk)
+        return sent
+
+    def start(self):
+        """Start the background flusher (first call only)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='metrics-flusher', daemon=True)
+            self._thread.start()
+        atexit.register(self.shutdown)
+
+    def shutdown(self):
+        """Stop the flusher and send what is left"""
+        self._stopping.set()
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            self.flush()
+
+    def _merge(self, items):
+        with self._lock:
+            for key, (count, total, minimum, maximum) in items:
+                stats = self._stats.get(key)
+                if stats is None:
+                    self._stats[key] = [count, total, minimum, maximum]
+                else:
+                    stats[0] += count
+                    stats[1] += total
+                    stats[2] = min(stats[2], minimum)
+                    stats[3] = max(stats[3], maximum)
+
+    @staticmethod
+    def _datum(key, values):
+        name, unit, dims, minute = key
+        count, total, minimum, maximum = values
+        datum = {
+            'MetricName': name,
+            'Timestamp': datetime.fromtimestamp(minute, tz=timezone.utc),
+            'StatisticValues': {
+                'SampleCount': count,
+                'Sum': total,
+                'Minimum': minimum,
+                'Maximum': maximum
+            },
+            'Unit': unit
+        }
+        if dims:
+            datum['Dimensions'] = [{'Name': dim_name, 'Value': dim_value} for dim_name, dim_value in dims]
+        return datum
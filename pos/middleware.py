@@ -0,0 +1,117 @@
+"""
+Request middleware for MyPOS
+"""
+
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from . import aws_tracing, identity_map
+
+logger = logging.getLogger('pos.requests')
+
+
+class AWSCallTimingMiddleware:
+    """
+    Accounts for the AWS calls each request makes.
+
+    Adds a Server-Timing header (total time, plus calls and time per AWS
+    service) when AWS_SERVER_TIMING is on, and logs one record per request
+    to the 'pos.requests' logger with the breakdown as structured fields.
+    Requests slower than AWS_SLOW_REQUEST_MS are logged as warnings with
+    every call listed.
+    For streaming responses only the view is timed, not the body.
+    Works in sync and async stacks, so async views stay on the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        log, token = aws_tracing.start()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            aws_tracing.stop(token)
+        return self.finish(request, response, log, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        log, token = aws_tracing.start()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            aws_tracing.stop(token)
+        return self.finish(request, response, log, time.perf_counter() - started)
+
+    def finish(self, request, response, log, elapsed):
+        if settings.AWS_SERVER_TIMING:
+            response['Server-Timing'] = self.server_timing(log, elapsed)
+
+        slow = elapsed * 1000 >= settings.AWS_SLOW_REQUEST_MS
+        level = logging.WARNING if slow else logging.INFO
+        if logger.isEnabledFor(level):
+            fields = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'ms': round(elapsed * 1000, 2),
+                'aws_calls': len(log.calls),
+                'aws_ms': round(log.elapsed * 1000, 2),
+                'operations': log.summary()
+            }
+            if slow:
+                fields['slow'] = True
+                fields['calls'] = [call.as_dict() for call in log.calls]
+            logger.log(level, "%s %s %s in %.1f ms, %d AWS calls", request.method, request.path,
+                       response.status_code, fields['ms'], len(log.calls), extra=fields)
+        return response
+
+    @staticmethod
+    def server_timing(log, elapsed):
+        metrics = [f'total;dur={elapsed * 1000:.1f}']
+        for service, (count, service_elapsed) in sorted(log.by_service().items()):
+            metrics.append(f'{service};dur={service_elapsed * 1000:.1f};desc="{count} calls"')
+        return ', '.join(metrics)
+
+
+class RequestIdentityMapMiddleware:
+    """
+    Gives each request its own identity map (pos/identity_map.py), so a
+    customer or transaction is read from DynamoDB at most once per request.
+    The map is dropped when the response is returned.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        _, token = identity_map.start()
+        try:
+            return self.get_response(request)
+        finally:
+            identity_map.stop(token)
+
+    async def __acall__(self, request):
+        _, token = identity_map.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            identity_map.stop(token)
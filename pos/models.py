@@ -3,7 +3,53 @@ Models for MyPOS - Simple Product model for local storage
 Customer and Transaction data stored in DynamoDB
 """
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Q, When
+
+
+class ProductManager(models.Manager):
+    """Manager with single-statement stock updates for checkout"""
+    
+    def reserve_stock(self, quantities):
+        """
+        Take stock for {product_id: quantity} in a fixed number of queries.
+        
+        Returns (products, oversold): the products found (by id) and the ids
+        that don't have enough stock. Stock is only decremented when nothing
+        is oversold. The UPDATE re-checks quantity >= requested for every
+        line, so a concurrent sale can't drive stock negative.
+        """
+        with transaction.atomic():
+            products = self.select_for_update().in_bulk(list(quantities))
+            oversold = [pk for pk, quantity in quantities.items()
+                        if pk in products and products[pk].quantity < quantity]
+            reserved = {pk: quantity for pk, quantity in quantities.items() if pk in products}
+            if oversold or not reserved:
+                return products, oversold
+            
+            updated = self._change_stock(reserved, -1, guard=True)
+            if updated != len(reserved):
+                # Another checkout took the stock first - undo the partial update
+                transaction.set_rollback(True)
+                return products, [pk for pk in reserved]
+        
+        # The UPDATE ran in SQL; bring the rows handed back to the caller in line with it
+        for pk, quantity in reserved.items():
+            products[pk].quantity -= quantity
+        return products, []
+    
+    def release_stock(self, quantities):
+        """Give back stock taken by reserve_stock(), e.g. when saving the sale failed"""
+        if quantities:
+            self._change_stock(quantities, 1)
+    
+    def _change_stock(self, quantities, sign, guard=False):
+        condition = Q()
+        whens = []
+        for pk, quantity in quantities.items():
+            condition |= Q(pk=pk, quantity__gte=quantity) if guard else Q(pk=pk)
+            whens.append(When(pk=pk, then=F('quantity') + sign * quantity))
+        return self.filter(condition).update(quantity=Case(*whens, default=F('quantity')))
 
 
 class Product(models.Model):
@@ -13,9 +59,16 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     quantity = models.IntegerField(default=0)
     s3_image_url = models.URLField(blank=True, null=True)  # URL of image in S3
+    image_variants = models.JSONField(default=dict, blank=True)  # {variant: {extension: url}}
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProductManager()
+    
     def __str__(self):
         return self.name
-
+    
+    @property
+    def thumbnail_url(self):
+        """Small JPEG for lists, falling back to the full image"""
+        return self.image_variants.get('thumb', {}).get('jpg') or self.s3_image_url
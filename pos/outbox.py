@@ -0,0 +1,299 @@
+"""
+Outbox for post-commit side effects (SNS notifications)
+Jobs are journaled to a spill file, then run by background worker threads
+with retries, so checkout only waits for the DynamoDB write.
+"""
+
+import atexit
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from error_handler.error_handler import ErrorHandler
+
+logger = logging.getLogger(__name__)
+
+# Job name -> callable(payload)
+HANDLERS = {}
+
+
+def handler(name):
+    """Register a function as the handler for a job name"""
+    def register(fn):
+        HANDLERS[name] = fn
+        return fn
+    return register
+
+
+class Outbox:
+    """
+    Bounded job queue drained by worker threads.
+
+    Every job is appended to this process's journal before it is queued and
+    marked done once its handler succeeds (or runs out of retries). Each run
+    is journaled before it starts, so a job whose runs keep taking the
+    process down still uses up its retries. Journals left behind by
+    processes that died are claimed and replayed on start-up.
+    If the queue is full the job stays in the journal and is picked up when
+    the workers catch up, so enqueue() never blocks a request. A failed job
+    waits out its backoff in a not-before heap rather than in a worker, so
+    other jobs keep running meanwhile.
+    """
+
+    def __init__(self, spill_dir, workers=2, queue_size=1000, max_retries=5, retry_delay=0.5):
+        self.spill_dir = Path(spill_dir)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._inflight = set()
+        self._overflowed = False
+        self._completed = 0
+        self._delayed = []  # heap of (not_before, seq, job) waiting to be retried
+        self._delayed_lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._journal_lock = threading.Lock()
+        self._recover_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._journal_path = self.spill_dir / f'outbox-{os.getpid()}.jsonl'
+
+    def enqueue(self, name, payload):
+        """Journal a job and hand it to the workers"""
+        if name not in HANDLERS:
+            raise ValueError(f"No outbox handler registered for '{name}'")
+        self.start()
+
+        job = {'id': uuid.uuid4().hex, 'job': name, 'payload': payload, 'attempts': 0}
+        self._inflight.add(job['id'])  # Before journaling, so _recover() skips it
+        self._journal({'id': job['id'], 'job': name, 'payload': payload})
+        self._put(job)
+        return job['id']
+
+    def start(self):
+        """Start the workers and replay any jobs left in journals (first call only)"""
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+            self._claim_orphaned_journals()
+            self._recover()
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'outbox-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.shutdown)
+
+    def shutdown(self, timeout=None):
+        """Give queued jobs a chance to finish; unfinished ones stay in the journal"""
+        timeout = settings.OUTBOX_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while self._inflight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        if not self._inflight:
+            self._compact()
+
+    def pending(self):
+        """Number of jobs queued or running in this process"""
+        return len(self._inflight)
+
+    def _put(self, job):
+        self._inflight.add(job['id'])
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            # Still journaled - _recover() queues it once there is room
+            self._inflight.discard(job['id'])
+            self._overflowed = True
+            ErrorHandler.log_success("Outbox full, job deferred", job['id'])
+
+    def _retry_later(self, job, delay):
+        with self._delayed_lock:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), job))
+
+    def _release_due(self):
+        """Queue the retries whose backoff has passed; returns seconds until the next one is due"""
+        due = []
+        with self._delayed_lock:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                due.append(heapq.heappop(self._delayed)[2])
+            wait = self._delayed[0][0] - now if self._delayed else None
+        for job in due:
+            self._put(job)
+        return wait
+
+    def _work(self):
+        while not self._stopping.is_set():
+            wait = self._release_due()
+            try:
+                job = self._queue.get(timeout=1.0 if wait is None else min(max(wait, 0.01), 1.0))
+            except queue.Empty:
+                if self._overflowed:
+                    self._recover()
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        if job['attempts'] > self.max_retries:
+            # Its earlier runs never finished, e.g. the process died during each of them
+            logger.error("Outbox job %s %s gave up after %d unfinished runs", job['job'], job['id'], job['attempts'])
+            self._finish(job, failed=True)
+            return
+
+        job['attempts'] += 1
+        self._journal({'id': job['id'], 'attempts': job['attempts']})
+        try:
+            HANDLERS[job['job']](job['payload'])
+            self._finish(job)
+        except Exception as e:
+            if job['attempts'] > self.max_retries:
+                ErrorHandler.handle_aws_error(e, f"outbox job {job['job']} (gave up after {self.max_retries} retries)", job['id'])
+                self._finish(job, failed=True)
+                return
+
+            ErrorHandler.handle_aws_error(e, f"outbox job {job['job']} (attempt {job['attempts']})", job['id'])
+            self._retry_later(job, min(self.retry_delay * (2 ** (job['attempts'] - 1)), 30))
+
+    def _finish(self, job, failed=False):
+        record = {'id': job['id'], 'done': True}
+        if failed:
+            record['failed'] = True
+        self._journal(record)
+        self._inflight.discard(job['id'])
+
+        # Keep the journal from growing for the life of the process
+        self._completed += 1
+        if self._completed % 1000 == 0:
+            self._compact()
+
+    def _journal(self, record):
+        with self._journal_lock:
+            with open(self._journal_path, 'a') as journal:
+                journal.write(json.dumps(record) + '\n')
+                journal.flush()
+
+    def _read_pending(self, path):
+        """Jobs in a journal that were never marked done, in order, with the number of runs started"""
+        jobs = {}
+        try:
+            with open(path) as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash
+                    if record.get('done'):
+                        jobs.pop(record['id'], None)
+                    elif 'job' in record:
+                        jobs[record['id']] = record
+                    elif record['id'] in jobs:
+                        jobs[record['id']]['attempts'] = record['attempts']
+        except FileNotFoundError:
+            pass
+        return list(jobs.values())
+
+    def _claim_orphaned_journals(self):
+        """Move jobs from journals of dead processes into this process's journal"""
+        for path in self.spill_dir.glob('outbox-*.jsonl'):
+            if path == self._journal_path or self._owner_alive(path):
+                continue
+            claimed = path.with_suffix(f'.claimed-{os.getpid()}')
+            try:
+                path.rename(claimed)  # Atomic, so only one process wins
+            except OSError:
+                continue
+            for record in self._read_pending(claimed):
+                self._journal(record)
+            claimed.unlink()
+
+    @staticmethod
+    def _owner_alive(path):
+        try:
+            pid = int(path.stem.split('-', 1)[1])
+            os.kill(pid, 0)
+            return True
+        except (ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            return True  # Exists but belongs to someone else
+
+    def _recover(self):
+        """Queue journaled jobs that are not already queued or running"""
+        with self._recover_lock:
+            self._overflowed = False
+            for record in self._read_pending(self._journal_path):
+                if record['id'] in self._inflight:
+                    continue
+                self._put({'id': record['id'], 'job': record['job'], 'payload': record['payload'],
+                           'attempts': record.get('attempts', 0)})
+                if self._overflowed:
+                    break
+
+    def _compact(self):
+        """Rewrite the journal with only the jobs still pending"""
+        with self._journal_lock:
+            pending = self._read_pending(self._journal_path)
+            if not pending:
+                try:
+                    self._journal_path.unlink()
+                except FileNotFoundError:
+                    pass
+                return
+            tmp_path = self._journal_path.with_suffix('.tmp')
+            with open(tmp_path, 'w') as journal:
+                for record in pending:
+                    journal.write(json.dumps(record) + '\n')
+            os.replace(tmp_path, self._journal_path)
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox():
+    """The process-wide outbox, configured from settings"""
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(
+                    settings.OUTBOX_SPILL_DIR,
+                    workers=settings.OUTBOX_WORKERS,
+                    queue_size=settings.OUTBOX_QUEUE_SIZE,
+                    max_retries=settings.OUTBOX_MAX_RETRIES,
+                    retry_delay=settings.OUTBOX_RETRY_DELAY
+                )
+    return _outbox
+
+
+@handler('transaction_notification')
+def send_transaction_notification(payload):
+    """Publish the SNS notification for a completed transaction"""
+    from .aws_services import SNSService
+
+    notification_message = f"""
+Transaction Completed!
+
+Transaction ID: {payload['transaction_id']}
+Customer: {payload.get('customer_name') or 'Customer'}
+Total Amount: ${payload['total_amount']:.2f}
+Products: {payload['item_count']} items
+
+Thank you for your purchase!
+    """
+    SNSService.send_notification(notification_message.strip(), "New Transaction - MyPOS")
+
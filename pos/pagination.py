@@ -0,0 +1,94 @@
+"""
+Cursor pagination for DynamoDB-backed list pages
+Cursors are signed, opaque tokens wrapping an ExclusiveStartKey
+"""
+
+from django.conf import settings
+from django.core import signing
+
+CURSOR_SALT = 'pos.pagination.cursor'
+
+
+class CursorPage:
+    """One page of items plus the cursors needed to move forward and back"""
+    
+    def __init__(self, items, next_cursor=None, prev_cursor=None, has_prev=False, has_first=False):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_prev = has_prev
+        # Past the pages the trail remembers, only a link back to the first page is offered
+        self.has_first = has_first
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(start_key, trail, clipped=False):
+    """
+    Encode a start key and the start keys of earlier pages into a cursor.
+    
+    Only the last POS_PAGE_TRAIL keys are kept, so the cursor stays small
+    however deep the reader goes; clipped records that older ones were dropped.
+    """
+    if len(trail) > settings.POS_PAGE_TRAIL:
+        trail = trail[-settings.POS_PAGE_TRAIL:]
+        clipped = True
+    data = {'k': start_key, 't': trail}
+    if clipped:
+        data['c'] = 1
+    return signing.dumps(data, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (start_key, trail, clipped). Invalid cursors mean the first page"""
+    if not cursor:
+        return None, [], False
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+        return data.get('k'), data.get('t', []), bool(data.get('c'))
+    except (signing.BadSignature, AttributeError):
+        return None, [], False
+
+
+def paginate(request, fetch_page, page_size):
+    """
+    Fetch one page for the request's ?cursor= parameter.
+    
+    fetch_page(limit, start_key) must return (items, last_evaluated_key).
+    The cursor carries the start keys of the pages before it, so the
+    previous link needs no extra reads.
+    """
+    start_key, trail, clipped = decode_cursor(request.GET.get('cursor'))
+    items, last_key = fetch_page(page_size, start_key)
+    return build_page(items, last_key, start_key, trail, clipped)
+
+
+async def apaginate(request, fetch_page, page_size):
+    """paginate() for async views, where fetch_page is a coroutine function"""
+    start_key, trail, clipped = decode_cursor(request.GET.get('cursor'))
+    items, last_key = await fetch_page(page_size, start_key)
+    return build_page(items, last_key, start_key, trail, clipped)
+
+
+def build_page(items, last_key, start_key, trail, clipped=False):
+    """CursorPage for items read from start_key, with links to the next and previous pages"""
+    next_cursor = None
+    if last_key:
+        next_cursor = encode_cursor(last_key, trail + [start_key], clipped)
+    
+    prev_cursor = None
+    if trail:
+        # The first page has no start key, so its link carries no cursor
+        prev_key = trail[-1]
+        prev_cursor = encode_cursor(prev_key, trail[:-1], clipped) if prev_key else None
+    
+    return CursorPage(items, next_cursor, prev_cursor, has_prev=bool(trail),
+                      has_first=clipped and not trail)
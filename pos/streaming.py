@@ -0,0 +1,56 @@
+"""
+Streaming template responses for list pages
+The page chrome is sent first, then table rows as they are rendered
+"""
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+ROWS_MARKER = '<!--pos:rows-->'
+
+
+def _render_page(request, template_name, context):
+    """(everything before the rows, everything after them)"""
+    page = render_to_string(template_name, {**context, 'rows_marker': mark_safe(ROWS_MARKER)}, request)
+    head, _, tail = page.partition(ROWS_MARKER)
+    return head, tail
+
+
+def render_streaming(request, template_name, context, rows, row_template, row_name='row'):
+    """
+    Render template_name with {{ rows_marker }} standing in for the table body.
+    
+    Everything before the marker is sent at once, each row is rendered with
+    row_template as the response is consumed, then the rest of the page follows.
+    """
+    head, tail = _render_page(request, template_name, context)
+    row_tmpl = get_template(row_template)
+    
+    def generate():
+        yield head
+        for row in rows:
+            yield row_tmpl.render({row_name: row})
+        yield tail
+    
+    return StreamingHttpResponse(generate(), content_type='text/html; charset=utf-8')
+
+
+async def arender_streaming(request, template_name, context, rows, row_template, row_name='row'):
+    """
+    render_streaming for async views. The body is an async iterator, which
+    ASGI streams as it goes; a sync one would be read whole first.
+    """
+    # The page may load the session or user from the database, which async code can't do directly
+    head, tail = await sync_to_async(_render_page)(request, template_name, context)
+    row_tmpl = get_template(row_template)
+    
+    async def generate():
+        yield head
+        # Rows are plain dicts already fetched, so rendering them needs no thread
+        for row in rows:
+            yield row_tmpl.render({row_name: row})
+        yield tail
+    
+    return StreamingHttpResponse(generate(), content_type='text/html; charset=utf-8')
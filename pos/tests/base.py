@@ -0,0 +1,55 @@
+"""
+Test set-up shared by the pos tests
+AWS clients are replaced with the local stand-ins the bench command uses:
+DynamoDB by an in-memory LocalDynamoDB, S3/SNS/CloudWatch by StandInClient.
+"""
+
+from botocore.exceptions import ClientError
+from django.test import TestCase
+
+from pos import aws_clients
+from pos.aws_services import ResourceRegistry
+from pos.customer_cache import customer_cache
+from pos.local_dynamodb import LocalDynamoDB
+from pos.management.commands.bench import StandInClient
+
+
+class S3StandIn(StandInClient):
+    """StandInClient for S3 that keeps the objects put into it, so uploads can be looked up"""
+
+    class exceptions:
+        ClientError = ClientError
+
+    def __init__(self):
+        super().__init__('s3')
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self.objects[Key] = Body
+        return {}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(self.objects[Key])}
+
+    def generate_presigned_post(self, Bucket, Key, Conditions=None, ExpiresIn=None):
+        return {'url': f'https://{Bucket}.s3.amazonaws.com/', 'fields': {'key': Key}}
+
+
+class LocalAWSTestCase(TestCase):
+    """A TestCase whose AWS calls go to fresh local stand-ins"""
+
+    def setUp(self):
+        super().setUp()
+        aws_clients.reset_clients()
+        ResourceRegistry.reset()
+        customer_cache.clear()
+        self.dynamodb = LocalDynamoDB(':memory:')
+        self.s3 = S3StandIn()
+        aws_clients.set_client('dynamodb', self.dynamodb)
+        aws_clients.set_client('s3', self.s3)
+        for service in ('sns', 'cloudwatch'):
+            aws_clients.set_client(service, StandInClient(service))
+        self.addCleanup(aws_clients.reset_clients)
+        self.addCleanup(ResourceRegistry.reset)
@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.conf import settings
+from django.urls import reverse
+
+from pos.aws_services import DynamoDBService
+from pos.models import Product, ProductManager
+from pos.tests.base import LocalAWSTestCase
+
+
+class ReserveStockTests(LocalAWSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mug = Product.objects.create(name='Mug', price='4.50', quantity=3)
+        self.tea = Product.objects.create(name='Tea', price='2.00', quantity=1)
+
+    def test_takes_stock_for_every_line(self):
+        products, oversold = Product.objects.reserve_stock({self.mug.id: 2, self.tea.id: 1})
+        self.assertEqual(oversold, [])
+        self.assertEqual(products[self.mug.id].quantity, 1)
+        self.mug.refresh_from_db()
+        self.tea.refresh_from_db()
+        self.assertEqual((self.mug.quantity, self.tea.quantity), (1, 0))
+
+    def test_oversold_line_takes_nothing(self):
+        products, oversold = Product.objects.reserve_stock({self.mug.id: 2, self.tea.id: 2})
+        self.assertEqual(oversold, [self.tea.id])
+        self.mug.refresh_from_db()
+        self.tea.refresh_from_db()
+        self.assertEqual((self.mug.quantity, self.tea.quantity), (3, 1))
+
+    def test_stock_taken_concurrently_rolls_back_the_whole_basket(self):
+        change_stock = ProductManager._change_stock
+
+        def sold_elsewhere_first(manager, quantities, sign, guard=False):
+            # Another checkout sells the last tea after the rows were read
+            Product.objects.filter(pk=self.tea.id).update(quantity=0)
+            return change_stock(manager, quantities, sign, guard)
+
+        with mock.patch.object(ProductManager, '_change_stock', sold_elsewhere_first):
+            _, oversold = Product.objects.reserve_stock({self.mug.id: 2, self.tea.id: 1})
+        self.assertEqual(sorted(oversold), sorted([self.mug.id, self.tea.id]))
+        self.mug.refresh_from_db()
+        self.assertEqual(self.mug.quantity, 3)
+
+    def test_release_gives_stock_back(self):
+        Product.objects.reserve_stock({self.mug.id: 2})
+        Product.objects.release_stock({self.mug.id: 2})
+        self.mug.refresh_from_db()
+        self.assertEqual(self.mug.quantity, 3)
+
+
+class CheckoutTests(LocalAWSTestCase):
+    def setUp(self):
+        super().setUp()
+        DynamoDBService.create_tables()
+        DynamoDBService.add_customer({'customer_id': 'c1', 'name': 'Ada'})
+        self.mug = Product.objects.create(name='Mug', price='4.50', quantity=3)
+        self.tea = Product.objects.create(name='Tea', price='2.00', quantity=1)
+
+    def test_oversold_basket_is_rolled_back(self):
+        response = self.client.post(reverse('transaction_add'), {
+            'customer_id': 'c1',
+            'product_ids': [self.mug.id, self.tea.id],
+            'quantities': [2, 5],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Not enough stock for: Tea')
+
+        self.mug.refresh_from_db()
+        self.tea.refresh_from_db()
+        self.assertEqual((self.mug.quantity, self.tea.quantity), (3, 1))
+        transactions = self.dynamodb.scan(TableName=settings.DYNAMODB_TRANSACTIONS_TABLE)['Items']
+        self.assertEqual(transactions, [])
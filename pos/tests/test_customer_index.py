@@ -0,0 +1,52 @@
+from pos.aws_services import DynamoDBService
+from pos.customer_index import CustomerIndex
+from pos.tests.base import LocalAWSTestCase
+
+
+def customer(customer_id, name, email='', phone=''):
+    return {'customer_id': customer_id, 'name': name, 'email': email, 'phone': phone}
+
+
+class CustomerIndexTests(LocalAWSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.index = CustomerIndex()
+        self.index.rebuild([
+            customer('c1', 'Ada Lovelace', 'ada@example.com'),
+            customer('c2', 'Alan Turing', phone='555-0100'),
+            customer('c3', 'Grace Hopper'),
+        ])
+
+    def ids(self, query):
+        return [found['customer_id'] for found in self.index.search(query)]
+
+    def test_prefix_and_substring_matches(self):
+        self.assertEqual(self.ids('tur'), ['c2'])
+        self.assertEqual(self.ids('ada@'), ['c1'])
+        self.assertEqual(self.ids('opper'), ['c3'])
+        self.assertEqual(self.ids('a'), ['c1', 'c2'])
+        self.assertEqual(self.ids('zzz'), [])
+
+    def test_rebuild_drops_customers_it_did_not_see(self):
+        self.index.rebuild([customer('c1', 'Ada Lovelace')])
+        self.assertEqual(self.ids('alan'), [])
+        self.assertEqual(len(self.index), 1)
+
+    def test_write_during_a_scan_keeps_the_written_version(self):
+        def scanned():
+            yield customer('c1', 'Ada Lovelace')
+            # Edited in this process while the scan was running, from a stale page
+            self.index.add(customer('c2', 'Alan M. Turing'))
+            yield customer('c2', 'Alan Turing')
+
+        self.index.rebuild(scanned())
+        self.assertEqual(self.index.search('alan')[0]['name'], 'Alan M. Turing')
+
+    def test_catch_up_reads_changes_from_other_processes(self):
+        DynamoDBService.create_tables()
+        self.index.rebuild(DynamoDBService.iter_customers())
+        DynamoDBService.add_customer(customer('c4', 'Katherine Johnson'))
+        self.assertEqual(self.ids('katherine'), [])
+
+        self.index._catch_up()
+        self.assertEqual(self.ids('katherine'), ['c4'])
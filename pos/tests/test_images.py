@@ -0,0 +1,63 @@
+from unittest import mock
+
+from django.conf import settings
+from django.urls import reverse
+
+from pos.images import ImagePipeline
+from pos.models import Product
+from pos.tests.base import LocalAWSTestCase
+
+
+class DirectUploadTests(LocalAWSTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Mug', price='4.50', quantity=3)
+        submit = mock.patch.object(ImagePipeline, 'submit_uploaded')
+        self.submit_uploaded = submit.start()
+        self.addCleanup(submit.stop)
+
+    def presign(self):
+        response = self.client.post(reverse('product_image_presign'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def complete(self, key):
+        return self.client.post(reverse('product_image_complete', args=[self.product.id]), {'key': key})
+
+    def test_presign_then_complete_records_the_upload(self):
+        presigned = self.presign()
+        self.assertTrue(presigned['key'].startswith(settings.S3_UPLOAD_PREFIX))
+        self.assertEqual(presigned['fields']['key'], presigned['key'])
+
+        # The browser's POST to S3
+        self.s3.put_object(Bucket=settings.S3_BUCKET_NAME, Key=presigned['key'], Body=b'image bytes')
+
+        response = self.complete(presigned['key'])
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.s3_image_url.endswith(presigned['key']))
+        self.assertEqual(response.json()['s3_image_url'], self.product.s3_image_url)
+        self.submit_uploaded.assert_called_once_with(self.product.id, presigned['key'])
+
+    def test_presign_requires_post(self):
+        self.assertEqual(self.client.get(reverse('product_image_presign')).status_code, 405)
+
+    def test_complete_rejects_a_key_outside_the_upload_prefix(self):
+        self.s3.put_object(Bucket=settings.S3_BUCKET_NAME, Key='images/other.jpg', Body=b'x')
+        self.assertEqual(self.complete('images/other.jpg').status_code, 400)
+        self.assertEqual(self.complete(f'{settings.S3_UPLOAD_PREFIX}a/b').status_code, 400)
+        self.submit_uploaded.assert_not_called()
+
+    def test_complete_rejects_an_upload_that_never_arrived(self):
+        key = self.presign()['key']
+        self.assertEqual(self.complete(key).status_code, 400)
+        self.product.refresh_from_db()
+        self.assertIsNone(self.product.s3_image_url)
+        self.submit_uploaded.assert_not_called()
+
+    def test_complete_rejects_an_oversized_upload(self):
+        key = self.presign()['key']
+        self.s3.put_object(Bucket=settings.S3_BUCKET_NAME, Key=key, Body=b'x' * 11)
+        with self.settings(PRODUCT_IMAGE_MAX_UPLOAD_BYTES=10):
+            self.assertEqual(self.complete(key).status_code, 400)
+        self.submit_uploaded.assert_not_called()
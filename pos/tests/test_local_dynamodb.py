@@ -0,0 +1,88 @@
+from botocore.exceptions import ClientError
+from django.test import SimpleTestCase
+
+from pos.local_dynamodb import LocalDynamoDB
+
+
+class LocalDynamoDBTests(SimpleTestCase):
+    def setUp(self):
+        self.db = LocalDynamoDB(':memory:')
+        self.db.create_table(
+            TableName='sales',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[
+                {'AttributeName': 'id', 'AttributeType': 'S'},
+                {'AttributeName': 'shop', 'AttributeType': 'S'},
+                {'AttributeName': 'at', 'AttributeType': 'S'},
+            ],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'shop-at-index',
+                'KeySchema': [{'AttributeName': 'shop', 'KeyType': 'HASH'},
+                              {'AttributeName': 'at', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'},
+            }],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        for n in range(5):
+            self.db.put_item(TableName='sales', Item={
+                'id': {'S': f's{n}'}, 'shop': {'S': 'north'}, 'at': {'S': f'2024-01-0{n + 1}'},
+                'total': {'N': str(n)}
+            })
+
+    def query(self, **kwargs):
+        return self.db.query(
+            TableName='sales', IndexName='shop-at-index',
+            KeyConditionExpression='shop = :shop',
+            ExpressionAttributeValues={':shop': {'S': 'north'}},
+            **kwargs
+        )
+
+    def test_get_put_delete(self):
+        item = self.db.get_item(TableName='sales', Key={'id': {'S': 's2'}})['Item']
+        self.assertEqual(item['total'], {'N': '2'})
+        self.db.delete_item(TableName='sales', Key={'id': {'S': 's2'}})
+        self.assertNotIn('Item', self.db.get_item(TableName='sales', Key={'id': {'S': 's2'}}))
+
+    def test_update_item_sets_attributes(self):
+        self.db.update_item(
+            TableName='sales', Key={'id': {'S': 's1'}},
+            UpdateExpression='SET #t = :t',
+            ExpressionAttributeNames={'#t': 'total'},
+            ExpressionAttributeValues={':t': {'N': '9'}}
+        )
+        item = self.db.get_item(TableName='sales', Key={'id': {'S': 's1'}})['Item']
+        self.assertEqual(item['total'], {'N': '9'})
+
+    def test_index_query_is_ordered_and_paged(self):
+        newest_first = self.query(ScanIndexForward=False, Limit=2)
+        self.assertEqual([item['id']['S'] for item in newest_first['Items']], ['s4', 's3'])
+
+        rest = self.query(ScanIndexForward=False, ExclusiveStartKey=newest_first['LastEvaluatedKey'])
+        self.assertEqual([item['id']['S'] for item in rest['Items']], ['s2', 's1', 's0'])
+        self.assertNotIn('LastEvaluatedKey', rest)
+
+    def test_filters_are_rejected(self):
+        with self.assertRaises(ClientError) as raised:
+            self.query(FilterExpression='total > :t')
+        self.assertEqual(raised.exception.response['Error']['Code'], 'ValidationException')
+
+    def test_conditional_writes_are_rejected(self):
+        writes = {
+            'put_item': lambda **condition: self.db.put_item(TableName='sales', Item={'id': {'S': 's1'}}, **condition),
+            'delete_item': lambda **condition: self.db.delete_item(TableName='sales', Key={'id': {'S': 's1'}}, **condition),
+            'update_item': lambda **condition: self.db.update_item(
+                TableName='sales', Key={'id': {'S': 's1'}}, UpdateExpression='REMOVE total', **condition),
+        }
+        conditions = [{'ConditionExpression': 'attribute_not_exists(id)'}, {'Expected': {'id': {'Exists': False}}}]
+        for operation, write in writes.items():
+            for condition in conditions:
+                with self.subTest(operation, condition=condition), self.assertRaises(ClientError) as raised:
+                    write(**condition)
+                self.assertEqual(raised.exception.response['Error']['Code'], 'ValidationException')
+        # None of them wrote anything
+        item = self.db.get_item(TableName='sales', Key={'id': {'S': 's1'}})['Item']
+        self.assertEqual(item['total'], {'N': '1'})
+
+    def test_missing_table(self):
+        with self.assertRaises(self.db.exceptions.ResourceNotFoundException):
+            self.db.get_item(TableName='nope', Key={'id': {'S': 'x'}})
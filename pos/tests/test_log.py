@@ -0,0 +1,19 @@
+import logging
+import queue
+
+from django.test import SimpleTestCase
+
+from error_handler.log import DeferredQueueHandler, JSONFormatter
+
+
+class DeferredQueueHandlerTests(SimpleTestCase):
+    def test_message_is_rendered_before_queuing(self):
+        records = queue.SimpleQueue()
+        handler = DeferredQueueHandler(records)
+        basket = ['mug']
+        handler.handle(logging.LogRecord('pos', logging.INFO, __file__, 1, 'basket %s', (basket,), None))
+        basket.append('tea')
+
+        record = records.get_nowait()
+        self.assertIsNone(record.args)
+        self.assertIn('"msg": "basket [\'mug\']"', JSONFormatter().format(record))
@@ -0,0 +1,84 @@
+import json
+import tempfile
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from pos.outbox import HANDLERS, Outbox
+
+
+class OutboxTests(SimpleTestCase):
+    def setUp(self):
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        self.outbox = Outbox(spill_dir.name, workers=1, max_retries=2, retry_delay=0)
+        self.outbox.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.calls = []
+        patcher = mock.patch.dict(HANDLERS, {'record': self.calls.append})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def journal(self, *records):
+        with open(self.outbox._journal_path, 'a') as journal:
+            for record in records:
+                journal.write(json.dumps(record) + '\n')
+
+    def queued(self):
+        jobs = []
+        while not self.outbox._queue.empty():
+            jobs.append(self.outbox._queue.get_nowait())
+        return jobs
+
+    def test_recovery_keeps_the_runs_already_started(self):
+        self.journal(
+            {'id': 'a', 'job': 'record', 'payload': 1},
+            {'id': 'b', 'job': 'record', 'payload': 2},
+            {'id': 'a', 'attempts': 1},
+            {'id': 'a', 'attempts': 2},
+            {'id': 'b', 'done': True},
+        )
+        self.outbox._recover()
+        self.assertEqual([(job['id'], job['attempts']) for job in self.queued()], [('a', 2)])
+
+    def test_torn_last_line_is_ignored(self):
+        self.journal({'id': 'a', 'job': 'record', 'payload': 1})
+        with open(self.outbox._journal_path, 'a') as journal:
+            journal.write('{"id": "a", "do')
+        self.assertEqual([job['id'] for job in self.outbox._read_pending(self.outbox._journal_path)], ['a'])
+
+    def test_job_out_of_runs_is_given_up(self):
+        self.journal({'id': 'a', 'job': 'record', 'payload': 1}, {'id': 'a', 'attempts': 3})
+        self.outbox._recover()
+        self.outbox._run(self.queued()[0])
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.outbox._read_pending(self.outbox._journal_path), [])
+
+    def test_successful_run_is_marked_done(self):
+        self.journal({'id': 'a', 'job': 'record', 'payload': 7})
+        self.outbox._recover()
+        self.outbox._run(self.queued()[0])
+        self.assertEqual(self.calls, [7])
+        self.assertEqual(self.outbox.pending(), 0)
+        self.assertEqual(self.outbox._read_pending(self.outbox._journal_path), [])
+
+    def test_failed_run_waits_out_its_backoff_off_the_worker(self):
+        def failing(payload):
+            raise RuntimeError('SNS is down')
+
+        self.outbox.retry_delay = 20
+        self.journal({'id': 'a', 'job': 'fail', 'payload': 1})
+        with mock.patch.dict(HANDLERS, {'fail': failing}):
+            self.outbox._recover()
+            started = time.monotonic()
+            self.outbox._run(self.queued()[0])
+        self.assertLess(time.monotonic() - started, 5)
+
+        # Not queued again until the backoff has passed, but still counted as pending
+        self.assertGreater(self.outbox._release_due(), 15)
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(self.outbox.pending(), 1)
+
+        with mock.patch('pos.outbox.time.monotonic', return_value=started + 31):
+            self.assertIsNone(self.outbox._release_due())
+        self.assertEqual([(job['id'], job['attempts']) for job in self.queued()], [('a', 1)])
@@ -0,0 +1,66 @@
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from pos.pagination import decode_cursor, encode_cursor, paginate
+
+
+def pages(count):
+    """fetch_page over count one-item pages, recording the start keys asked for"""
+    requested = []
+
+    def fetch_page(limit, start_key):
+        requested.append(start_key)
+        position = start_key['n'] if start_key else 0
+        last_key = {'n': position + 1} if position + 1 < count else None
+        return [position], last_key
+    return fetch_page, requested
+
+
+class CursorTests(SimpleTestCase):
+    def get(self, fetch_page, cursor=None):
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        return paginate(request, fetch_page, 1)
+
+    def test_round_trip(self):
+        cursor = encode_cursor({'n': 3}, [None, {'n': 1}, {'n': 2}])
+        self.assertEqual(decode_cursor(cursor), ({'n': 3}, [None, {'n': 1}, {'n': 2}], False))
+
+    def test_tampered_cursor_means_the_first_page(self):
+        cursor = encode_cursor({'n': 3}, [None])
+        tampered = cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B')
+        fetch_page, requested = pages(5)
+        page = self.get(fetch_page, tampered)
+        self.assertEqual(requested, [None])
+        self.assertEqual(page.items, [0])
+        self.assertFalse(page.has_prev)
+
+    def test_next_and_previous(self):
+        fetch_page, requested = pages(3)
+        first = self.get(fetch_page)
+        second = self.get(fetch_page, first.next_cursor)
+        self.assertEqual(second.items, [1])
+        self.assertTrue(second.has_prev)
+        # The first page's link carries no cursor
+        self.assertIsNone(second.prev_cursor)
+        third = self.get(fetch_page, second.next_cursor)
+        self.assertFalse(third.has_next)
+        self.assertEqual(self.get(fetch_page, third.prev_cursor).items, [1])
+
+    @override_settings(POS_PAGE_TRAIL=3)
+    def test_trail_is_clipped(self):
+        fetch_page, _ = pages(20)
+        page = self.get(fetch_page)
+        for _ in range(10):
+            page = self.get(fetch_page, page.next_cursor)
+        self.assertEqual(page.items, [10])
+        _, trail, clipped = decode_cursor(page.next_cursor)
+        self.assertEqual(len(trail), 3)
+        self.assertTrue(clipped)
+
+        # Walking back reaches the end of the trail, then only First page is offered
+        steps = 0
+        while page.prev_cursor:
+            page = self.get(fetch_page, page.prev_cursor)
+            steps += 1
+        self.assertEqual(steps, 3)
+        self.assertFalse(page.has_prev)
+        self.assertTrue(page.has_first)
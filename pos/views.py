@@ -3,10 +3,20 @@ Views for MyPOS - CRUD operations for Products, Customers, and Transactions
 """
 
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.contrib import messages
+from django.conf import settings
 from .models import Product
-from .aws_services import DynamoDBService, S3Service, SNSService, CloudWatchService
+from .catalog import catalog
+from .customer_cache import customer_cache
+from .customer_index import customer_index
+from .fanout import FanOut
+from .images import ImagePipeline, attach_uploaded_image, read_upload
+from . import aws_clients
+from .aws_services import DynamoDBService, S3Service, CloudWatchService
+from .outbox import get_outbox
+from .pagination import CursorPage, paginate
+from .streaming import render_streaming
 from error_handler.error_handler import ErrorHandler, POSError
 import uuid
 import json
@@ -17,6 +27,20 @@ def home(request):
     return render(request, 'home.html')
 
 
+def aws_pool_stats(request):
+    """Connection pool usage of this process's AWS clients (staff or DEBUG only)"""
+    if not (settings.DEBUG or request.user.is_staff):
+        raise Http404
+    return JsonResponse(aws_clients.pool_stats())
+
+
+def customer_cache_stats(request):
+    """Hit and miss counters of this process's customer cache (staff or DEBUG only)"""
+    if not (settings.DEBUG or request.user.is_staff):
+        raise Http404
+    return JsonResponse(customer_cache.stats())
+
+
 def product_list(request):
     """List all products"""
     products = Product.objects.all().order_by('-created_at')
@@ -35,6 +59,7 @@ def product_add(request):
             # Validation
             if not name or not price:
                 raise ErrorHandler.handle_validation_error("Name and price are required", "product")
+            image_data = read_upload(request.FILES['image']) if 'image' in request.FILES else None
             
             # Create product
             product = Product.objects.create(
@@ -44,17 +69,15 @@ def product_add(request):
                 quantity=int(quantity) if quantity else 0
             )
             
-            # Handle image upload to S3
-            if 'image' in request.FILES:
+            # Resize and upload the image to S3 in the background
+            if image_data:
+                ImagePipeline.submit(product.id, image_data)
+                messages.info(request, 'The product image is being processed and will appear shortly.')
+            elif request.POST.get('image_key'):
                 try:
-                    S3Service.create_bucket()
-                    file = request.FILES['image']
-                    filename = f"products/{product.id}/{file.name}"
-                    s3_url = S3Service.upload_image(file, filename)
-                    product.s3_image_url = s3_url
-                    product.save()
+                    attach_uploaded_image(product, request.POST['image_key'])
+                    messages.info(request, 'The product image is being processed and will appear shortly.')
                 except Exception as e:
-                    ErrorHandler.handle_aws_error(e, "upload_product_image", filename)
                     messages.warning(request, f"Product created but image upload failed: {str(e)}")
             
             messages.success(request, 'Product added successfully!')
@@ -79,19 +102,22 @@ def product_edit(request, product_id):
             product.price = request.POST.get('price')
             product.quantity = int(request.POST.get('quantity', 0))
             
-            # Handle image upload to S3
-            if 'image' in request.FILES:
+            image_data = read_upload(request.FILES['image']) if 'image' in request.FILES else None
+            
+            # The image fields are written by the image pipeline, which may finish while this form is open
+            product.save(update_fields=['name', 'description', 'price', 'quantity', 'updated_at'])
+            
+            # Resize and upload the new image to S3 in the background
+            if image_data:
+                ImagePipeline.submit(product.id, image_data)
+                messages.info(request, 'The new product image is being processed and will appear shortly.')
+            elif request.POST.get('image_key'):
                 try:
-                    S3Service.create_bucket()
-                    file = request.FILES['image']
-                    filename = f"products/{product.id}/{file.name}"
-                    s3_url = S3Service.upload_image(file, filename)
-                    product.s3_image_url = s3_url
+                    attach_uploaded_image(product, request.POST['image_key'])
+                    messages.info(request, 'The new product image is being processed and will appear shortly.')
                 except Exception as e:
-                    ErrorHandler.handle_aws_error(e, "upload_product_image", filename)
                     messages.warning(request, f"Product updated but image upload failed: {str(e)}")
             
-            product.save()
             messages.success(request, 'Product updated successfully!')
             return redirect('product_list')
             
@@ -101,6 +127,35 @@ def product_edit(request, product_id):
     return render(request, 'products/edit.html', {'product': product})
 
 
+def product_image_presign(request):
+    """Presigned POST for uploading a product image straight from the browser to S3"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    
+    try:
+        S3Service.ensure_bucket()
+        key = f"{settings.S3_UPLOAD_PREFIX}{uuid.uuid4().hex}"
+        presigned = S3Service.generate_presigned_post(key, settings.PRODUCT_IMAGE_MAX_UPLOAD_BYTES)
+        return JsonResponse({'url': presigned['url'], 'fields': presigned['fields'], 'key': key})
+    except POSError as e:
+        return JsonResponse({'error': str(e)}, status=502)
+
+
+def product_image_complete(request, product_id):
+    """Callback after a direct upload: record the image on the product and queue its variants"""
+    product = get_object_or_404(Product, id=product_id)
+    
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    
+    try:
+        attach_uploaded_image(product, request.POST.get('key'))
+        return JsonResponse({'s3_image_url': product.s3_image_url})
+    except POSError as e:
+        status = 400 if e.error_type == 'VALIDATION_ERROR' else 502
+        return JsonResponse({'error': str(e)}, status=status)
+
+
 def product_delete(request, product_id):
     """Delete product"""
     product = get_object_or_404(Product, id=product_id)
@@ -114,25 +169,26 @@ def product_delete(request, product_id):
 
 
 def customer_list(request):
-    """List all customers from DynamoDB"""
+    """List one page of customers from DynamoDB"""
     try:
-        DynamoDBService.create_tables()
-        customers = DynamoDBService.list_customers()
+        DynamoDBService.ensure_tables()
+        customers = paginate(request, DynamoDBService.list_customers_page, settings.POS_PAGE_SIZE)
     except POSError as e:
         messages.error(request, str(e))
-        customers = []
+        customers = CursorPage([])
     except Exception as e:
         messages.error(request, f"Error loading customers: {str(e)}")
-        customers = []
+        customers = CursorPage([])
     
-    return render(request, 'customers/list.html', {'customers': customers})
+    return render_streaming(request, 'customers/list.html', {'customers': customers, 'page': customers},
+                            customers, 'customers/_row.html', 'customer')
 
 
 def customer_add(request):
     """Add new customer to DynamoDB"""
     if request.method == 'POST':
         try:
-            DynamoDBService.create_tables()
+            DynamoDBService.ensure_tables()
             
             customer_data = {
                 'customer_id': str(uuid.uuid4()),
@@ -158,11 +214,58 @@ def customer_add(request):
     return render(request, 'customers/add.html')
 
 
+def customer_view(request, customer_id):
+    """View a customer and their transaction history"""
+    try:
+        DynamoDBService.ensure_tables()
+        
+        def fetch_page(limit, start_key):
+            return DynamoDBService.list_transactions_for_customer(customer_id, limit, start_key)
+        
+        # The history page is read while the customer is
+        with FanOut() as fan_out:
+            transactions = fan_out.submit(paginate, request, fetch_page, settings.POS_PAGE_SIZE)
+            customer = DynamoDBService.get_customer(customer_id)
+        
+        if not customer:
+            messages.error(request, 'Customer not found!')
+            return redirect('customer_list')
+        
+        transactions = transactions.result()
+        
+        return render(request, 'customers/view.html', {
+            'customer': customer,
+            'transactions': transactions,
+            'page': transactions
+        })
+        
+    except POSError as e:
+        messages.error(request, str(e))
+        return redirect('customer_list')
+    except Exception as e:
+        messages.error(request, f"Error loading customer: {str(e)}")
+        return redirect('customer_list')
+
+
+def customer_search(request):
+    """Customers matching ?q= by name, email or phone, as JSON for the checkout typeahead"""
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', settings.CUSTOMER_SEARCH_LIMIT))
+    except ValueError:
+        limit = settings.CUSTOMER_SEARCH_LIMIT
+    limit = max(1, min(limit, settings.CUSTOMER_SEARCH_MAX_LIMIT))
+    
+    customers = customer_index.search(query, limit) if len(query) >= settings.CUSTOMER_SEARCH_MIN_CHARS else []
+    # complete is False until the first scan of the customers table has finished
+    return JsonResponse({'customers': customers, 'complete': customer_index.complete})
+
+
 def customer_edit(request, customer_id):
     """Edit customer in DynamoDB"""
     try:
-        DynamoDBService.create_tables()
-        customer = DynamoDBService.get_customer(customer_id)
+        DynamoDBService.ensure_tables()
+        customer = DynamoDBService.get_customer(customer_id, cached=False)
         
         if not customer:
             messages.error(request, 'Customer not found!')
@@ -202,7 +305,7 @@ def customer_edit(request, customer_id):
 def customer_delete(request, customer_id):
     """Delete customer from DynamoDB"""
     try:
-        DynamoDBService.create_tables()
+        DynamoDBService.ensure_tables()
         customer = DynamoDBService.get_customer(customer_id)
         
         if not customer:
@@ -229,99 +332,159 @@ def customer_delete(request, customer_id):
         return redirect('customer_list')
 
 
+def label_customers(transactions, customers):
+    """Set customer_name on transactions that don't store one, from {customer_id: customer}"""
+    for transaction in transactions:
+        customer_id = transaction.get('customer_id', '')
+        
+        if transaction.get('customer_name'):
+            continue
+        elif customer_id:
+            customer = customers.get(customer_id)
+            if customer and customer.get('name'):
+                transaction['customer_name'] = customer['name']
+            else:
+                # Customer not found in database
+                transaction['customer_name'] = f"ID: {customer_id[:8]}..." if len(customer_id) > 8 else customer_id
+        else:
+            # No customer_id available
+            transaction['customer_name'] = "N/A"
+
+
 def transaction_list(request):
-    """List all transactions from DynamoDB"""
+    """List one page of transactions from DynamoDB"""
     try:
-        DynamoDBService.create_tables()
-        transactions = DynamoDBService.list_transactions()
+        DynamoDBService.ensure_tables()
+        transactions = paginate(request, DynamoDBService.list_recent_transactions, settings.POS_PAGE_SIZE)
         
-        # Get customer names for each transaction
-        for transaction in transactions:
-            customer_id = transaction.get('customer_id', '')
-            customer_name = transaction.get('customer_name')  # Check if already stored in DynamoDB
-            
-            # If customer_name not stored in transaction, look it up from customers table
-            if not customer_name and customer_id:
-                try:
-                    customer = DynamoDBService.get_customer(customer_id)
-                    if customer and customer.get('name'):
-                        customer_name = customer['name']
-                        transaction['customer_name'] = customer_name
-                    else:
-                        # Customer not found in database
-                        transaction['customer_name'] = f"ID: {customer_id[:8]}..." if len(customer_id) > 8 else customer_id
-                except Exception as e:
-                    # If lookup fails, use customer ID
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Could not retrieve customer {customer_id}: {str(e)}")
-                    transaction['customer_name'] = f"ID: {customer_id[:8]}..." if len(customer_id) > 8 else customer_id
-            elif not customer_name:
-                # No customer_id available
-                transaction['customer_name'] = "N/A"
+        # Look up names for transactions that don't store one, in a few batched reads
+        missing_ids = [t['customer_id'] for t in transactions if not t.get('customer_name') and t.get('customer_id')]
+        customers = {}
+        if missing_ids:
+            try:
+                customers = DynamoDBService.batch_get_customers(missing_ids)
+            except Exception as e:
+                # If lookup fails, use customer IDs
+                import logging
+                logger = logging.getLogger(__name__)
+                logger.warning(f"Could not retrieve customers for transaction list: {str(e)}")
+        
+        label_customers(transactions, customers)
                 
     except POSError as e:
         messages.error(request, str(e))
-        transactions = []
+        transactions = CursorPage([])
     except Exception as e:
         messages.error(request, f"Error loading transactions: {str(e)}")
-        transactions = []
+        transactions = CursorPage([])
+    
+    return render_streaming(request, 'transactions/list.html', {'transactions': transactions, 'page': transactions},
+                            transactions, 'transactions/_row.html', 'transaction')
+
+
+def parse_basket(post):
+    """(customer_id, {product_id: quantity}) from the checkout form, adding up repeated products"""
+    customer_id = post.get('customer_id')
+    product_ids = post.getlist('product_ids')
+    quantities = post.getlist('quantities')
+    
+    if not customer_id or not product_ids:
+        raise ErrorHandler.handle_validation_error("Customer and at least one product are required", "transaction")
+    
+    basket = {}
+    for i, product_id in enumerate(product_ids):
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            continue
+        quantity = int(quantities[i]) if i < len(quantities) and quantities[i] else 1
+        if quantity < 1:
+            raise ErrorHandler.handle_validation_error("Quantities must be at least 1", "transaction")
+        basket[product_id] = basket.get(product_id, 0) + quantity
+    return customer_id, basket
+
+
+def reserve_basket(basket):
+    """Reserve stock for the basket. Returns ({product_id: quantity} reserved, {product_id: product})"""
+    # One locked fetch and one guarded UPDATE, however large the basket
+    products_by_id, oversold = Product.objects.reserve_stock(basket)
+    if oversold:
+        names = ', '.join(products_by_id[pk].name for pk in oversold)
+        raise ErrorHandler.handle_validation_error(f"Not enough stock for: {names}", "transaction")
+    reserved = {pk: quantity for pk, quantity in basket.items() if pk in products_by_id}
+    if not reserved:
+        raise ErrorHandler.handle_validation_error("No valid products selected", "transaction")
+    return reserved, products_by_id
+
+
+def line_items(reserved, products_by_id):
+    """(transaction products, total amount) for a reserved basket"""
+    transaction_products = []
+    total_amount = 0.0
+    
+    for product_id, quantity in reserved.items():
+        product = products_by_id[product_id]
+        subtotal = float(product.price) * quantity
+        total_amount += subtotal
+        
+        transaction_products.append({
+            'product_id': str(product.id),
+            'product_name': product.name,
+            'quantity': quantity,
+            'price': float(product.price),
+            'subtotal': subtotal
+        })
+    return transaction_products, total_amount
+
+
+def after_checkout(request, transaction_data):
+    """Queue the notification and record metrics for a saved transaction"""
+    # Notification runs after the response, off the request thread
+    try:
+        get_outbox().enqueue('transaction_notification', {
+            'transaction_id': transaction_data['transaction_id'],
+            'customer_name': transaction_data.get('customer_name'),
+            'total_amount': transaction_data['total_amount'],
+            'item_count': len(transaction_data['products'])
+        })
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.error(f"Outbox Error: {str(e)}")
+        messages.warning(request, "Transaction created but notification could not be queued")
     
-    return render(request, 'transactions/list.html', {'transactions': transactions})
+    # Metrics are buffered in memory and sent in batches
+    try:
+        CloudWatchService.put_transaction_metric(transaction_data['total_amount'])
+    except Exception as e:
+        ErrorHandler.handle_aws_error(e, "put_transaction_metric", "CloudWatch")
+
+
+def _customer_or_none(customer_id):
+    try:
+        return DynamoDBService.get_customer(customer_id)
+    except Exception as e:
+        import logging
+        logger = logging.getLogger(__name__)
+        logger.warning(f"Could not retrieve customer {customer_id}: {str(e)}")
+        return None
 
 
 def transaction_add(request):
     """Add new transaction to DynamoDB"""
     try:
-        DynamoDBService.create_tables()
-        S3Service.create_bucket()
-        
-        # Get products and customers for the form
-        products = Product.objects.all()
-        customers = DynamoDBService.list_customers()
+        DynamoDBService.ensure_tables()
         
         if request.method == 'POST':
             try:
-                customer_id = request.POST.get('customer_id')
-                product_ids = request.POST.getlist('product_ids')
-                quantities = request.POST.getlist('quantities')
-                
-                if not customer_id or not product_ids:
-                    raise ErrorHandler.handle_validation_error("Customer and at least one product are required", "transaction")
+                customer_id, basket = parse_basket(request.POST)
                 
-                # Build products list
-                transaction_products = []
-                total_amount = 0.0
-                
-                for i, product_id in enumerate(product_ids):
-                    try:
-                        product = Product.objects.get(id=product_id)
-                        quantity = int(quantities[i]) if i < len(quantities) and quantities[i] else 1
-                        subtotal = float(product.price) * quantity
-                        total_amount += subtotal
-                        
-                        transaction_products.append({
-                            'product_id': str(product.id),
-                            'product_name': product.name,
-                            'quantity': quantity,
-                            'price': float(product.price),
-                            'subtotal': subtotal
-                        })
-                    except Product.DoesNotExist:
-                        continue
-                
-                if not transaction_products:
-                    raise ErrorHandler.handle_validation_error("No valid products selected", "transaction")
-                
-                # Get customer name before creating transaction
-                customer_name = None
-                try:
-                    customer = DynamoDBService.get_customer(customer_id)
-                    customer_name = customer['name'] if customer else None
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Could not retrieve customer {customer_id} for transaction: {str(e)}")
+                # Stock is reserved in the database while the customer name is read from DynamoDB
+                with FanOut() as fan_out:
+                    customer = fan_out.submit(_customer_or_none, customer_id)
+                    reserved, products_by_id = reserve_basket(basket)
+                customer = customer.result()
+                transaction_products, total_amount = line_items(reserved, products_by_id)
                 
                 # Create transaction
                 transaction_id = str(uuid.uuid4())
@@ -334,52 +497,17 @@ def transaction_add(request):
                 }
                 
                 # Add customer_name if available (will be stored in DynamoDB)
-                if customer_name:
-                    transaction_data['customer_name'] = customer_name
-                
-                DynamoDBService.add_transaction(transaction_data)
+                if customer:
+                    transaction_data['customer_name'] = customer['name']
                 
-                # Send SNS notification
                 try:
-                    customer = DynamoDBService.get_customer(customer_id)
-                    customer_name = customer['name'] if customer else 'Customer'
-                    notification_message = f"""
-Transaction Completed!
-
-Transaction ID: {transaction_id}
-Customer: {customer_name}
-Total Amount: ${total_amount:.2f}
-Products: {len(transaction_products)} items
-
-Thank you for your purchase!
-                    """
-                    SNSService.send_notification(notification_message.strip(), "New Transaction - MyPOS")
-                except POSError as e:
-                    # Log the detailed error but don't fail the transaction
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"SNS Notification Error: {str(e)}")
-                    messages.warning(request, f"Transaction created but notification failed: {str(e)}")
-                except Exception as e:
-                    # Log the detailed error
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"SNS Notification Error: {str(e)}")
-                    error_msg = str(e)
-                    # Show a more user-friendly message
-                    if "AccessDenied" in error_msg or "Forbidden" in error_msg:
-                        messages.warning(request, "Transaction created but notification failed: Check AWS SNS permissions")
-                    elif "NotFound" in error_msg or "does not exist" in error_msg:
-                        messages.warning(request, "Transaction created but notification failed: SNS topic not found. Run 'python3 manage.py init_aws'")
-                    else:
-                        messages.warning(request, f"Transaction created but notification failed: {error_msg[:100]}")
+                    DynamoDBService.add_transaction(transaction_data)
+                except Exception:
+                    # The sale wasn't recorded, so put the stock back
+                    Product.objects.release_stock(reserved)
+                    raise
                 
-                # Send CloudWatch metrics
-                try:
-                    CloudWatchService.put_transaction_metric(total_amount, transaction_id)
-                except Exception as e:
-                    ErrorHandler.handle_aws_error(e, "put_transaction_metric", "CloudWatch")
-                    messages.warning(request, "Transaction created but metrics failed")
+                after_checkout(request, transaction_data)
                 
                 messages.success(request, f'Transaction created successfully! Transaction ID: {transaction_id}')
                 return redirect('transaction_list')
@@ -389,35 +517,33 @@ Thank you for your purchase!
             except Exception as e:
                 messages.error(request, f"Error creating transaction: {str(e)}")
         
-        return render(request, 'transactions/add.html', {
-            'products': products,
-            'customers': customers
-        })
+        # Customers are picked through customer_search, so the form only needs the products
+        return render(request, 'transactions/add.html', {'products': catalog.all()})
         
     except POSError as e:
         messages.error(request, str(e))
-        return render(request, 'transactions/add.html', {'products': [], 'customers': []})
+        return render(request, 'transactions/add.html', {'products': []})
     except Exception as e:
         messages.error(request, f"Error: {str(e)}")
-        return render(request, 'transactions/add.html', {'products': [], 'customers': []})
+        return render(request, 'transactions/add.html', {'products': []})
 
 
 def transaction_view(request, transaction_id):
     """View transaction details"""
     try:
-        DynamoDBService.create_tables()
-        transaction = DynamoDBService.get_transaction(transaction_id)
+        DynamoDBService.ensure_tables()
+        # The customer id is only known from the transaction, and its record is read
+        # once below, so get_transaction skips its own name lookup
+        transaction = DynamoDBService.get_transaction(transaction_id, resolve_customer_name=False)
         
         if not transaction:
             messages.error(request, 'Transaction not found!')
             return redirect('transaction_list')
         
-        # Get customer details
-        try:
-            customer = DynamoDBService.get_customer(transaction['customer_id'])
-            transaction['customer'] = customer
-        except:
-            transaction['customer'] = None
+        customer = _customer_or_none(transaction['customer_id'])
+        transaction['customer'] = customer
+        if 'customer_name' not in transaction:
+            transaction['customer_name'] = customer['name'] if customer else None
         
         return render(request, 'transactions/view.html', {'transaction': transaction})
         
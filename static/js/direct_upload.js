@@ -0,0 +1,75 @@
+/*
+ * Direct-to-S3 product image uploads.
+ * File inputs with data-presign-url upload straight to the bucket with a presigned POST.
+ * With data-complete-url the product is updated at once, otherwise the key is put in
+ * the form's hidden image_key field. If anything fails the file is sent with the form.
+ */
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('input[type="file"][data-presign-url]').forEach(function(input) {
+        const form = input.form;
+        const keyInput = form.querySelector('input[name="image_key"]');
+        const status = document.getElementById(input.id + '-status');
+        const submitButton = form.querySelector('button[type="submit"]');
+        const csrfToken = form.querySelector('input[name="csrfmiddlewaretoken"]').value;
+        
+        function postForm(url, data) {
+            return fetch(url, {
+                method: 'POST',
+                headers: {'X-CSRFToken': csrfToken},
+                body: data
+            }).then(function(response) {
+                if (!response.ok) {
+                    throw new Error('Request failed: ' + response.status);
+                }
+                return response.json();
+            });
+        }
+        
+        input.addEventListener('change', function() {
+            const file = input.files[0];
+            if (!file) {
+                return;
+            }
+            submitButton.disabled = true;
+            status.textContent = 'Uploading image...';
+            
+            postForm(input.dataset.presignUrl, new FormData())
+                .then(function(presigned) {
+                    const data = new FormData();
+                    Object.entries(presigned.fields).forEach(function([name, value]) {
+                        data.append(name, value);
+                    });
+                    data.append('Content-Type', file.type);
+                    data.append('file', file);  // S3 requires the file to be the last field
+                    return fetch(presigned.url, {method: 'POST', body: data}).then(function(response) {
+                        if (!response.ok) {
+                            throw new Error('Upload failed: ' + response.status);
+                        }
+                        return presigned.key;
+                    });
+                })
+                .then(function(key) {
+                    if (input.dataset.completeUrl) {
+                        const data = new FormData();
+                        data.append('key', key);
+                        return postForm(input.dataset.completeUrl, data).then(function() {
+                            return 'Image uploaded. It is being processed and will appear shortly.';
+                        });
+                    }
+                    keyInput.value = key;
+                    return 'Image uploaded.';
+                })
+                .then(function(message) {
+                    input.value = '';  // Already in S3, don't send it again with the form
+                    status.textContent = message;
+                })
+                .catch(function() {
+                    keyInput.value = '';
+                    status.textContent = 'Direct upload failed, the image will be sent with the form instead.';
+                })
+                .finally(function() {
+                    submitButton.disabled = false;
+                });
+        });
+    });
+});